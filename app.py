@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import jwt
@@ -7,9 +7,10 @@ from functools import wraps
 from dotenv import load_dotenv
 
 # 导入各个模块
-from services.elasticsearch_service import ElasticsearchService
+from services.elasticsearch_service import ElasticsearchService, SearchPaginationError
 from services.auth_service import AuthService
 from services.data_service import DataService
+from services.export_service import ExportService, EXPORT_FORMATS
 
 # 加载环境变量
 load_dotenv()
@@ -23,7 +24,8 @@ CORS(app)
 # 初始化服务
 es_service = ElasticsearchService()
 auth_service = AuthService()
-data_service = DataService()
+data_service = DataService(es_service)
+export_service = ExportService(es_service)
 
 # JWT认证装饰器
 def token_required(f):
@@ -36,8 +38,7 @@ def token_required(f):
         try:
             if token.startswith('Bearer '):
                 token = token[7:]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = auth_service.get_user_by_id(data['user_id'])
+            current_user = auth_service.verify_token(token, app.config['SECRET_KEY'])
             if not current_user:
                 return jsonify({'message': '用户不存在'}), 401
         except jwt.ExpiredSignatureError:
@@ -73,12 +74,10 @@ def login():
             return jsonify({'message': '用户名或密码错误'}), 401
         
         # 生成JWT令牌
-        token = jwt.encode({
-            'user_id': user['id'],
-            'username': user['username'],
-            'role': user['role'],
-            'exp': datetime.utcnow() + timedelta(hours=24)
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        token = jwt.encode(dict(
+            auth_service.token_claims(user),
+            exp=datetime.utcnow() + timedelta(hours=24)
+        ), app.config['SECRET_KEY'], algorithm='HS256')
         
         return jsonify({
             'token': token,
@@ -119,6 +118,8 @@ def search_videos(current_user):
         
         results = es_service.search_videos(data, current_user)
         return jsonify(results)
+    except SearchPaginationError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'搜索失败: {str(e)}'}), 500
 
@@ -136,14 +137,68 @@ def search_comments(current_user):
         
         results = es_service.search_comments(data, current_user)
         return jsonify(results)
+    except SearchPaginationError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'搜索失败: {str(e)}'}), 500
 
+@app.route('/search/videos/export', methods=['POST'])
+@token_required
+def export_videos(current_user):
+    """流式导出视频搜索结果（CSV/NDJSON）"""
+    return export_search_results(current_user, 'videos')
+
+@app.route('/search/comments/export', methods=['POST'])
+@token_required
+def export_comments(current_user):
+    """流式导出评论搜索结果（CSV/NDJSON）"""
+    return export_search_results(current_user, 'comments')
+
+def export_search_results(current_user, data_type):
+    try:
+        data = request.get_json() or {}
+        
+        # 检查项目权限
+        project_id = data.get('project_id')
+        if current_user['role'] != 'admin' and project_id:
+            if project_id not in current_user.get('project_access', []):
+                return jsonify({'message': '无权访问该项目'}), 403
+        
+        export_format = data.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'message': f'不支持的导出格式: {export_format}'}), 400
+        
+        limit = data.get('limit')
+        if limit not in (None, ''):
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                limit = 0
+            if limit <= 0:
+                return jsonify({'message': f"导出数量limit必须是正整数: {data.get('limit')}"}), 400
+        data = dict(data, limit=limit or None)
+        
+        if data_type == 'videos':
+            stream = export_service.export_videos(data, current_user, export_format)
+        else:
+            stream = export_service.export_comments(data, current_user, export_format)
+        
+        filename = f"{data_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        return Response(stream, content_type=EXPORT_FORMATS[export_format], headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            # 关闭nginx的响应缓冲，边查询边下载
+            'X-Accel-Buffering': 'no'
+        })
+    except Exception as e:
+        return jsonify({'message': f'导出失败: {str(e)}'}), 500
+
 @app.route('/comments/<comment_id>/similar', methods=['GET'])
 @token_required
 def find_similar_comments(current_user, comment_id):
     try:
         results = es_service.find_similar_comments(comment_id, current_user)
+        if results['source_comment'] is None and not results['timed_out']:
+            return jsonify({'message': '评论不存在'}), 404
         return jsonify(results)
     except Exception as e:
         return jsonify({'message': f'查找相似评论失败: {str(e)}'}), 500
@@ -206,6 +261,32 @@ def import_data(current_user):
     except Exception as e:
         return jsonify({'message': f'启动数据导入失败: {str(e)}'}), 500
 
+@app.route('/admin/data/import/<task_id>', methods=['GET'])
+@token_required
+@admin_required
+def get_import_job(current_user, task_id):
+    """获取导入任务进度"""
+    try:
+        job = data_service.get_import_job(task_id)
+        if not job:
+            return jsonify({'message': '任务不存在'}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({'message': f'获取导入任务失败: {str(e)}'}), 500
+
+@app.route('/admin/data/import/<task_id>/cancel', methods=['POST'])
+@token_required
+@admin_required
+def cancel_import_job(current_user, task_id):
+    """取消导入任务"""
+    try:
+        job = data_service.cancel_import_job(task_id)
+        if not job:
+            return jsonify({'message': '任务不存在'}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({'message': f'取消导入任务失败: {str(e)}'}), 500
+
 @app.route('/admin/data/clear', methods=['POST'])
 @token_required
 @admin_required
@@ -223,6 +304,74 @@ def clear_data(current_user):
     except Exception as e:
         return jsonify({'message': f'清空数据失败: {str(e)}'}), 500
 
+@app.route('/admin/data/sources', methods=['GET'])
+@token_required
+@admin_required
+def get_import_sources(current_user):
+    """获取导入数据源展开后的文件及导入状态"""
+    try:
+        return jsonify(data_service.list_import_sources())
+    except Exception as e:
+        return jsonify({'message': f'获取数据源失败: {str(e)}'}), 500
+
+@app.route('/admin/data/indices', methods=['GET'])
+@token_required
+@admin_required
+def get_index_versions(current_user):
+    """获取各别名的版本索引"""
+    try:
+        return jsonify(data_service.index_versions())
+    except Exception as e:
+        return jsonify({'message': f'获取索引版本失败: {str(e)}'}), 500
+
+@app.route('/admin/data/indices/rollback', methods=['POST'])
+@token_required
+@admin_required
+def rollback_index(current_user):
+    """把别名切换回上一个版本"""
+    try:
+        data = request.get_json() or {}
+        index = data_service.rollback_index(data.get('data_type', ''))
+        return jsonify({'message': '回滚成功', 'index': index})
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': f'回滚失败: {str(e)}'}), 500
+
+@app.route('/admin/data/rollups/rebuild', methods=['POST'])
+@token_required
+@admin_required
+def rebuild_rollups(current_user):
+    """从ES现有数据重建看板预聚合（后台任务，进度通过 /admin/data/import/<task_id> 查询）"""
+    try:
+        task_id = data_service.rebuild_rollups_async()
+        return jsonify({'task_id': task_id, 'message': '看板预聚合重建任务已启动'})
+    except Exception as e:
+        return jsonify({'message': f'启动看板预聚合重建失败: {str(e)}'}), 500
+
+@app.route('/admin/cache/stats', methods=['GET'])
+@token_required
+@admin_required
+def get_cache_stats(current_user):
+    """获取搜索结果缓存和父评论缓存的命中统计"""
+    try:
+        return jsonify({
+            'search_cache': es_service.search_cache.stats(),
+            'parent_cache': es_service.parent_cache.stats()
+        })
+    except Exception as e:
+        return jsonify({'message': f'获取缓存统计失败: {str(e)}'}), 500
+
+@app.route('/admin/es/stats', methods=['GET'])
+@token_required
+@admin_required
+def get_es_stats(current_user):
+    """获取Elasticsearch客户端状态（熔断状态、请求数、连接池）"""
+    try:
+        return jsonify(es_service.client_factory.stats())
+    except Exception as e:
+        return jsonify({'message': f'获取ES连接状态失败: {str(e)}'}), 500
+
 @app.route('/admin/data/statistics', methods=['GET'])
 @token_required
 @admin_required
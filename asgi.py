@@ -0,0 +1,146 @@
+"""
+ASGI入口
+
+搜索、项目列表、当前用户和健康检查由异步路由处理，ES请求使用 AsyncElasticsearch，
+等待ES期间不占用worker；其余接口（登录、管理、导入、导出等）转交原Flask应用，
+路径、请求和响应格式与 app.py 完全一致。
+
+运行（gunicorn管理uvicorn worker，与同步部署的进程管理方式一致）:
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 4 --bind 0.0.0.0:5000 asgi:app
+依赖: starlette, uvicorn, a2wsgi, aiohttp
+"""
+
+import contextlib
+from datetime import datetime
+from functools import wraps
+
+import jwt
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+from app import app as flask_app, auth_service, es_service
+from services.async_elasticsearch_service import AsyncElasticsearchService
+from services.elasticsearch_service import SearchPaginationError
+
+async_es_service = AsyncElasticsearchService()
+# 与Flask路由共用搜索结果缓存和父评论缓存
+async_es_service.search_cache = es_service.search_cache
+async_es_service.parent_cache = es_service.parent_cache
+
+
+# JWT认证装饰器（与 app.token_required 相同的校验和错误信息）
+def token_required(handler):
+    @wraps(handler)
+    async def decorated(request):
+        token = request.headers.get('Authorization')
+        if not token:
+            return JSONResponse({'message': '缺少认证令牌'}, status_code=401)
+
+        try:
+            if token.startswith('Bearer '):
+                token = token[7:]
+            # 未命中令牌缓存时会查询用户存储（SQLite或加锁读取JSON文件），在线程中执行
+            current_user = await run_in_threadpool(auth_service.verify_token, token,
+                                                   flask_app.config['SECRET_KEY'])
+            if not current_user:
+                return JSONResponse({'message': '用户不存在'}, status_code=401)
+        except jwt.ExpiredSignatureError:
+            return JSONResponse({'message': '令牌已过期'}, status_code=401)
+        except jwt.InvalidTokenError:
+            return JSONResponse({'message': '无效令牌'}, status_code=401)
+
+        return await handler(request, current_user)
+    return decorated
+
+
+def check_project_access(data, current_user):
+    """普通用户只能搜索有权限的项目，无权限时返回403响应"""
+    project_id = data.get('project_id')
+    if current_user['role'] != 'admin' and project_id:
+        if project_id not in current_user.get('project_access', []):
+            return JSONResponse({'message': '无权访问该项目'}, status_code=403)
+    return None
+
+
+@token_required
+async def get_current_user(request, current_user):
+    return JSONResponse({
+        'user': {
+            'id': current_user['id'],
+            'username': current_user['username'],
+            'role': current_user['role'],
+            'project_access': current_user.get('project_access', [])
+        }
+    })
+
+
+@token_required
+async def search_videos(request, current_user):
+    try:
+        data = await request.json()
+        denied = check_project_access(data, current_user)
+        if denied:
+            return denied
+
+        results = await async_es_service.search_videos_async(data, current_user)
+        return JSONResponse(results)
+    except SearchPaginationError as e:
+        return JSONResponse({'message': str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({'message': f'搜索失败: {str(e)}'}, status_code=500)
+
+
+@token_required
+async def search_comments(request, current_user):
+    try:
+        data = await request.json()
+        denied = check_project_access(data, current_user)
+        if denied:
+            return denied
+
+        results = await async_es_service.search_comments_async(data, current_user)
+        return JSONResponse(results)
+    except SearchPaginationError as e:
+        return JSONResponse({'message': str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({'message': f'搜索失败: {str(e)}'}, status_code=500)
+
+
+@token_required
+async def get_projects(request, current_user):
+    try:
+        # 项目目录通常命中内存，过期时的统计查询在线程池中执行
+        projects = await run_in_threadpool(es_service.get_available_projects, current_user)
+        return JSONResponse({'projects': projects})
+    except Exception as e:
+        return JSONResponse({'message': f'获取项目列表失败: {str(e)}'}, status_code=500)
+
+
+async def health_check(request):
+    return JSONResponse({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_es_service.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/auth/me', get_current_user, methods=['GET']),
+        Route('/search/videos', search_videos, methods=['POST']),
+        Route('/search/comments', search_comments, methods=['POST']),
+        Route('/projects', get_projects, methods=['GET']),
+        Route('/health', health_check, methods=['GET']),
+        # 其余接口由Flask应用在线程池中处理
+        Mount('/', app=WSGIMiddleware(flask_app))
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
@@ -0,0 +1,1731 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+性能基准脚本
+不依赖真实Elasticsearch，用合成数据对比各实现的吞吐量
+
+用法:
+    python benchmark.py transform [--rows 200000]
+    python benchmark.py video-index [--rows 500000]
+    python benchmark.py parents [--rows 20000] [--page-size 100]
+    python benchmark.py bulk [--rows 200000] [--threads 4] [--latency 0.1] [--reject 0.02]
+    python benchmark.py export [--rows 20000] [--format csv]
+    python benchmark.py dashboard [--rows 20000] [--latency 0.02] [--repeat 5]
+    python benchmark.py projects [--rows 20000] [--projects 250]
+    python benchmark.py auth [--users 5000] [--requests 2000]
+    python benchmark.py serve [--workers 4] [--concurrency 1 8 32 128]
+    python benchmark.py segment [--rows 50000] [--workers 4] [--es-url http://localhost:9200]
+    python benchmark.py incremental [--rows 100000] [--changed 0.01] [--latency 0.02]
+    python benchmark.py shards [--shards 8] [--rows 20000] [--workers 4]
+    python benchmark.py staging [--rows 200000]
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from services.data_service import ACCOUNT_FILE, DataService, VIDEO_INFO_COLUMNS, VIDEO_SOURCE_COLUMNS
+from services.lookup_store import LookupStore
+
+
+class FakeElasticsearchState:
+    """模拟Elasticsearch的内存状态和请求处理"""
+
+    def __init__(self, latency=0.0, reject_ratio=0.0, seed=1):
+        self.latency = latency
+        self.reject_ratio = reject_ratio
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.indices = {}
+        self.mappings = {}
+        self.settings = {}
+        # 别名 -> 索引
+        self.aliases = {}
+        self.pits = {}
+        self.requests = {}
+        self.rejected = 0
+
+    def count_request(self, name):
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def handle(self, method, path, body):
+        """路由请求，返回 (状态码, 响应对象)"""
+        parts = [p for p in path.split('?')[0].split('/') if p]
+        if not parts:
+            return 200, {'name': 'fake', 'version': {'number': '7.17.10', 'build_flavor': 'default'},
+                         'tagline': 'You Know, for Search'}
+        if parts == ['_fake', 'stats']:
+            with self.lock:
+                return 200, {'docs': {index: len(docs) for index, docs in self.indices.items()},
+                             'requests': dict(self.requests), 'rejected': self.rejected}
+        if parts[-1] == '_bulk':
+            return self.bulk(parts[0] if len(parts) > 1 else None, body)
+        request = json.loads(body) if body else {}
+        if parts[0] == '_aliases' or '_alias' in parts:
+            return self.manage_aliases(method, parts, request)
+        if not parts[0].startswith('_'):
+            parts[0] = self.aliases.get(parts[0], parts[0])
+        if len(parts) == 2 and parts[1] == '_pit':
+            return self.open_pit(parts[0])
+        if parts == ['_pit'] and method == 'DELETE':
+            return self.close_pit(request)
+        if parts == ['_search'] and 'pit' in request:
+            return self.search(None, request)
+        if len(parts) == 2 and parts[1] == '_search':
+            return self.search(parts[0], request)
+        if len(parts) == 2 and parts[1] == '_count':
+            self.count_request('count')
+            return 200, {'count': len(self.matching(parts[0], request.get('query')))}
+        if len(parts) == 2 and parts[1] == '_mget':
+            return self.mget(parts[0], request)
+        if len(parts) == 2 and parts[1] == '_mapping':
+            return self.index_mapping(method, parts[0], request)
+        if len(parts) == 2 and parts[1] == '_settings':
+            return self.index_settings(method, parts[0], request)
+        if len(parts) == 2 and parts[1] in ('_refresh', '_forcemerge'):
+            self.count_request(parts[1].lstrip('_'))
+            return 200, {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+        if len(parts) == 1 and not parts[0].startswith('_'):
+            return self.manage_index(method, parts[0], request)
+        return 404, {'error': f'unsupported: {method} {path}'}
+
+    def manage_index(self, method, index, request):
+        """创建（保存映射）、判断存在、删除索引"""
+        with self.lock:
+            exists = index in self.mappings or index in self.indices
+            if method == 'PUT':
+                if exists:
+                    return 400, {'error': {'type': 'resource_already_exists_exception'}, 'status': 400}
+                self.mappings[index] = request.get('mappings', {})
+                self.indices.setdefault(index, {})
+                return 200, {'acknowledged': True, 'index': index}
+            if method == 'DELETE':
+                if not exists:
+                    return 404, {'error': {'type': 'index_not_found_exception'}, 'status': 404}
+                self.aliases = {alias: target for alias, target in self.aliases.items() if target != index}
+                self.mappings.pop(index, None)
+                self.settings.pop(index, None)
+                self.indices.pop(index, None)
+                return 200, {'acknowledged': True}
+        return (200, {}) if exists else (404, {})
+
+    def index_mapping(self, method, index, request):
+        """读取映射（支持通配符）或修改映射中的 _meta"""
+        with self.lock:
+            if '*' in index:
+                return 200, {name: {'mappings': mapping} for name, mapping in self.mappings.items()
+                             if fnmatch.fnmatch(name, index)}
+            if index not in self.mappings:
+                return 404, {'error': {'type': 'index_not_found_exception'}, 'status': 404}
+            if method == 'PUT':
+                if '_meta' in request:
+                    self.mappings[index] = dict(self.mappings[index], _meta=request['_meta'])
+                return 200, {'acknowledged': True}
+            return 200, {index: {'mappings': self.mappings[index]}}
+
+    def manage_aliases(self, method, parts, request):
+        """别名的查询（/_alias/{别名}、/{索引通配}/_alias）与原子更新（/_aliases）"""
+        with self.lock:
+            if parts == ['_aliases']:
+                self.requests['update_aliases'] = self.requests.get('update_aliases', 0) + 1
+                aliases = dict(self.aliases)
+                for action in request.get('actions', []):
+                    op, params = next(iter(action.items()))
+                    if op == 'add':
+                        aliases[params['alias']] = params['index']
+                    elif op == 'remove':
+                        aliases.pop(params['alias'], None)
+                    elif op == 'remove_index':
+                        self.mappings.pop(params['index'], None)
+                        self.settings.pop(params['index'], None)
+                        self.indices.pop(params['index'], None)
+                self.aliases = aliases
+                return 200, {'acknowledged': True}
+            if parts[0] == '_alias':
+                index = self.aliases.get(parts[1])
+                if index is None:
+                    return 404, {'error': f'alias [{parts[1]}] missing', 'status': 404}
+                return 200, {index: {'aliases': {parts[1]: {}}}}
+            return 200, {
+                index: {'aliases': {alias: {} for alias, target in self.aliases.items() if target == index}}
+                for index in self.mappings if fnmatch.fnmatch(index, parts[0])
+            }
+
+    def index_settings(self, method, index, request):
+        """读取（flat格式）或修改索引设置，值为None时删除（恢复默认）"""
+        with self.lock:
+            settings = self.settings.setdefault(index, {'index.number_of_replicas': '1'})
+            if method == 'PUT':
+                self.requests['put_settings'] = self.requests.get('put_settings', 0) + 1
+                for key, value in request.get('index', {}).items():
+                    if value is None:
+                        settings.pop(f'index.{key}', None)
+                    else:
+                        settings[f'index.{key}'] = str(value)
+                return 200, {'acknowledged': True}
+            return 200, {index: {'settings': dict(settings)}}
+
+    def open_pit(self, index):
+        """PIT保存打开时刻的文档快照，之后的写入对其不可见"""
+        self.count_request('open_pit')
+        with self.lock:
+            pit_id = f'pit-{len(self.pits) + 1}-{index}'
+            self.pits[pit_id] = (index, dict(self.indices.get(index, {})))
+        return 200, {'id': pit_id}
+
+    def close_pit(self, request):
+        self.count_request('close_pit')
+        with self.lock:
+            found = self.pits.pop(request.get('id'), None) is not None
+        return 200, {'succeeded': found, 'num_freed': int(found)}
+
+    def matching(self, index, query, docs=None):
+        """返回匹配查询的 (文档ID, 文档) 列表"""
+        with self.lock:
+            docs = list((docs if docs is not None else self.indices.get(index, {})).items())
+        return [(doc_id, doc) for doc_id, doc in docs if self.matches(doc_id, doc, query or {'match_all': {}})]
+
+    def matches(self, doc_id, doc, query):
+        """支持 match_all/term/terms/range/match/multi_match/ids/more_like_this/bool 的简化查询求值"""
+        kind, params = next(iter(query.items()))
+        if kind == 'match_all':
+            return True
+        if kind == 'ids':
+            return doc_id in params['values']
+        if kind == 'term':
+            field, value = next(iter(params.items()))
+            value = value['value'] if isinstance(value, dict) else value
+            return str(doc.get(field.replace('.keyword', ''))) == str(value)
+        if kind == 'terms':
+            field, values = next(iter(params.items()))
+            return str(doc.get(field.replace('.keyword', ''))) in {str(v) for v in values}
+        if kind == 'range':
+            field, bounds = next(iter(params.items()))
+            value = doc.get(field)
+            if value is None:
+                return False
+            return (('gte' not in bounds or value >= bounds['gte']) and ('gt' not in bounds or value > bounds['gt'])
+                    and ('lte' not in bounds or value <= bounds['lte']) and ('lt' not in bounds or value < bounds['lt']))
+        if kind == 'match':
+            field, text = next(iter(params.items()))
+            text = text['query'] if isinstance(text, dict) else text
+            return str(text) in str(doc.get(field, ''))
+        if kind == 'multi_match':
+            fields = [field.split('^')[0] for field in params['fields']]
+            return any(str(params['query']) in str(doc.get(field, '')) for field in fields)
+        if kind == 'more_like_this':
+            # 与被参照文档共有的词（有空格时按空格切分，否则按字）达到minimum_should_match比例即匹配
+            like_ids = {(self.aliases.get(like['_index'], like['_index']), like['_id']) for like in params['like']}
+            if any(doc_id == like_id for _, like_id in like_ids):
+                return False
+            tokens = lambda text: set(text.split()) if ' ' in text else set(text)
+            with self.lock:
+                liked = [self.indices.get(index, {}).get(like_id) for index, like_id in like_ids]
+            terms = set()
+            for source in filter(None, liked):
+                for field in params['fields']:
+                    terms |= tokens(str(source.get(field, '')))
+            if not terms:
+                return False
+            ratio = int(str(params.get('minimum_should_match', '30%')).rstrip('%')) / 100
+            shared = sum(len(terms & tokens(str(doc.get(field, '')))) for field in params['fields'])
+            return shared >= max(1, int(len(terms) * ratio))
+        if kind == 'bool':
+            clauses = lambda name: params.get(name, []) if isinstance(params.get(name, []), list) else [params[name]]
+            if not all(self.matches(doc_id, doc, q) for q in clauses('must') + clauses('filter')):
+                return False
+            if any(self.matches(doc_id, doc, q) for q in clauses('must_not')):
+                return False
+            should = clauses('should')
+            return not should or any(self.matches(doc_id, doc, q) for q in should)
+        raise ValueError(f'unsupported query: {kind}')
+
+    def sort_key(self, sort):
+        """将ES排序定义转换为 (字段, 是否降序) 列表，_doc/_shard_doc按文档ID排序"""
+        keys = []
+        for item in sort or []:
+            if isinstance(item, str):
+                keys.append((item, False))
+            else:
+                field, spec = next(iter(item.items()))
+                order = spec.get('order', 'asc') if isinstance(spec, dict) else spec
+                keys.append((field, order == 'desc'))
+        return keys
+
+    def search(self, index, request):
+        self.count_request('search')
+        snapshot = None
+        if 'pit' in request:
+            with self.lock:
+                pit = self.pits.get(request['pit']['id'])
+            if pit is None:
+                return 404, {'error': {'type': 'search_context_missing_exception'}, 'status': 404}
+            index, snapshot = pit
+        hits = self.matching(index, request.get('query'), snapshot)
+        keys = self.sort_key(request.get('sort'))
+
+        def value_of(doc_id, doc, field):
+            if field in ('_doc', '_shard_doc', '_id'):
+                return doc_id
+            value = doc.get(field)
+            return value if value is not None else 0
+
+        for field, reverse in reversed(keys):
+            hits.sort(key=lambda hit: value_of(hit[0], hit[1], field), reverse=reverse)
+
+        total = len(hits)
+        if request.get('search_after') is not None and keys:
+            after = request['search_after']
+
+            def after_cursor(hit):
+                for (field, reverse), marker in zip(keys, after):
+                    value = value_of(hit[0], hit[1], field)
+                    if value != marker:
+                        return value < marker if reverse else value > marker
+                return False
+            hits = [hit for hit in hits if after_cursor(hit)]
+
+        start = request.get('from', 0)
+        size = request.get('size', 10)
+        page = hits[start:start + size]
+        response = {
+            'took': 1,
+            'timed_out': False,
+            'hits': {
+                'total': {'value': total, 'relation': 'eq'},
+                'hits': [{
+                    '_index': index,
+                    '_id': doc_id,
+                    '_source': doc,
+                    'sort': [value_of(doc_id, doc, field) for field, _ in keys]
+                } for doc_id, doc in page]
+            }
+        }
+        if 'pit' in request:
+            response['pit_id'] = request['pit']['id']
+        if request.get('aggs'):
+            response['aggregations'] = self.aggregate(hits, request['aggs'])
+        return 200, response
+
+    def aggregate(self, hits, aggs):
+        """支持 filter/terms/composite/range/sum/avg/max/min/value_count 的简化聚合"""
+        result = {}
+        for name, spec in aggs.items():
+            sub_aggs = spec.get('aggs', {})
+            kind = next(key for key in spec if key != 'aggs')
+            params = spec[kind]
+            if kind == 'filter':
+                matched = [hit for hit in hits if self.matches(hit[0], hit[1], params)]
+                result[name] = dict(self.aggregate(matched, sub_aggs), doc_count=len(matched))
+            elif kind == 'terms':
+                groups = {}
+                for hit in hits:
+                    key = hit[1].get(params['field'])
+                    if key is not None:
+                        groups.setdefault(key, []).append(hit)
+                # 与ES一致：按文档数降序，数量相同时按key升序
+                ordered = sorted(groups.items(), key=lambda item: (-len(item[1]), item[0]))[:params.get('size', 10)]
+                result[name] = {'buckets': [dict(self.aggregate(group, sub_aggs), key=key, doc_count=len(group))
+                                            for key, group in ordered]}
+            elif kind == 'composite':
+                # 仅支持单个terms来源，按key升序分页
+                source_name, source = next(iter(params['sources'][0].items()))
+                field = source['terms']['field']
+                groups = {}
+                for hit in hits:
+                    key = hit[1].get(field)
+                    if key is not None:
+                        groups.setdefault(key, []).append(hit)
+                keys = sorted(groups)
+                if 'after' in params:
+                    keys = [key for key in keys if key > params['after'][source_name]]
+                keys = keys[:params.get('size', 10)]
+                result[name] = {'buckets': [dict(self.aggregate(groups[key], sub_aggs), key={source_name: key},
+                                                 doc_count=len(groups[key])) for key in keys]}
+                if keys:
+                    result[name]['after_key'] = {source_name: keys[-1]}
+            elif kind == 'range':
+                buckets = []
+                for bounds in params['ranges']:
+                    matched = [hit for hit in hits if hit[1].get(params['field']) is not None
+                               and ('from' not in bounds or hit[1][params['field']] >= bounds['from'])
+                               and ('to' not in bounds or hit[1][params['field']] < bounds['to'])]
+                    buckets.append(dict(self.aggregate(matched, sub_aggs), key=bounds.get('key'),
+                                        doc_count=len(matched)))
+                result[name] = {'buckets': {bucket.pop('key'): bucket for bucket in buckets}
+                                if params.get('keyed') else buckets}
+            else:
+                values = [hit[1][params['field']] for hit in hits if hit[1].get(params['field']) is not None]
+                if kind == 'value_count':
+                    value = len(values)
+                elif not values:
+                    value = 0 if kind == 'sum' else None
+                else:
+                    value = {'sum': sum, 'max': max, 'min': min,
+                             'avg': lambda items: sum(items) / len(items)}[kind](values)
+                result[name] = {'value': value}
+        return result
+
+    def mget(self, index, request):
+        self.count_request('mget')
+        with self.lock:
+            docs = self.indices.get(index, {})
+            return 200, {'docs': [
+                {'_index': index, '_id': doc_id, 'found': doc_id in docs, '_source': docs.get(doc_id)}
+                if doc_id in docs else {'_index': index, '_id': doc_id, 'found': False}
+                for doc_id in request.get('ids', [])
+            ]}
+
+    def bulk(self, default_index, body):
+        self.count_request('bulk')
+        lines = [line for line in body.decode('utf-8').split('\n') if line.strip()]
+        items = []
+        errors = False
+        i = 0
+        while i < len(lines):
+            meta = json.loads(lines[i])
+            op, params = next(iter(meta.items()))
+            source = json.loads(lines[i + 1]) if op != 'delete' else None
+            i += 1 if op == 'delete' else 2
+
+            index = params.get('_index', default_index)
+            index = self.aliases.get(index, index)
+            doc_id = params.get('_id')
+            with self.lock:
+                if self.random.random() < self.reject_ratio:
+                    self.rejected += 1
+                    errors = True
+                    items.append({op: {'_index': index, '_id': doc_id, 'status': 429,
+                                       'error': {'type': 'es_rejected_execution_exception'}}})
+                    continue
+                docs = self.indices.setdefault(index, {})
+                if op == 'delete':
+                    docs.pop(doc_id, None)
+                elif op == 'update':
+                    docs.setdefault(doc_id, {}).update(source.get('doc', {}))
+                else:
+                    docs[doc_id] = source
+            items.append({op: {'_index': index, '_id': doc_id, 'status': 201, 'result': 'created'}})
+        return 200, {'took': 1, 'errors': errors, 'items': items}
+
+
+def _make_fake_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # 响应头和响应体分两次写出，关闭Nagle避免与客户端的延迟ACK叠加出约40ms的等待
+        disable_nagle_algorithm = True
+
+        def _dispatch(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if state.latency:
+                time.sleep(state.latency)
+            status, payload = state.handle(self.command, self.path, body)
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('X-Elastic-Product', 'Elasticsearch')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _dispatch
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _serve_fake_elasticsearch(port_queue, kwargs):
+    state = FakeElasticsearchState(**kwargs)
+    # 默认监听队列只有5，高并发压测时连接会被丢弃后重试
+    server_class = type('FakeServer', (ThreadingHTTPServer,), {'request_queue_size': 1024})
+    server = server_class(('127.0.0.1', 0), _make_fake_handler(state))
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class FakeElasticsearch:
+    """在子进程中运行的本地模拟Elasticsearch HTTP服务
+
+    独立进程运行，避免与被测代码争用GIL。
+    latency: 每个请求的固定延迟（秒），模拟网络和集群处理耗时
+    reject_ratio: bulk请求中随机返回429的文档比例，用于验证重试逻辑
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.process = None
+        self.port = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_serve_fake_elasticsearch,
+                                               args=(port_queue, self.kwargs), daemon=True)
+        self.process.start()
+        self.port = port_queue.get(timeout=10)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+    def client(self, **kwargs):
+        from elasticsearch import Elasticsearch
+        return Elasticsearch(self.url, **kwargs)
+
+    def stats(self):
+        with urllib.request.urlopen(f"{self.url}/_fake/stats") as response:
+            return json.loads(response.read())
+
+
+def generate_video_csv(path, rows, seed=42, base_ts=1715000000):
+    """生成合成视频CSV，发布时间分布在base_ts之后的90天内"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(rows):
+        create_time = base_ts + rng.randint(0, 90 * 86400)
+        records.append({
+            'id': i + 1,
+            'user_id': rng.randint(10 ** 8, 10 ** 9),
+            'nickname': f'UP主{rng.randint(0, 5000)}',
+            'avatar': f'https://i0.hdslb.com/face/{i}.jpg',
+            'add_ts': create_time * 1000 + rng.randint(0, 999),
+            'last_modify_ts': create_time * 1000 + rng.randint(0, 999),
+            'video_id': 100000000 + i,
+            'video_type': 'video',
+            'title': f'公务员考试经验分享 第{i}期',
+            'desc': '上岸经验' * rng.randint(1, 5),
+            'create_time': create_time,
+            'liked_count': rng.randint(0, 10000),
+            'video_play_count': rng.choice([rng.randint(0, 2000), '']),
+            'video_danmaku': rng.randint(0, 500),
+            'video_comment': rng.randint(0, 500),
+            'video_url': f'https://www.bilibili.com/video/av{100000000 + i}',
+            'video_cover_url': f'https://i0.hdslb.com/cover/{i}.jpg',
+            'source_keyword': '公务员',
+        })
+    pd.DataFrame(records).to_csv(path, index=False)
+
+
+def generate_comment_csv(path, rows, video_rows, seed=7):
+    """生成合成评论CSV，约三分之一为回复"""
+    rng = random.Random(seed)
+    base_ts = 1715000000
+    records = []
+    for i in range(rows):
+        create_time = base_ts + rng.randint(0, 90 * 86400)
+        is_reply = i > 0 and rng.random() < 0.33
+        records.append({
+            'id': i + 1,
+            'user_id': rng.randint(10 ** 8, 10 ** 9),
+            'nickname': f'网友{rng.randint(0, 50000)}',
+            'avatar': f'https://i0.hdslb.com/face/c{i}.jpg',
+            'add_ts': create_time * 1000,
+            'last_modify_ts': create_time * 1000,
+            'comment_id': 200000000 + i,
+            'video_id': 100000000 + rng.randint(0, max(video_rows - 1, 0)),
+            'content': '考试加油，' * rng.randint(1, 8),
+            # 混合秒级时间戳和日期字符串
+            'create_time': create_time if rng.random() < 0.9 else
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(create_time)),
+            'sub_comment_count': rng.randint(0, 30),
+            'parent_comment_id': 200000000 + rng.randint(0, i - 1) if is_reply else 0,
+            'like_count': rng.randint(0, 3000),
+        })
+    pd.DataFrame(records).to_csv(path, index=False)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def report(label, rows, seconds):
+    print(f"   {label:<12} {seconds:8.3f}s  {rows / seconds:12,.0f} 行/秒")
+
+
+def build_video_actions_rowwise(data_service, df):
+    """逐行转换视频数据块（列式转换之前的实现，用于对比）"""
+    bulk_data = []
+
+    for _, row in df.iterrows():
+        # 根据用户ID获取项目
+        user_id = str(row.get('user_id', ''))
+        project_id = data_service.get_user_project(user_id)
+
+        # 清理和转换数据
+        doc = {
+            'id': str(row.get('id', '')),
+            'user_id': user_id,
+            'nickname': str(row.get('nickname', '')),
+            'avatar': str(row.get('avatar', '')),
+            'add_ts': data_service.convert_timestamp(row.get('add_ts')),
+            'last_modify_ts': data_service.convert_timestamp(row.get('last_modify_ts')),
+            'video_id': str(row.get('video_id', '')),
+            'video_type': str(row.get('video_type', 'video')),
+            'title': str(row.get('title', '')),
+            'desc': str(row.get('desc', '')),
+            'create_time': data_service.convert_timestamp(row.get('create_time')),
+            'liked_count': data_service.safe_int(row.get('liked_count', 0)),
+            'video_play_count': data_service.safe_int(row.get('video_play_count', 0)),
+            'video_danmaku': data_service.safe_int(row.get('video_danmaku', 0)),
+            'video_comment': data_service.safe_int(row.get('video_comment', 0)),
+            'video_url': str(row.get('video_url', '')),
+            'video_cover_url': str(row.get('video_cover_url', '')),
+            'source_keyword': str(row.get('source_keyword', '')),
+            'project_id': project_id
+        }
+
+        # 构建批量插入数据
+        bulk_data.append({
+            '_index': data_service.write_index(data_service.es_service.video_index),
+            '_id': doc['video_id'],  # 使用video_id作为文档ID实现去重
+            '_source': doc
+        })
+
+    return bulk_data
+
+
+def build_comment_actions_rowwise(data_service, df):
+    """逐行转换评论数据块（列式转换之前的实现，用于对比）"""
+    bulk_data = []
+
+    for _, row in df.iterrows():
+        # 根据视频ID获取项目（而不是评论者的user_id）
+        video_id = str(row.get('video_id', ''))
+        project_id = data_service.get_video_project(video_id)
+
+        # 获取视频详细信息
+        video_info = data_service.get_video_info(video_id)
+
+        # 判断是否为主评论
+        parent_comment_id = str(row.get('parent_comment_id', ''))
+        is_main_comment = (parent_comment_id == '' or parent_comment_id == '0')
+
+        # 清理和转换数据
+        doc = {
+            'id': str(row.get('id', '')),
+            'user_id': str(row.get('user_id', '')),  # 这是评论者的ID
+            'nickname': str(row.get('nickname', '')),
+            'avatar': str(row.get('avatar', '')),
+            'add_ts': data_service.convert_timestamp(row.get('add_ts')),
+            'last_modify_ts': data_service.convert_timestamp(row.get('last_modify_ts')),
+            'comment_id': str(row.get('comment_id', '')),
+            'video_id': video_id,  # 这是视频的ID
+            'content': str(row.get('content', '')),
+            'create_time': data_service.convert_timestamp(row.get('create_time')),
+            'sub_comment_count': data_service.safe_int(row.get('sub_comment_count', 0)),
+            'parent_comment_id': parent_comment_id,
+            'like_count': data_service.safe_int(row.get('like_count', 0)),
+            'project_id': project_id,  # 基于视频的项目，而不是评论者的项目
+
+            # 添加视频相关信息
+            'video_title': video_info.get('video_title', ''),
+            'video_url': video_info.get('video_url', ''),
+            'video_uploader_nickname': video_info.get('video_uploader_nickname', ''),
+            'video_uploader_uid': video_info.get('video_uploader_uid', ''),
+
+            # 添加评论类型标识
+            'is_main_comment': is_main_comment
+        }
+
+        # 构建批量插入数据
+        bulk_data.append({
+            '_index': data_service.write_index(data_service.es_service.comment_index),
+            '_id': doc['comment_id'],  # 使用comment_id作为文档ID实现去重
+            '_source': doc
+        })
+
+    return bulk_data
+
+
+def bench_transform(args):
+    """对比逐行转换与列式转换的吞吐量"""
+    data_service = DataService()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_file = os.path.join(tmp, 'videos.csv')
+        comment_file = os.path.join(tmp, 'comments.csv')
+        video_rows = max(args.rows // 10, 1)
+        generate_video_csv(video_file, video_rows)
+        generate_comment_csv(comment_file, args.rows, video_rows)
+
+        videos = pd.read_csv(video_file, low_memory=False)
+        comments = pd.read_csv(comment_file, low_memory=False)
+
+        # 构建视频查找索引，供评论关联使用
+        data_service.video_lookup = LookupStore(os.path.join(tmp, 'video_index'),
+                                                string_columns=VIDEO_INFO_COLUMNS)
+        data_service.video_lookup.build(data_service._iter_video_lookup_frames([video_file]), 'video_id')
+
+    print(f"\n📊 视频转换 ({len(videos):,} 行)")
+    rowwise, t_row = timed(build_video_actions_rowwise, data_service, videos)
+    columnar, t_col = timed(data_service.build_video_actions, videos)
+    report('逐行', len(videos), t_row)
+    report('列式', len(videos), t_col)
+    print(f"   加速比: {t_row / t_col:.1f}x, 结果一致: {rowwise == columnar}")
+
+    print(f"\n📊 评论转换 ({len(comments):,} 行)")
+    rowwise, t_row = timed(build_comment_actions_rowwise, data_service, comments)
+    columnar, t_col = timed(data_service.build_comment_actions, comments)
+    report('逐行', len(comments), t_row)
+    report('列式', len(comments), t_col)
+    print(f"   加速比: {t_row / t_col:.1f}x, 结果一致: {rowwise == columnar}")
+
+
+def bench_video_index(args):
+    """对比逐行构建字典映射与磁盘查找索引的构建、加载和查询耗时"""
+    data_service = DataService()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_file = os.path.join(tmp, 'videos.csv')
+        generate_video_csv(video_file, args.rows)
+        index_dir = os.path.join(tmp, 'video_index')
+        probe = [str(100000000 + i) for i in range(0, args.rows * 2, 2)][:100000]
+
+        print(f"\n📊 视频查找索引 ({args.rows:,} 个视频)")
+
+        accounts = pd.read_csv(ACCOUNT_FILE, dtype=str) if os.path.exists(ACCOUNT_FILE) else pd.DataFrame()
+        user_mapping = dict(zip(accounts.get('用户ID', []), accounts.get('工作表', [])))
+
+        def build_dicts():
+            # 旧实现：逐行构建两个字典
+            project_mapping, info_mapping = {}, {}
+            for chunk in pd.read_csv(video_file, chunksize=5000, low_memory=False):
+                for _, row in chunk.iterrows():
+                    video_id = str(row.get('video_id', ''))
+                    project_mapping[video_id] = user_mapping.get(str(row.get('user_id', '')), '未分类项目')
+                    info_mapping[video_id] = {
+                        'video_title': str(row.get('title', '')),
+                        'video_url': str(row.get('video_url', '')),
+                        'video_uploader_nickname': str(row.get('nickname', '')),
+                        'video_uploader_uid': str(row.get('user_id', ''))
+                    }
+            return project_mapping, info_mapping
+
+        (project_mapping, info_mapping), t_dict = timed(build_dicts)
+        print(f"   字典构建       {t_dict:8.3f}s")
+
+        store = LookupStore(index_dir, string_columns=VIDEO_INFO_COLUMNS)
+        _, t_build = timed(store.build, data_service._iter_video_lookup_frames([video_file]), 'video_id')
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(index_dir) for name in names)
+        print(f"   索引构建       {t_build:8.3f}s  磁盘占用 {size / 1024 / 1024:.1f} MB")
+
+        loaded = LookupStore(index_dir, string_columns=VIDEO_INFO_COLUMNS)
+        _, t_load = timed(loaded.load)
+        print(f"   索引加载       {t_load * 1000:8.2f}ms")
+
+        _, t_dict_lookup = timed(lambda: [(project_mapping.get(v, '未分类项目'), info_mapping.get(v))
+                                          for v in probe])
+        found, t_lookup = timed(loaded.lookup, probe)
+        report('字典查找', len(probe), t_dict_lookup)
+        report('索引查找', len(probe), t_lookup)
+        consistent = all(found['project_id'][i] == project_mapping.get(v, '')
+                         for i, v in enumerate(probe) if v in project_mapping)
+        print(f"   结果一致: {consistent}")
+
+
+def load_fake_comments(fake, rows, video_rows, denormalized=False):
+    """生成评论并通过流水线写入模拟ES；denormalized为True时回复附带父评论快照"""
+    from services.bulk_indexer import BulkIndexer
+
+    data_service = DataService()
+    with tempfile.TemporaryDirectory() as tmp:
+        comment_file = os.path.join(tmp, 'comments.csv')
+        generate_comment_csv(comment_file, rows, video_rows)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if denormalized:
+                data_service.comment_index_dir = os.path.join(tmp, 'comment_index')
+                data_service.build_comment_summary_index([comment_file])
+            BulkIndexer(fake.client()).run(data_service.read_csv_chunks(comment_file),
+                                           data_service.build_comment_actions)
+
+
+def bench_parents(args):
+    """对比逐条查询父评论与整页批量查询（含跨请求缓存）的ES调用次数和延迟"""
+    from services.elasticsearch_service import ElasticsearchService
+
+    with FakeElasticsearch(latency=args.latency) as fake:
+        load_fake_comments(fake, args.rows, max(args.rows // 10, 1))
+        es_service = ElasticsearchService()
+        es_service.es = fake.client()
+        admin = {'role': 'admin'}
+        params = {'page': 1, 'page_size': args.page_size, 'sort_by': 'create_time'}
+
+        print(f"\n📊 父评论查询 (每页 {args.page_size} 条, 每次请求延迟 {args.latency}s)")
+
+        def per_reply():
+            # 旧实现：每条回复单独发起一次term查询
+            response = es_service.es.search(index=es_service.comment_index, body={
+                'query': {'match_all': {}}, 'size': args.page_size,
+                'sort': [{'create_time': {'order': 'desc'}}]})
+            for hit in response['hits']['hits']:
+                source = hit['_source']
+                if not source.get('is_main_comment', True) and source.get('parent_comment_id'):
+                    es_service.es.search(index=es_service.comment_index, body={
+                        'query': {'term': {'comment_id': source['parent_comment_id']}}, 'size': 1})
+
+        for label, func in (('逐条查询', per_reply),
+                            ('批量(冷缓存)', lambda: es_service.search_comments(params, admin)),
+                            ('批量(热缓存)', lambda: es_service.search_comments(params, admin))):
+            before = sum(fake.stats()['requests'].values())
+            _, seconds = timed(func)
+            calls = sum(fake.stats()['requests'].values()) - before
+            print(f"   {label:<12} {seconds * 1000:8.1f}ms  ES调用 {calls} 次")
+
+    # 导入时写入父评论快照，搜索不再查询父评论
+    with FakeElasticsearch(latency=args.latency) as fake:
+        _, t_load = timed(load_fake_comments, fake, args.rows, max(args.rows // 10, 1), True)
+        es_service = ElasticsearchService()
+        es_service.es = fake.client()
+        before = sum(fake.stats()['requests'].values())
+        _, seconds = timed(es_service.search_comments, params, admin)
+        calls = sum(fake.stats()['requests'].values()) - before
+        print(f"   {'导入时快照':<12} {seconds * 1000:8.1f}ms  ES调用 {calls} 次  (两遍导入耗时 {t_load:.2f}s)")
+
+
+def bench_bulk(args):
+    """对比逐块同步写入与流水线并行写入的吞吐量"""
+    from elasticsearch.helpers import bulk
+    from services.bulk_indexer import BulkIndexer
+
+    data_service = DataService()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        comment_file = os.path.join(tmp, 'comments.csv')
+        generate_comment_csv(comment_file, args.rows, max(args.rows // 10, 1))
+
+        print(f"\n📊 同步逐块写入 ({args.rows:,} 行, 每次请求延迟 {args.latency}s)")
+        with FakeElasticsearch(latency=args.latency) as fake:
+            es = fake.client()
+            start = time.perf_counter()
+            for chunk in pd.read_csv(comment_file, chunksize=1000, low_memory=False):
+                bulk(es, data_service.build_comment_actions(chunk), chunk_size=1000)
+            report('同步', args.rows, time.perf_counter() - start)
+
+        print(f"\n📊 流水线写入 ({args.threads} 线程, 429拒绝比例 {args.reject})")
+        with FakeElasticsearch(latency=args.latency, reject_ratio=args.reject) as fake:
+            indexer = BulkIndexer(fake.client(), thread_count=args.threads,
+                                  max_batch_bytes=args.batch_bytes, initial_backoff=0.05, max_backoff=1)
+            start = time.perf_counter()
+            result = indexer.run(data_service.read_csv_chunks(comment_file), data_service.build_comment_actions)
+            report('流水线', args.rows, time.perf_counter() - start)
+            stats = fake.stats()
+            stored = sum(stats['docs'].values())
+            print(f"   已写入文档: {stored:,}, 429重试: {stats['rejected']}, 最终失败: {result['failed']}")
+
+
+def bench_export(args):
+    """对比逐页查询后整体写出与PIT流式导出的耗时和内存峰值"""
+    import csv
+    from services.elasticsearch_service import ElasticsearchService
+    from services.export_service import COMMENT_EXPORT_COLUMNS, ExportService
+
+    with FakeElasticsearch(latency=args.latency) as fake:
+        load_fake_comments(fake, args.rows, max(args.rows // 10, 1))
+        es_service = ElasticsearchService()
+        es_service.es = fake.client()
+        es_service.max_result_window = args.rows + args.page_size
+        admin = {'role': 'admin'}
+
+        print(f"\n📊 评论导出 ({args.rows:,} 条, 每次请求延迟 {args.latency}s)")
+
+        def paged():
+            # 旧方式：按页码逐页查询，全部结果收集到内存后再写出
+            rows, page = [], 1
+            with contextlib.redirect_stdout(io.StringIO()):
+                while True:
+                    result = es_service.search_comments({'page': page, 'page_size': args.page_size}, admin)
+                    rows.extend(result['results'])
+                    if page >= result['total_pages']:
+                        break
+                    page += 1
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(COMMENT_EXPORT_COLUMNS)
+            for row in rows:
+                writer.writerow([row.get(column, '') for column in COMMENT_EXPORT_COLUMNS])
+            return len(rows), len(output.getvalue().encode('utf-8'))
+
+        def streamed():
+            exporter = ExportService(es_service, batch_size=args.batch_size)
+            nbytes = lines = 0
+            for piece in exporter.export_comments({}, admin, args.format):
+                nbytes += len(piece.encode('utf-8'))
+                lines += piece.count('\n')
+            return lines - (1 if args.format == 'csv' else 0), nbytes
+
+        for label, func in (('逐页查询', paged), (f'流式导出({args.format})', streamed)):
+            before = sum(fake.stats()['requests'].values())
+            tracemalloc.start()
+            (rows, nbytes), seconds = timed(func)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            calls = sum(fake.stats()['requests'].values()) - before
+            print(f"   {label:<14} {seconds:8.3f}s  {rows / seconds:10,.0f} 行/秒  "
+                  f"{nbytes / 1024 / 1024:6.1f} MB  内存峰值 {peak / 1024 / 1024:6.1f} MB  ES调用 {calls} 次")
+
+
+def bench_projects(args):
+    """对比每次请求两次terms聚合与项目目录缓存的 /projects 延迟和项目完整性"""
+    from services.bulk_indexer import BulkIndexer
+    from services.elasticsearch_service import ElasticsearchService
+    from services.search_cache import SearchCache
+
+    data_service = DataService()
+    projects = [f'项目{i:03d}' for i in range(args.projects)]
+
+    def with_projects(df):
+        actions = data_service.build_video_actions(df)
+        for action in actions:
+            action['_source']['project_id'] = projects[hash(action['_id']) % len(projects)]
+        return actions
+
+    with FakeElasticsearch(latency=args.latency) as fake, tempfile.TemporaryDirectory() as tmp:
+        video_file = os.path.join(tmp, 'videos.csv')
+        generate_video_csv(video_file, args.rows)
+        with contextlib.redirect_stdout(io.StringIO()):
+            BulkIndexer(fake.client()).run(data_service.read_csv_chunks(video_file), with_projects)
+        es_service = ElasticsearchService()
+        es_service.es = fake.client()
+        es_service.search_cache = SearchCache(backend='memory', marker_dir=os.path.join(tmp, 'search_cache'))
+        admin = {'role': 'admin'}
+
+        def terms_per_request():
+            # 旧实现：每次请求对两个索引各做一次terms聚合，最多100个项目
+            names = set()
+            for index in (es_service.video_index, es_service.comment_index):
+                response = es_service.es.search(index=index, body={
+                    'size': 0, 'aggs': {'projects': {'terms': {'field': 'project_id', 'size': 100}}}})
+                names.update(bucket['key'] for bucket in response['aggregations']['projects']['buckets'])
+            return len(names)
+
+        def catalog():
+            return len(es_service.get_available_projects(admin))
+
+        def after_import():
+            es_service.search_cache.invalidate(es_service.video_index)
+            return catalog()
+
+        print(f"\n📊 项目列表 ({args.rows:,} 个视频, {args.projects} 个项目, 每次请求延迟 {args.latency}s)")
+        for label, func in (('每次聚合', terms_per_request), ('目录(首次)', catalog),
+                            ('目录(缓存)', catalog), ('目录(导入后)', after_import)):
+            before = sum(fake.stats()['requests'].values())
+            count, seconds = timed(func)
+            calls = sum(fake.stats()['requests'].values()) - before
+            print(f"   {label:<10} {seconds * 1000:10.3f}ms  项目 {count} 个  ES调用 {calls} 次")
+
+
+def visualization_statistics_serial(data_service, params):
+    """逐项查询的可视化统计（组合聚合之前的实现，共8次请求，用于对比）"""
+    try:
+        es = data_service.es_service.get_es_client()
+        project_id, time_query, base_query = data_service._visualization_queries(params)
+
+        return {
+            'play_stats': serial_play_stats(data_service, es, base_query),
+            'time_period_stats': serial_time_period_stats(data_service, es, project_id),
+            'viral_stats': serial_viral_stats(data_service, es, base_query, project_id),
+            'project_stats': serial_project_distribution(data_service, es, time_query),
+            'success': True
+        }
+
+    except Exception as e:
+        print(f"❌ 获取可视化统计失败: {str(e)}")
+        return {'success': False, 'message': str(e)}
+
+
+def serial_play_stats(data_service, es, base_query):
+    """获取播放量统计 - 改为按项目的播放总量统计"""
+    try:
+        response = es.search(
+            index=data_service.es_service.video_index,
+            body={
+                "query": base_query,
+                "aggs": {
+                    "total_plays": {"sum": {"field": "video_play_count"}},
+                    "avg_plays": {"avg": {"field": "video_play_count"}},
+                    "max_plays": {"max": {"field": "video_play_count"}},
+                    "by_project": {
+                        "terms": {"field": "project_id", "size": 50},
+                        "aggs": {
+                            "total_plays": {"sum": {"field": "video_play_count"}},
+                            "video_count": {"value_count": {"field": "video_id"}}
+                        }
+                    }
+                },
+                "size": 0
+            }
+        )
+
+        return data_service._assemble_play_stats(response['aggregations'])
+    except Exception as e:
+        print(f"获取播放量统计失败: {e}")
+        return {'total_plays': 0, 'avg_plays': 0, 'max_plays': 0, 'project_data': []}
+
+
+def serial_time_period_stats(data_service, es, project_id=None):
+    """获取不同时间段的统计"""
+    from datetime import datetime, timedelta
+
+    now = datetime.now()
+    periods = {
+        '1d': now - timedelta(days=1),
+        '7d': now - timedelta(days=7),
+        '30d': now - timedelta(days=30)
+    }
+
+    stats = {}
+
+    for period, start_time in periods.items():
+        query = {
+            "bool": {
+                "must": [
+                    {"range": {"create_time": {"gte": int(start_time.timestamp())}}}
+                ]
+            }
+        }
+
+        if project_id:
+            query["bool"]["must"].append({"term": {"project_id": project_id}})
+
+        try:
+            response = es.count(
+                index=data_service.es_service.video_index,
+                body={"query": query}
+            )
+            stats[period] = response['count']
+        except:
+            stats[period] = 0
+
+    return stats
+
+
+def serial_viral_stats(data_service, es, base_query, project_id=None):
+    """获取爆文率统计（播放量>1000为爆文）"""
+    try:
+        # 总视频数
+        total_response = es.search(
+            index=data_service.es_service.video_index,
+            body={"query": base_query, "size": 0}
+        )
+        total_videos = total_response['hits']['total']['value']
+
+        # 爆文数（播放量>1000）
+        viral_query = {
+            "bool": {
+                "must": base_query["bool"]["must"] + [
+                    {"range": {"video_play_count": {"gt": 1000}}}
+                ]
+            }
+        }
+
+        viral_response = es.search(
+            index=data_service.es_service.video_index,
+            body={"query": viral_query, "size": 0}
+        )
+        viral_videos = viral_response['hits']['total']['value']
+
+        # 各项目爆文率
+        project_buckets = None
+        if not project_id:  # 只有在不限定项目时才统计各项目
+            project_agg_response = es.search(
+                index=data_service.es_service.video_index,
+                body={
+                    "query": base_query,
+                    "aggs": {
+                        "by_project": {
+                            "terms": {"field": "project_id", "size": 100},
+                            "aggs": {
+                                "viral_videos": {
+                                    "filter": {"range": {"video_play_count": {"gt": 1000}}}
+                                }
+                            }
+                        }
+                    },
+                    "size": 0
+                }
+            )
+            project_buckets = project_agg_response['aggregations']['by_project']['buckets']
+
+        return data_service._assemble_viral_stats(total_videos, viral_videos, project_buckets)
+
+    except Exception as e:
+        print(f"获取爆文率统计失败: {e}")
+        return {'total_videos': 0, 'viral_videos': 0, 'viral_rate': 0, 'project_stats': {}}
+
+
+def serial_project_distribution(data_service, es, time_query=None):
+    """获取项目分布统计"""
+    try:
+        query = {"bool": {"must": []}}
+        if time_query:
+            query["bool"]["must"].append(time_query)
+
+        response = es.search(
+            index=data_service.es_service.video_index,
+            body={
+                "query": query,
+                "aggs": {
+                    "by_project": {
+                        "terms": {"field": "project_id", "size": 100},
+                        "aggs": {
+                            "total_plays": {"sum": {"field": "video_play_count"}}
+                        }
+                    }
+                },
+                "size": 0
+            }
+        )
+
+        return data_service._assemble_project_distribution(response['aggregations'])
+
+    except Exception as e:
+        print(f"获取项目分布失败: {e}")
+        return []
+
+
+def bench_dashboard(args):
+    """对比逐项查询（8次请求）、单次组合聚合与 项目×天 预聚合的可视化统计延迟"""
+    from services.bulk_indexer import BulkIndexer
+    from services.rollup_store import RollupStore
+
+    data_service = DataService()
+    projects = [f'项目{i}' for i in range(args.projects)]
+
+    def with_projects(df):
+        # 合成数据的UP主不在账号表中，随机分配项目；同时计入预聚合
+        actions = data_service.build_video_actions(df)
+        for action in actions:
+            action['_source']['project_id'] = projects[hash(action['_id']) % len(projects)]
+        data_service._apply_video_rollups([action['_source'] for action in actions])
+        return actions
+
+    with FakeElasticsearch(latency=args.latency) as fake, tempfile.TemporaryDirectory() as tmp:
+        data_service.rollups = RollupStore(os.path.join(tmp, 'rollups'))
+        video_file = os.path.join(tmp, 'videos.csv')
+        generate_video_csv(video_file, args.rows, base_ts=int(time.time()) - 60 * 86400)
+        with contextlib.redirect_stdout(io.StringIO()):
+            BulkIndexer(fake.client()).run(data_service.read_csv_chunks(video_file), with_projects)
+        data_service.rollups.save()
+        data_service.es_service.es = fake.client()
+
+        # 按整天对齐的自定义时间范围（最近14个自然日）
+        today = data_service.rollups.day_of(time.time())
+        day_start = today * 86400 - data_service.rollups.tz_offset
+
+        def recent_days(days, project_id=None):
+            # 预聚合按自然日统计最近N天，对比时聚合查询使用同样按整天对齐的范围（不限结束时间）
+            params = {'start_time': day_start - (days - 1) * 86400, 'end_time': day_start + 3650 * 86400 - 1}
+            return dict(params, project_id=project_id) if project_id else params
+
+        def rollup(params):
+            data_service.dashboard_source = 'rollup'
+            try:
+                return data_service.get_visualization_statistics(params)
+            finally:
+                data_service.dashboard_source = 'aggregation'
+
+        def expected(params, days):
+            # 与预聚合口径一致的结果：时间范围和1d/7d/30d时间段都按自然日对齐
+            result = data_service.get_visualization_statistics(
+                recent_days(days, params.get('project_id')) if days else params)
+            result['time_period_stats'] = {
+                period: data_service.get_visualization_statistics(
+                    recent_days(count, params.get('project_id')))['viral_stats']['total_videos']
+                for period, count in (('1d', 1), ('7d', 7), ('30d', 30))}
+            return result
+
+        aligned = recent_days(14)
+        aligned['end_time'] = day_start + 86400 - 1
+
+        print(f"\n📊 可视化统计 ({args.rows:,} 个视频, 每次请求延迟 {args.latency}s, 重复 {args.repeat} 次)")
+        for name, params, days in (('全部', {}, None), ('最近30天', {'time_range': '30d'}, 30),
+                                   ('单个项目', {'project_id': projects[0]}, None), ('整天范围', aligned, None)):
+            results = {}
+            for label, func in (('逐项查询', lambda params: visualization_statistics_serial(data_service, params)),
+                                ('组合聚合', data_service.get_visualization_statistics),
+                                ('预聚合', rollup)):
+                before = sum(fake.stats()['requests'].values())
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    results[label] = func(params)
+                seconds = (time.perf_counter() - start) / args.repeat
+                calls = (sum(fake.stats()['requests'].values()) - before) // args.repeat
+                print(f"   {name:<8} {label:<8} {seconds * 1000:10.3f}ms  ES调用 {calls} 次")
+            print(f"   {'':<8} 组合聚合一致: {results['逐项查询'] == results['组合聚合']}, "
+                  f"预聚合与按天对齐的聚合一致: {results['预聚合'] == expected(params, days)}")
+
+
+def bench_auth(args):
+    """对比认证装饰器的用户查询：每次读取users.json、JSON内存索引、SQLite、令牌缓存、信任令牌声明"""
+    from functools import wraps
+
+    import jwt
+    from flask import Flask, jsonify, request
+    from services.auth_service import AuthService
+    from services.user_store import JsonUserStore, SqliteUserStore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        users = [{'id': i, 'username': f'user{i}', 'password_hash': 'x' * 64, 'role': 'user',
+                  'project_access': [f'项目{i % 10}', f'项目{i % 7 + 10}'], 'created_at': '2024-01-01T00:00:00'}
+                 for i in range(1, args.users + 1)]
+        users[0]['role'] = 'admin'
+        json_store = JsonUserStore(os.path.join(tmp, 'users.json'))
+        json_store.seed(users)
+        sqlite_store = SqliteUserStore(os.path.join(tmp, 'users.db'))
+        sqlite_store.seed(users)
+        cached = AuthService(store=sqlite_store, trust_claims=False)
+        trusting = AuthService(store=sqlite_store, trust_claims=True)
+
+        secret = 'benchmark-secret-key-for-hs256-signing'
+        user_id = args.users // 2
+        token = jwt.encode(dict(trusting.token_claims(sqlite_store.get(user_id)), exp=int(time.time()) + 3600),
+                           secret, algorithm='HS256')
+        headers = {'Authorization': f'Bearer {token}'}
+
+        def file_lookup(token):
+            # 最初的实现：每次解码令牌，读取并解析文件后线性查找
+            data = jwt.decode(token, secret, algorithms=['HS256'])
+            for user in json_store.load_users():
+                if user['id'] == data['user_id']:
+                    return user
+            return None
+
+        def store_lookup(store):
+            def lookup(token):
+                return store.get(jwt.decode(token, secret, algorithms=['HS256'])['user_id'])
+            return lookup
+
+        print(f"\n📊 认证装饰器 ({args.users} 个用户, {args.requests} 次请求)")
+        for label, verify in (('每次读文件', file_lookup), ('JSON内存索引', store_lookup(json_store)),
+                              ('SQLite', store_lookup(sqlite_store)),
+                              ('令牌缓存', lambda token: cached.verify_token(token, secret)),
+                              ('信任声明', lambda token: trusting.verify_token(token, secret))):
+            app = Flask(__name__)
+
+            def token_required(f):
+                @wraps(f)
+                def decorated(*f_args, **f_kwargs):
+                    current_user = verify(request.headers['Authorization'][7:])
+                    if not current_user:
+                        return jsonify({'message': '用户不存在'}), 401
+                    return f(current_user, *f_args, **f_kwargs)
+                return decorated
+
+            @app.route('/auth/me')
+            @token_required
+            def me(current_user):
+                return jsonify({'user': {'id': current_user['id'], 'username': current_user['username']}})
+
+            # 单独的认证耗时，以及包含Flask请求处理的吞吐量
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                verify(token)
+            verify_seconds = time.perf_counter() - start
+
+            client = app.test_client()
+            assert client.get('/auth/me', headers=headers).status_code == 200
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                client.get('/auth/me', headers=headers)
+            seconds = time.perf_counter() - start
+            print(f"   {label:<12} 认证 {verify_seconds / args.requests * 1e6:8.1f}µs  "
+                  f"{args.requests / seconds:10,.0f} 请求/秒")
+
+        # 修改用户的耗时：JSON需要重写整个文件，SQLite只更新一行
+        for label, store in (('JSON', json_store), ('SQLite', sqlite_store)):
+            start = time.perf_counter()
+            for i in range(args.updates):
+                store.update(i % args.users + 1, {'project_access': [f'项目{i}']})
+            seconds = (time.perf_counter() - start) / args.updates
+            print(f"   修改用户 {label:<8} {seconds * 1000:8.3f}ms/次")
+
+        # 管理员修改用户后，信任声明的旧令牌回退到按用户记录认证
+        trusting.update_user(user_id, {'project_access': []})
+        print(f"   修改用户后按记录认证: {trusting.verify_token(token, secret)['project_access'] == []}")
+        trusting.delete_user(user_id)
+        print(f"   删除用户后拒绝: {trusting.verify_token(token, secret) is None}")
+
+
+def bench_serve(args):
+    """压测对比：gunicorn同步worker（app.py）与uvicorn异步入口（asgi.py）在不同并发下的评论搜索延迟"""
+    import asyncio
+    import socket
+    import subprocess
+
+    import aiohttp
+    import jwt
+
+    secret = 'benchmark-secret-key-for-hs256-signing'
+    token = jwt.encode({'user_id': 1, 'username': 'admin', 'role': 'admin', 'ver': 0,
+                        'exp': int(time.time()) + 3600}, secret, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    async def run_level(url, concurrency):
+        latencies, errors = [], 0
+        remaining = iter(range(args.requests))
+
+        async def worker(session):
+            nonlocal errors
+            for i in remaining:
+                body = {'page': i % 5 + 1, 'page_size': 20}
+                start = time.perf_counter()
+                try:
+                    async with session.post(f"{url}/search/comments", json=body, headers=headers) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        timeout = aiohttp.ClientTimeout(total=120)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+            seconds = time.perf_counter() - start
+        latencies.sort()
+        percentile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+        return len(latencies) / seconds, percentile(0.5), percentile(0.99), errors
+
+    def wait_ready(url, process):
+        for _ in range(200):
+            if process.poll() is not None:
+                raise RuntimeError('服务启动失败')
+            try:
+                with urllib.request.urlopen(f"{url}/health", timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError('服务启动超时')
+
+    with FakeElasticsearch(latency=args.latency) as fake, tempfile.TemporaryDirectory() as tmp:
+        load_fake_comments(fake, args.rows, max(args.rows // 10, 1))
+        env = dict(os.environ, ELASTICSEARCH_HOST='127.0.0.1', ELASTICSEARCH_PORT=str(fake.port),
+                   SECRET_KEY=secret, USERS_DB=os.path.join(tmp, 'users.db'),
+                   SEARCH_CACHE_BACKEND='off', PYTHONWARNINGS='ignore')
+        root = os.path.dirname(os.path.abspath(__file__))
+
+        print(f"\n📊 评论搜索压测 ({args.workers} 个worker, ES延迟 {args.latency}s, "
+              f"每个并发级别 {args.requests} 次请求, 不使用结果缓存)")
+        for label, command in (
+            ('gunicorn同步', [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+                            '--bind', '127.0.0.1:{port}', 'app:app']),
+            # uvicorn --workers 继承的监听socket未设置TCP_NODELAY，keep-alive连接上每个响应多约40ms，
+            # 与部署方式一致使用gunicorn管理uvicorn worker
+            ('uvicorn异步', [sys.executable, '-m', 'gunicorn', '-k', 'uvicorn.workers.UvicornWorker',
+                           '--workers', str(args.workers), '--bind', '127.0.0.1:{port}', 'asgi:app'])
+        ):
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            process = subprocess.Popen([part.format(port=port) for part in command], cwd=root, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_ready(url, process)
+                for concurrency in args.concurrency:
+                    rps, p50, p99, errors = asyncio.run(run_level(url, concurrency))
+                    print(f"   {label:<12} 并发 {concurrency:>4}  {rps:8,.0f} 请求/秒  "
+                          f"p50 {p50:8.1f}ms  p99 {p99:8.1f}ms  失败 {errors}")
+            finally:
+                process.terminate()
+                process.wait()
+
+
+SEGMENT_VOCABULARY = [
+    '公务员', '考试', '经验', '分享', '上岸', '面试', '申论', '行测', '备考', '资料', '老师', '课程',
+    '真题', '解析', '技巧', '选调生', '事业单位', '教师', '编制', '省考', '国考', '报名', '岗位', '推荐',
+    '学习', '计划', '每天', '坚持', '加油', '谢谢', '讲得', '太好了', '终于', '明白', '我', '你', '的',
+    '了', '这个', '方法', '数量关系', '资料分析', '常识判断', '判断推理', '言语理解', '结构化', '模拟',
+    '成绩', '分数线', '进面', '体检', '政审', '公示', '录取', '工资', '待遇', '基层', '遴选', '笔试'
+]
+
+
+def generate_segment_corpus(rows, projects, nicknames, seed=11):
+    """合成中文文本：常用词与项目名、UP主昵称随机组合"""
+    rng = random.Random(seed)
+    names = projects + nicknames
+    texts = []
+    for _ in range(rows):
+        words = [rng.choice(SEGMENT_VOCABULARY) for _ in range(rng.randint(4, 20))]
+        if rng.random() < 0.3:
+            words.insert(rng.randint(0, len(words)), rng.choice(names))
+        texts.append(''.join(words) + rng.choice(['', '！', '。', '？', '～']))
+    return texts
+
+
+def standard_tokens(text):
+    """近似ES标准分析器：中文按单字切分，字母数字按词切分"""
+    import re
+    return re.findall(r'[\u4e00-\u9fff]|[a-z0-9]+', text.lower())
+
+
+def build_postings(token_lists):
+    postings = {}
+    for doc_id, tokens in enumerate(token_lists):
+        for token in set(tokens):
+            postings.setdefault(token, []).append(doc_id)
+    return postings
+
+
+def run_match_queries(postings, queries, tokenize):
+    """operator=or 的match查询：合并各词的倒排表并按命中词数打分，返回 (平均耗时ms, 平均命中数, 扫描记录数)"""
+    hits_total = scanned = 0
+    start = time.perf_counter()
+    for query in queries:
+        scores = {}
+        for token in set(tokenize(query)):
+            docs = postings.get(token, [])
+            scanned += len(docs)
+            for doc_id in docs:
+                scores[doc_id] = scores.get(doc_id, 0) + 1
+        sorted(scores.items(), key=lambda item: -item[1])[:10]
+        hits_total += len(scores)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(queries) * 1000, hits_total / len(queries), scanned // len(queries)
+
+
+def bench_segment(args):
+    """对比标准分析器（按字）与jieba预分词的索引规模、查询延迟，以及分词的并行吞吐量"""
+    from services.text_segmenter import TextSegmenter
+
+    rng = random.Random(5)
+    projects = ['巨书', '康江文', '华图教育', '中公教育', '粉笔公考']
+    nicknames = [f"{rng.choice(['上岸', '备考', '行测', '申论'])}{rng.choice(['小王', '学姐', '老李', '君'])}{i}"
+                 for i in range(200)]
+    texts = generate_segment_corpus(args.rows, projects, nicknames)
+    queries = [''.join(rng.sample(SEGMENT_VOCABULARY, rng.randint(1, 3))) for _ in range(args.queries)]
+    queries += [rng.choice(projects + nicknames) for _ in range(args.queries // 4)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dictionary = os.path.join(tmp, 'segment_dict.txt')
+        serial = TextSegmenter(dictionary, user_dict='', workers=1)
+        words = serial.build_dictionary(projects + nicknames)
+        serial.tokenizer()
+
+        print(f"📊 jieba分词吞吐量 ({len(texts):,} 条文本, 自定义词典 {words} 个词, CPU {os.cpu_count()} 核)")
+        segmented, seconds = timed(serial.segment, texts)
+        report('单进程', len(texts), seconds)
+        parallel = TextSegmenter(dictionary, user_dict='', workers=args.workers, min_parallel=1)
+        parallel.segment(texts[:args.workers * 2])  # 启动工作进程
+        parallel_result, seconds = timed(parallel.segment, texts)
+        parallel.close()
+        report(f'{args.workers}进程', len(texts), seconds)
+        print(f"   结果一致: {parallel_result == segmented}")
+
+        standard_postings = build_postings([standard_tokens(text) for text in texts])
+        jieba_postings = build_postings([text.split(' ') for text in segmented])
+        cut_query = lambda query: serial.cut_query(query).split(' ')
+
+        print(f"\n📊 倒排索引规模与match查询 ({len(queries)} 个查询, operator=or)")
+        for label, postings, tokenize in (('标准(按字)', standard_postings, standard_tokens),
+                                          ('jieba预分词', jieba_postings, cut_query)):
+            records = sum(len(docs) for docs in postings.values())
+            latency, hits, scanned = run_match_queries(postings, queries, tokenize)
+            print(f"   {label:<10} 词项 {len(postings):6,} 个  倒排记录 {records:10,} 条  "
+                  f"查询 {latency:7.3f}ms  平均命中 {hits:9,.0f}  扫描记录 {scanned:9,}")
+
+        if args.es_url:
+            bench_segment_es(args.es_url, texts, segmented, queries, serial)
+
+
+def bench_segment_es(url, texts, segmented, queries, segmenter):
+    """在真实ES上对比两种映射的存储大小和查询耗时（took）"""
+    from elasticsearch import Elasticsearch, helpers
+
+    es = Elasticsearch(url, timeout=120)
+    variants = {
+        'bench_segment_standard': ({'content': {'type': 'text', 'analyzer': 'standard'}},
+                                   lambda i: {'content': texts[i]},
+                                   lambda query: {'match': {'content': query}}),
+        'bench_segment_jieba': ({'content_seg': {'type': 'text', 'analyzer': 'segmented'}},
+                                lambda i: {'content_seg': segmented[i]},
+                                lambda query: {'match': {'content_seg': segmenter.cut_query(query)}})
+    }
+    settings = {'number_of_shards': 1, 'number_of_replicas': 0,
+                'analysis': {'analyzer': {'segmented': {'type': 'custom', 'tokenizer': 'whitespace',
+                                                        'filter': ['lowercase']}}}}
+
+    print(f"\n📊 Elasticsearch实测 ({url})")
+    for index, (properties, make_doc, make_query) in variants.items():
+        es.indices.delete(index=index, ignore=[404])
+        es.indices.create(index=index, body={'settings': settings, 'mappings': {'properties': properties}})
+        try:
+            helpers.bulk(es, ({'_index': index, '_source': make_doc(i)} for i in range(len(texts))),
+                         chunk_size=5000)
+            es.indices.refresh(index=index)
+            es.indices.forcemerge(index=index, max_num_segments=1)
+            size = es.indices.stats(index=index, metric='store')['indices'][index]['total']['store']['size_in_bytes']
+            took = hits = 0
+            for query in queries:
+                response = es.search(index=index, body={'query': make_query(query), 'size': 10,
+                                                        'track_total_hits': True}, request_cache=False)
+                took += response['took']
+                hits += response['hits']['total']['value']
+            print(f"   {index:<24} 存储 {size / 1024 / 1024:8.2f}MB  "
+                  f"查询 {took / len(queries):6.2f}ms  平均命中 {hits / len(queries):9,.0f}")
+        finally:
+            es.indices.delete(index=index, ignore=[404])
+
+
+def bench_incremental(args):
+    """对比全量导入与增量导入（按导入清单跳过未变化的行）的耗时和写入量"""
+    from services.bulk_indexer import BulkIndexer
+    from services.import_manifest import ImportManifest
+
+    data_service = DataService()
+
+    with FakeElasticsearch(latency=args.latency) as fake, tempfile.TemporaryDirectory() as tmp:
+        video_file = os.path.join(tmp, 'videos.csv')
+        generate_video_csv(video_file, args.rows)
+        index = 'videos_search'
+
+        def run(incremental):
+            manifest = ImportManifest('videos', os.path.join(tmp, 'manifest'))
+            manifest.begin(index, incremental)
+            manifest.start_file(video_file)
+            data_service.manifest = manifest
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = BulkIndexer(fake.client()).run(data_service.read_csv_chunks(video_file),
+                                                            data_service.build_video_actions)
+            finally:
+                data_service.manifest = None
+            report = manifest.finish_file()
+            manifest.save()
+            return result, report
+
+        print(f"\n📊 视频导入 ({args.rows:,} 行, 变化 {args.changed:.1%}, 每次请求延迟 {args.latency}s)")
+        (result, _), seconds = timed(run, False)
+        report('全量', args.rows, seconds)
+
+        # 修改部分行（更新点赞数和修改时间），并追加同样数量的新视频
+        frame = pd.read_csv(video_file, low_memory=False)
+        changed = int(len(frame) * args.changed)
+        rows = random.Random(3).sample(range(len(frame)), changed)
+        frame.loc[rows, 'liked_count'] += 1
+        frame.loc[rows, 'last_modify_ts'] += 1000
+        added = frame.iloc[:changed].copy()
+        added['video_id'] += 10 ** 9
+        pd.concat([frame, added]).to_csv(video_file, index=False)
+
+        (result, summary), seconds = timed(run, True)
+        report('增量', len(frame) + changed, seconds)
+        print(f"   增量写入 {summary['written']:,} 行（应为 {changed * 2:,}），跳过 {summary['skipped']:,} 行，"
+              f"模拟ES文档数 {sum(fake.stats()['docs'].values()):,}")
+
+
+def bench_shards(args):
+    """对比多个分片文件依次导入与进程池并行读取、转换的耗时（本地模拟ES）"""
+    from services.bulk_load import BulkLoadSession
+    from services.elasticsearch_service import ElasticsearchService
+    from services.import_manifest import ImportManifest
+    from services.import_sources import ImportSources, available_cpus
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shard_dir = os.path.join(tmp, 'shards')
+        os.makedirs(shard_dir)
+        for i in range(args.shards):
+            generate_video_csv(os.path.join(shard_dir, f'videos_{i:03d}.csv'), args.rows, seed=i)
+        total = args.shards * args.rows
+
+        # 进程数不超过可用CPU数（见 ImportSources），单核机器上只能测出串行结果
+        workers_used = ImportSources({}, workers=args.workers).workers
+        print(f"\n📊 分片导入 ({args.shards} 个文件 × {args.rows:,} 行, 可用CPU {available_cpus()} 核)")
+        if workers_used < args.workers:
+            print(f"⚠️ 可用CPU只有 {available_cpus()} 核，并行进程数限制为 {workers_used}")
+        for workers in sorted({1, workers_used}):
+            with FakeElasticsearch() as fake:
+                es_service = ElasticsearchService()
+                es_service.es = fake.client()
+                data_service = DataService(es_service)
+                data_service.import_sources = ImportSources({'videos': [shard_dir]}, upload_dir=os.path.join(tmp, 'up'),
+                                                            workers=workers)
+                data_service.manifest = ImportManifest('videos', os.path.join(tmp, f'manifest_{workers}'))
+                data_service.manifest.begin('videos_search')
+                load = BulkLoadSession('videos_search', 'live')
+                with contextlib.redirect_stdout(io.StringIO()):
+                    _, seconds = timed(data_service.import_files, 'videos',
+                                       data_service.import_sources.resolve('videos'), load)
+                report(f'{workers}进程', total, seconds)
+                print(f"   已写入文档: {sum(fake.stats()['docs'].values()):,}")
+
+
+def bench_staging(args):
+    """对比直接读取CSV与读取列式暂存文件（Parquet）的导入转换、查找索引构建耗时和磁盘占用"""
+    from services.columnar_stage import ColumnarStage
+
+    data_service = DataService()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_file = os.path.join(tmp, 'videos.csv')
+        generate_video_csv(video_file, args.rows)
+        csv_stage = ColumnarStage(data_service.import_sources, data_service.normalize_chunk)
+        csv_stage.enabled = False
+        parquet_stage = ColumnarStage(data_service.import_sources, data_service.normalize_chunk,
+                                      os.path.join(tmp, 'staged'))
+        if not parquet_stage.enabled:
+            print("⚠️ 未安装pyarrow或 IMPORT_STAGING 不为parquet，无法对比")
+            return
+
+        def transform(stage):
+            data_service.staging = stage
+            return [action for chunk in data_service.read_source_chunks(video_file, VIDEO_SOURCE_COLUMNS)
+                    for action in data_service.build_video_actions(chunk)]
+
+        def build_lookup(stage, name):
+            data_service.staging = stage
+            store = LookupStore(os.path.join(tmp, name), string_columns=VIDEO_INFO_COLUMNS)
+            store.build(data_service._iter_video_lookup_frames([video_file]), 'video_id')
+            return store
+
+        print(f"\n📊 视频导入转换 ({args.rows:,} 行)")
+        with contextlib.redirect_stdout(io.StringIO()):
+            csv_actions, t_csv = timed(transform, csv_stage)
+            # 第一次读取时解析CSV，同时写入暂存文件
+            _, t_convert = timed(transform, parquet_stage)
+            staged_actions, t_staged = timed(transform, parquet_stage)
+        report('CSV', args.rows, t_csv)
+        report('首次暂存', args.rows, t_convert)
+        report('Parquet', args.rows, t_staged)
+
+        print("\n📊 视频查找索引构建（只读取5列）")
+        with contextlib.redirect_stdout(io.StringIO()):
+            csv_store, t_csv = timed(build_lookup, csv_stage, 'index_csv')
+            staged_store, t_staged = timed(build_lookup, parquet_stage, 'index_staged')
+        report('CSV', args.rows, t_csv)
+        report('Parquet', args.rows, t_staged)
+
+        staged_size = sum(os.path.getsize(os.path.join(tmp, 'staged', name))
+                          for name in os.listdir(os.path.join(tmp, 'staged')) if name.endswith('.parquet'))
+        probe = [str(100000000 + i) for i in range(0, args.rows, 7)]
+        consistent = csv_actions == staged_actions and csv_store.lookup(probe) == staged_store.lookup(probe)
+        print(f"\n   CSV {os.path.getsize(video_file) / 1024 / 1024:.1f} MB, "
+              f"Parquet {staged_size / 1024 / 1024:.1f} MB, 结果一致: {consistent}")
+
+
+def main():
+    # 项目沿用body参数写法，忽略客户端的弃用提示
+    warnings.filterwarnings('ignore', category=DeprecationWarning)
+    parser = argparse.ArgumentParser(description='性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    transform = subparsers.add_parser('transform', help='CSV到文档的转换吞吐量')
+    transform.add_argument('--rows', type=int, default=200000, help='评论行数（视频为其1/10）')
+    transform.set_defaults(func=bench_transform)
+
+    video_index = subparsers.add_parser('video-index', help='视频查找索引的构建、加载与查询')
+    video_index.add_argument('--rows', type=int, default=500000, help='视频行数')
+    video_index.set_defaults(func=bench_video_index)
+
+    parents = subparsers.add_parser('parents', help='评论搜索的父评论批量查询（本地模拟ES）')
+    parents.add_argument('--rows', type=int, default=20000, help='评论行数')
+    parents.add_argument('--page-size', type=int, default=100, help='每页条数')
+    parents.add_argument('--latency', type=float, default=0.005, help='模拟每个请求的延迟（秒）')
+    parents.set_defaults(func=bench_parents)
+
+    bulk_parser = subparsers.add_parser('bulk', help='批量写入吞吐量（本地模拟ES）')
+    bulk_parser.add_argument('--rows', type=int, default=200000, help='评论行数')
+    bulk_parser.add_argument('--threads', type=int, default=4, help='写入线程数')
+    bulk_parser.add_argument('--latency', type=float, default=0.1, help='模拟每个请求的延迟（秒）')
+    bulk_parser.add_argument('--reject', type=float, default=0.02, help='模拟429拒绝的文档比例')
+    bulk_parser.add_argument('--batch-bytes', type=int, default=2 * 1024 * 1024, help='每批最大字节数')
+    bulk_parser.set_defaults(func=bench_bulk)
+
+    export = subparsers.add_parser('export', help='搜索结果流式导出（本地模拟ES）')
+    export.add_argument('--rows', type=int, default=20000, help='评论行数')
+    export.add_argument('--format', choices=['csv', 'ndjson'], default='csv', help='导出格式')
+    export.add_argument('--page-size', type=int, default=100, help='逐页查询的每页条数')
+    export.add_argument('--batch-size', type=int, default=5000, help='流式导出每批条数')
+    export.add_argument('--latency', type=float, default=0.005, help='模拟每个请求的延迟（秒）')
+    export.set_defaults(func=bench_export)
+
+    projects_parser = subparsers.add_parser('projects', help='项目列表的目录缓存（本地模拟ES）')
+    projects_parser.add_argument('--rows', type=int, default=20000, help='视频行数')
+    projects_parser.add_argument('--projects', type=int, default=250, help='项目数')
+    projects_parser.add_argument('--latency', type=float, default=0.02, help='模拟每个请求的延迟（秒）')
+    projects_parser.set_defaults(func=bench_projects)
+
+    dashboard = subparsers.add_parser('dashboard', help='可视化统计的请求合并（本地模拟ES）')
+    dashboard.add_argument('--rows', type=int, default=20000, help='视频行数')
+    dashboard.add_argument('--projects', type=int, default=8, help='项目数')
+    dashboard.add_argument('--latency', type=float, default=0.02, help='模拟每个请求的延迟（秒）')
+    dashboard.add_argument('--repeat', type=int, default=5, help='每种方式重复次数')
+    dashboard.set_defaults(func=bench_dashboard)
+
+    auth = subparsers.add_parser('auth', help='认证装饰器的用户查询')
+    auth.add_argument('--users', type=int, default=5000, help='用户数')
+    auth.add_argument('--requests', type=int, default=2000, help='请求次数')
+    auth.add_argument('--updates', type=int, default=50, help='修改用户次数')
+    auth.set_defaults(func=bench_auth)
+
+    serve = subparsers.add_parser('serve', help='同步与异步入口的并发压测（本地模拟ES）')
+    serve.add_argument('--rows', type=int, default=5000, help='评论行数')
+    serve.add_argument('--workers', type=int, default=4, help='服务worker数')
+    serve.add_argument('--latency', type=float, default=0.05, help='模拟每个ES请求的延迟（秒）')
+    serve.add_argument('--requests', type=int, default=400, help='每个并发级别的请求数')
+    serve.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 128], help='并发级别')
+    serve.set_defaults(func=bench_serve)
+
+    segment = subparsers.add_parser('segment', help='中文预分词的索引规模、查询延迟与并行吞吐量')
+    segment.add_argument('--rows', type=int, default=50000, help='文本条数')
+    segment.add_argument('--queries', type=int, default=200, help='查询数')
+    segment.add_argument('--workers', type=int, default=4, help='分词进程数')
+    segment.add_argument('--es-url', default=None, help='可选：在真实Elasticsearch上实测存储大小和查询耗时')
+    segment.set_defaults(func=bench_segment)
+
+    incremental = subparsers.add_parser('incremental', help='全量与增量导入的耗时对比（本地模拟ES）')
+    incremental.add_argument('--rows', type=int, default=100000, help='视频行数')
+    incremental.add_argument('--changed', type=float, default=0.01, help='变化行（及新增行）的比例')
+    incremental.add_argument('--latency', type=float, default=0.02, help='模拟每个请求的延迟（秒）')
+    incremental.set_defaults(func=bench_incremental)
+
+    shards = subparsers.add_parser('shards', help='多分片文件的串行与并行导入（本地模拟ES）')
+    shards.add_argument('--shards', type=int, default=8, help='分片文件数')
+    shards.add_argument('--rows', type=int, default=20000, help='每个分片的视频行数')
+    shards.add_argument('--workers', type=int, default=4, help='并行进程数')
+    shards.set_defaults(func=bench_shards)
+
+    staging = subparsers.add_parser('staging', help='CSV与列式暂存文件（Parquet）的读取耗时对比')
+    staging.add_argument('--rows', type=int, default=200000, help='视频行数')
+    staging.set_defaults(func=bench_staging)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,11 +16,11 @@ def main():
     
     # 初始化服务
     es_service = ElasticsearchService()
-    data_service = DataService()
+    data_service = DataService(es_service)
     
     try:
         # 检查Elasticsearch连接
-        es_client = es_service.get_es_client()
+        es_client = es_service.require_es_client()
         if not es_client.info():
             print("❌ 无法连接到Elasticsearch，请确保Elasticsearch正在运行")
             return False
@@ -0,0 +1,162 @@
+import asyncio
+import os
+
+from elasticsearch import NotFoundError
+
+from services.elasticsearch_service import (
+    PARENT_SOURCE_FIELDS, ElasticsearchService, SearchPaginationError
+)
+
+
+class AsyncElasticsearchService(ElasticsearchService):
+    """基于 AsyncElasticsearch 的搜索服务，供ASGI入口使用
+
+    查询构建、游标签名、结果缓存和父评论缓存与同步版本共用，只有ES请求改为await，
+    等待ES响应期间事件循环可以处理其他请求。异步方法均以 _async 结尾，
+    不覆盖同名的同步方法，继承的同步代码路径仍然得到同步结果。
+    异步客户端由共享的客户端工厂创建，请求计入ES指标和熔断；熔断期间不发请求，返回空结果。
+    搜索结果缓存（可能访问Redis或版本号文件）和查询构建（可能读取索引映射）在线程中执行。
+    需要安装 aiohttp（elasticsearch[async]）。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.async_es = None
+
+    async def get_async_es_client(self):
+        """获取异步客户端，懒加载（需在事件循环中调用）；熔断期间抛出ConnectionError"""
+        if not await asyncio.to_thread(self.client_factory.ensure_available):
+            raise ConnectionError('Elasticsearch不可用，稍后重试')
+        if self.async_es is None:
+            # 单个worker内的并发请求共用连接池
+            self.async_es = self.client_factory.create_async_client(
+                maxsize=int(os.getenv('ES_ASYNC_POOL_SIZE', 50)))
+        return self.async_es
+
+    async def close(self):
+        if self.async_es is not None:
+            await self.async_es.close()
+            self.async_es = None
+
+    async def search_videos_async(self, search_params, current_user):
+        """搜索视频"""
+        cache_key, cached = await asyncio.to_thread(self.search_cache.get, self.video_index,
+                                                    search_params, current_user)
+        if cached is not None:
+            return cached
+
+        try:
+            es = await self.get_async_es_client()
+            query, sort, highlight = await asyncio.to_thread(self.video_search_spec, search_params, current_user)
+            response, page_info = await self.paged_search_async(es, self.video_index, query, sort, highlight,
+                                                                search_params)
+            result = dict(page_info, results=self._hits_to_results(response['hits']['hits']))
+            await asyncio.to_thread(self.search_cache.set, cache_key, result)
+            return result
+
+        except SearchPaginationError:
+            raise
+        except Exception as e:
+            print(f"搜索失败: {str(e)}")
+            return self._empty_page(search_params)
+
+    async def search_comments_async(self, search_params, current_user):
+        """搜索评论"""
+        cache_key, cached = await asyncio.to_thread(self.search_cache.get, self.comment_index,
+                                                    search_params, current_user)
+        if cached is not None:
+            return dict(cached, metrics={'es_calls': 0, 'cache_hit': True})
+
+        try:
+            es = await self.get_async_es_client()
+            query, sort, highlight = await asyncio.to_thread(self.comment_search_spec, search_params, current_user)
+            metrics = {'es_calls': 0}
+            response, page_info = await self.paged_search_async(es, self.comment_index, query, sort, highlight,
+                                                                search_params, metrics)
+            results = self._hits_to_results(response['hits']['hits'])
+
+            parent_ids = self._parent_ids_to_fetch(results)
+            resolved = True
+            if parent_ids:
+                parents = await self.get_parent_comments_info_async(parent_ids, metrics)
+                resolved = self._attach_parents(results, parents)
+
+            result = dict(page_info, results=results)
+            # 带父评论占位信息的页面不缓存
+            if resolved:
+                await asyncio.to_thread(self.search_cache.set, cache_key, result)
+            return dict(result, metrics=metrics)
+
+        except SearchPaginationError:
+            raise
+        except Exception as e:
+            print(f"搜索失败: {str(e)}")
+            return self._empty_page(search_params)
+
+    async def paged_search_async(self, es, index, query, sort, highlight, search_params, metrics=None):
+        if self._is_cursor_request(search_params):
+            return await self._cursor_search_async(es, index, query, sort, highlight, search_params, metrics)
+
+        body, page, page_size = self._page_request(query, sort, highlight, search_params)
+        if metrics is not None:
+            metrics['es_calls'] += 1
+        response = await es.search(index=index, body=body)
+        return response, self._page_info(response, page, page_size)
+
+    async def _cursor_search_async(self, es, index, query, sort, highlight, search_params, metrics=None):
+        state = self._cursor_state(index, query, sort, search_params)
+        if state['page'] == 0:
+            state['pit'] = await self.open_point_in_time_async(es, index, metrics)
+        body = self._cursor_body(state, query, sort, highlight)
+
+        if metrics is not None:
+            metrics['es_calls'] += 1
+        try:
+            if state['pit']:
+                response = await es.search(body=body)
+            else:
+                response = await es.search(index=index, body=body)
+        except NotFoundError:
+            raise SearchPaginationError('游标已过期，请重新查询')
+
+        page_info, finished_pit = self._cursor_page(state, response)
+        if finished_pit:
+            await self.close_point_in_time_async(es, finished_pit)
+        return response, page_info
+
+    async def open_point_in_time_async(self, es, index, metrics=None):
+        try:
+            if metrics is not None:
+                metrics['es_calls'] += 1
+            return (await es.open_point_in_time(index=index, keep_alive=self.pit_keep_alive))['id']
+        except Exception as e:
+            print(f"⚠️ 打开PIT失败，使用普通search_after: {str(e)}")
+            return None
+
+    async def close_point_in_time_async(self, es, pit):
+        try:
+            await es.close_point_in_time(body={'id': pit})
+        except Exception as e:
+            print(f"⚠️ 关闭PIT失败: {str(e)}")
+
+    async def get_parent_comments_info_async(self, parent_comment_ids, metrics=None):
+        """批量获取父评论信息"""
+        parents, missing = self._cached_parents(parent_comment_ids, metrics)
+        if not missing:
+            return parents
+
+        try:
+            es = await self.get_async_es_client()
+            if metrics is not None:
+                metrics['es_calls'] = metrics.get('es_calls', 0) + 1
+            response = await es.mget(
+                index=self.comment_index,
+                body={'ids': missing},
+                _source_includes=PARENT_SOURCE_FIELDS
+            )
+            self._store_parents(parents, missing, response)
+        except Exception as e:
+            print(f"获取父评论信息失败: {str(e)}")
+            self._failed_parents(parents, missing)
+
+        return parents
@@ -1,162 +1,148 @@
 import hashlib
-import json
 import os
+import time
 from datetime import datetime
 
+import jwt
+
+from services.cache import TTLCache
+from services.user_store import create_user_store
+
 class AuthService:
-    def __init__(self):
-        self.users_file = 'data/users.json'
-        self.ensure_data_dir()
-        self.init_default_users()
+    """用户管理
     
-    def ensure_data_dir(self):
-        """确保数据目录存在"""
-        os.makedirs('data', exist_ok=True)
+    用户保存在可替换的用户存储中（USER_STORE，默认SQLite: data/users.db，
+    首次启动时自动迁移 data/users.json；json: 沿用 data/users.json）。
+    
+    令牌验证结果按签名缓存（TOKEN_CACHE_TTL 秒，不超过令牌本身的过期时间）。
+    AUTH_TRUST_CLAIMS=true 时，令牌中的权限声明在用户版本号（每次修改用户时递增）和创建时间
+    都未变化前直接使用；管理员修改或删除用户后，旧令牌回退到按用户记录认证。
+    创建时间同时校验，删除用户后即使ID被新用户使用（如旧的JSON存储），旧令牌的声明也不会被信任。
+    """
+    
+    def __init__(self, store=None, trust_claims=None):
+        self.store = store or create_user_store()
+        if trust_claims is None:
+            trust_claims = os.getenv('AUTH_TRUST_CLAIMS', 'false').lower() == 'true'
+        self.trust_claims = trust_claims
+        self.token_cache = TTLCache(
+            maxsize=int(os.getenv('TOKEN_CACHE_SIZE', 10000)),
+            ttl=int(os.getenv('TOKEN_CACHE_TTL', 60))
+        )
+        self.init_default_users()
     
     def init_default_users(self):
         """初始化默认用户"""
-        if not os.path.exists(self.users_file):
-            default_users = [
-                {
-                    'id': 1,
-                    'username': 'admin',
-                    'password_hash': self.hash_password('admin123'),
-                    'role': 'admin',
-                    'project_access': [],  # 管理员可以访问所有项目
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'id': 2,
-                    'username': 'user1',
-                    'password_hash': self.hash_password('user123'),
-                    'role': 'user',
-                    'project_access': ['巨书', '康江文'],  # 普通用户只能访问指定项目
-                    'created_at': datetime.now().isoformat()
-                }
-            ]
-            self.save_users(default_users)
+        default_users = [
+            {
+                'id': 1,
+                'username': 'admin',
+                'password_hash': self.hash_password('admin123'),
+                'role': 'admin',
+                'project_access': [],  # 管理员可以访问所有项目
+                'created_at': datetime.now().isoformat()
+            },
+            {
+                'id': 2,
+                'username': 'user1',
+                'password_hash': self.hash_password('user123'),
+                'role': 'user',
+                'project_access': ['巨书', '康江文'],  # 普通用户只能访问指定项目
+                'created_at': datetime.now().isoformat()
+            }
+        ]
+        self.store.seed(default_users)
     
     def hash_password(self, password):
         """密码哈希"""
         return hashlib.sha256(password.encode()).hexdigest()
     
-    def load_users(self):
-        """加载用户数据"""
-        try:
-            with open(self.users_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-    
-    def save_users(self, users):
-        """保存用户数据"""
-        with open(self.users_file, 'w', encoding='utf-8') as f:
-            json.dump(users, f, ensure_ascii=False, indent=2)
-    
     def authenticate_user(self, username, password):
         """用户认证"""
-        users = self.load_users()
-        password_hash = self.hash_password(password)
-        
-        for user in users:
-            if user['username'] == username and user['password_hash'] == password_hash:
-                return user
+        user = self.store.get_by_username(username)
+        if user and user['password_hash'] == self.hash_password(password):
+            return user
         return None
     
     def get_user_by_id(self, user_id):
         """根据ID获取用户"""
-        users = self.load_users()
-        for user in users:
-            if user['id'] == user_id:
-                return user
-        return None
+        return self.store.get(user_id)
+    
+    def token_claims(self, user):
+        """登录令牌中除过期时间外的声明"""
+        claims = {
+            'user_id': user['id'],
+            'username': user['username'],
+            'role': user['role'],
+            'ver': user.get('version', 0)
+        }
+        if self.trust_claims:
+            claims['project_access'] = list(user.get('project_access', []))
+            claims['created'] = user.get('created_at')
+        return claims
+    
+    def verify_token(self, token, secret_key):
+        """验证令牌并返回当前用户，用户不存在时返回None
+        
+        令牌无效或过期时抛出 jwt.InvalidTokenError / jwt.ExpiredSignatureError。
+        """
+        signature = token.rsplit('.', 1)[-1]
+        claims = self.token_cache.get(signature)
+        if claims is None or claims.get('_token') != token:
+            claims = jwt.decode(token, secret_key, algorithms=['HS256'])
+            # 缓存时间不超过令牌剩余有效期
+            remaining = claims['exp'] - time.time() if 'exp' in claims else self.token_cache.ttl
+            self.token_cache.set(signature, dict(claims, _token=token),
+                                 ttl=max(0, min(self.token_cache.ttl, remaining)))
+        elif 'exp' in claims and claims['exp'] <= time.time():
+            raise jwt.ExpiredSignatureError('Signature has expired')
+        
+        if self.trust_claims and 'project_access' in claims and 'ver' in claims and 'created' in claims:
+            if self.store.token_state(claims['user_id']) == (claims['ver'], claims['created']):
+                return {
+                    'id': claims['user_id'],
+                    'username': claims['username'],
+                    'role': claims['role'],
+                    'project_access': list(claims['project_access'])
+                }
+        return self.get_user_by_id(claims['user_id'])
     
     def get_all_users(self):
         """获取所有用户（不包含密码）"""
-        users = self.load_users()
         safe_users = []
-        for user in users:
-            safe_user = user.copy()
-            safe_user.pop('password_hash', None)
-            safe_users.append(safe_user)
+        for user in self.store.all():
+            user.pop('password_hash', None)
+            safe_users.append(user)
         return safe_users
     
     def create_user(self, user_data):
         """创建新用户"""
-        users = self.load_users()
-        
-        # 检查用户名是否已存在
-        for user in users:
-            if user['username'] == user_data['username']:
-                raise ValueError('用户名已存在')
-        
-        # 生成新的用户ID
-        max_id = max([user['id'] for user in users]) if users else 0
-        new_user = {
-            'id': max_id + 1,
+        new_user = self.store.create({
             'username': user_data['username'],
             'password_hash': self.hash_password(user_data['password']),
             'role': user_data.get('role', 'user'),
             'project_access': user_data.get('project_access', []),
             'created_at': datetime.now().isoformat()
-        }
-        
-        users.append(new_user)
-        self.save_users(users)
+        })
         
         # 返回安全的用户信息（不包含密码）
-        safe_user = new_user.copy()
-        safe_user.pop('password_hash')
-        return safe_user
+        new_user.pop('password_hash')
+        return new_user
     
     def update_user(self, user_id, user_data):
         """更新用户信息"""
-        users = self.load_users()
+        changes = {key: user_data[key] for key in ('username', 'role', 'project_access') if key in user_data}
+        if 'password' in user_data:
+            changes['password_hash'] = self.hash_password(user_data['password'])
         
-        for i, user in enumerate(users):
-            if user['id'] == user_id:
-                # 更新用户信息
-                if 'username' in user_data:
-                    # 检查用户名是否与其他用户冲突
-                    for other_user in users:
-                        if other_user['id'] != user_id and other_user['username'] == user_data['username']:
-                            raise ValueError('用户名已存在')
-                    user['username'] = user_data['username']
-                
-                if 'password' in user_data:
-                    user['password_hash'] = self.hash_password(user_data['password'])
-                
-                if 'role' in user_data:
-                    user['role'] = user_data['role']
-                
-                if 'project_access' in user_data:
-                    user['project_access'] = user_data['project_access']
-                
-                user['updated_at'] = datetime.now().isoformat()
-                users[i] = user
-                self.save_users(users)
-                
-                # 返回安全的用户信息
-                safe_user = user.copy()
-                safe_user.pop('password_hash')
-                return safe_user
+        user = self.store.update(user_id, changes)
+        if user is None:
+            return None
         
-        return None
+        # 返回安全的用户信息
+        user.pop('password_hash')
+        return user
     
     def delete_user(self, user_id):
         """删除用户"""
-        users = self.load_users()
-        
-        for i, user in enumerate(users):
-            if user['id'] == user_id:
-                if user['role'] == 'admin':
-                    # 检查是否是最后一个管理员
-                    admin_count = sum(1 for u in users if u['role'] == 'admin')
-                    if admin_count <= 1:
-                        raise ValueError('不能删除最后一个管理员')
-                
-                users.pop(i)
-                self.save_users(users)
-                return True
-        
-        return False 
\ No newline at end of file
+        return self.store.delete(user_id)
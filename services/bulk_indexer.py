@@ -0,0 +1,264 @@
+import os
+import queue
+import threading
+import time
+
+from elasticsearch.helpers import expand_action, streaming_bulk
+from elasticsearch.serializer import JSONSerializer
+
+# 队列结束标记
+_DONE = object()
+
+
+class ImportCancelled(Exception):
+    """导入任务被取消"""
+
+
+class PipelineStats:
+    """流水线各阶段的吞吐量统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.success = 0
+        self.failed = 0
+        self.errors = []
+        self.started_at = time.perf_counter()
+
+    def record(self, stage, items, seconds, nbytes=0):
+        """累计某阶段处理的条目数、耗时和字节数"""
+        with self._lock:
+            entry = self.stages.setdefault(stage, {'items': 0, 'seconds': 0.0, 'bytes': 0})
+            entry['items'] += items
+            entry['seconds'] += seconds
+            entry['bytes'] += nbytes
+
+    def record_result(self, success, failed, errors):
+        with self._lock:
+            self.success += success
+            self.failed += failed
+            # 只保留前5个失败的文档
+            self.errors.extend(errors[:max(0, 5 - len(self.errors))])
+
+    def summary(self):
+        """汇总结果，per_second为该阶段忙碌时间内的吞吐量"""
+        elapsed = time.perf_counter() - self.started_at
+        stages = {}
+        for stage, entry in self.stages.items():
+            stages[stage] = {
+                'items': entry['items'],
+                'seconds': round(entry['seconds'], 3),
+                'bytes': entry['bytes'],
+                'per_second': round(entry['items'] / entry['seconds'], 1) if entry['seconds'] > 0 else 0
+            }
+        return {
+            'success': self.success,
+            'failed': self.failed,
+            'errors': self.errors,
+            'elapsed': round(elapsed, 3),
+            'docs_per_second': round(self.success / elapsed, 1) if elapsed > 0 else 0,
+            'stages': stages
+        }
+
+
+class BulkIndexer:
+    """流水线式批量索引器
+
+    读取 → 转换 → 按字节分批 → 多线程写入，各阶段之间用有界队列衔接，
+    下游变慢时上游会阻塞等待（背压），内存占用不随文件大小增长。
+    写入线程通过streaming_bulk发送，遇到429拒绝时按指数退避重试。
+    动作在转换阶段序列化为NDJSON行，同时得到批次字节数，写入时不再重复序列化。
+    """
+
+    def __init__(self, client, thread_count=None, queue_size=None, max_batch_bytes=None,
+                 max_batch_docs=None, max_retries=None, initial_backoff=None, max_backoff=None,
+                 request_timeout=60):
+        self.client = client
+        self.thread_count = thread_count or int(os.getenv('BULK_THREAD_COUNT', 4))
+        self.queue_size = queue_size or int(os.getenv('BULK_QUEUE_SIZE', 8))
+        self.max_batch_bytes = max_batch_bytes or int(os.getenv('BULK_MAX_BYTES', 5 * 1024 * 1024))
+        self.max_batch_docs = max_batch_docs or int(os.getenv('BULK_MAX_DOCS', 5000))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('BULK_MAX_RETRIES', 5))
+        self.initial_backoff = initial_backoff if initial_backoff is not None else float(os.getenv('BULK_INITIAL_BACKOFF', 1))
+        self.max_backoff = max_backoff if max_backoff is not None else float(os.getenv('BULK_MAX_BACKOFF', 60))
+        self.request_timeout = request_timeout
+        self.serializer = getattr(getattr(client, 'transport', None), 'serializer', None) or JSONSerializer()
+
+    def run(self, reader, transform=None, progress=None):
+        """执行流水线
+
+        reader: 生成数据块的迭代器（如pd.read_csv的分块）
+        transform: 将数据块转换为批量动作列表的函数；为None时数据块本身就是动作列表
+        progress: 可选的进度对象，每个批次写入后调用 advance(success, failed)，
+                  读取每个数据块前检查 cancelled()，已取消则抛出ImportCancelled
+        """
+        stats = PipelineStats()
+        stop = threading.Event()
+        failures = []
+
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        batch_queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._guard, args=(self._read_stage, failures, stop,
+                                                       reader, chunk_queue, stats, stop, progress),
+                             name='bulk-reader', daemon=True),
+            threading.Thread(target=self._guard, args=(self._transform_stage, failures, stop,
+                                                       chunk_queue, batch_queue, transform, stats, stop),
+                             name='bulk-transform', daemon=True)
+        ]
+        for i in range(self.thread_count):
+            threads.append(threading.Thread(target=self._guard, args=(self._send_stage, failures, stop,
+                                                                      batch_queue, stats, stop, progress),
+                                             name=f'bulk-sender-{i}', daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        # 转换阶段结束后为每个写入线程放一个结束标记
+        threads[1].join()
+        for _ in range(self.thread_count):
+            self._put(batch_queue, _DONE, stop, force=True)
+        for thread in threads:
+            thread.join()
+
+        if failures:
+            raise failures[0]
+
+        result = stats.summary()
+        self._print_summary(result)
+        return result
+
+    def _guard(self, stage, failures, stop, *args):
+        """运行某个阶段，出错时记录异常并通知其他阶段停止"""
+        try:
+            stage(*args)
+        except Exception as e:
+            failures.append(e)
+            stop.set()
+
+    def _put(self, target, item, stop, force=False):
+        """放入有界队列；队列满时阻塞，直到下游消费或流水线停止"""
+        while True:
+            if stop.is_set() and not force:
+                return False
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if stop.is_set() and force:
+                    # 停止后清空队列，保证结束标记能送达
+                    try:
+                        target.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _get(self, source, stop):
+        while True:
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return _DONE
+
+    def _read_stage(self, reader, chunk_queue, stats, stop, progress):
+        iterator = iter(reader)
+        try:
+            while not stop.is_set():
+                if progress is not None and progress.cancelled():
+                    raise ImportCancelled()
+                start = time.perf_counter()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                stats.record('read', len(chunk), time.perf_counter() - start)
+                if not self._put(chunk_queue, chunk, stop):
+                    break
+        finally:
+            self._put(chunk_queue, _DONE, stop, force=True)
+
+    def _transform_stage(self, chunk_queue, batch_queue, transform, stats, stop):
+        batch = []
+        batch_bytes = 0
+
+        while True:
+            chunk = self._get(chunk_queue, stop)
+            if chunk is _DONE:
+                break
+
+            start = time.perf_counter()
+            actions = transform(chunk) if transform else chunk
+            stats.record('transform', len(actions), time.perf_counter() - start)
+
+            # 序列化后按字节大小切分批次
+            for action in actions:
+                action, size = self._encode(action)
+                if batch and (batch_bytes + size > self.max_batch_bytes or len(batch) >= self.max_batch_docs):
+                    if not self._put(batch_queue, (batch, batch_bytes), stop):
+                        return
+                    batch, batch_bytes = [], 0
+                batch.append(action)
+                batch_bytes += size
+
+        if batch and not stop.is_set():
+            self._put(batch_queue, (batch, batch_bytes), stop)
+
+    def _send_stage(self, batch_queue, stats, stop, progress):
+        while True:
+            item = self._get(batch_queue, stop)
+            if item is _DONE:
+                return
+            batch, batch_bytes = item
+
+            start = time.perf_counter()
+            success, failed, errors = self._send_batch(batch)
+            stats.record('index', len(batch), time.perf_counter() - start, batch_bytes)
+            stats.record_result(success, failed, errors)
+            if progress is not None:
+                progress.advance(success, failed)
+
+    def _send_batch(self, batch):
+        """发送一个批次，429拒绝的文档由streaming_bulk按指数退避重试"""
+        success = 0
+        errors = []
+        for ok, item in streaming_bulk(
+            self.client,
+            batch,
+            chunk_size=len(batch),
+            max_chunk_bytes=self.max_batch_bytes * 2,
+            raise_on_error=False,
+            max_retries=self.max_retries,
+            initial_backoff=self.initial_backoff,
+            max_backoff=self.max_backoff,
+            request_timeout=self.request_timeout,
+            expand_action_callback=_pre_encoded
+        ):
+            if ok:
+                success += 1
+            else:
+                errors.append(item)
+        return success, len(errors), errors
+
+    def _encode(self, action):
+        """将动作序列化为 (元数据行, 文档行)，返回序列化结果和字节数（含换行符）"""
+        meta, data = expand_action(action)
+        meta = self.serializer.dumps(meta)
+        size = len(meta.encode('utf-8')) + 1
+        if data is not None:
+            data = self.serializer.dumps(data)
+            size += len(data.encode('utf-8')) + 1
+        return (meta, data), size
+
+    def _print_summary(self, result):
+        print(f"成功插入: {result['success']} 条, 失败: {result['failed']} 条, "
+              f"耗时 {result['elapsed']}s ({result['docs_per_second']} 条/秒)")
+        for stage, entry in result['stages'].items():
+            print(f"   {stage}: {entry['items']} 项, 忙碌 {entry['seconds']}s, {entry['per_second']} 项/秒")
+        if result['errors']:
+            print(f"失败的文档: {result['errors']}")
+
+
+def _pre_encoded(action):
+    """转换阶段已序列化好的动作原样交给streaming_bulk，字符串不会被再次序列化"""
+    return action
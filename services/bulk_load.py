@@ -0,0 +1,157 @@
+import contextlib
+import json
+import os
+import time
+
+BULK_LOAD = 'bulk_load'
+LIVE = 'live'
+
+
+class BulkLoadSession:
+    """一次导入的写入统计"""
+
+    def __init__(self, index, mode):
+        self.index = index
+        self.mode = mode
+        self.docs = 0
+        self.failed = 0
+        self.write_seconds = 0.0
+        self.finalize_seconds = 0.0
+
+    def add(self, result):
+        """累加 BulkIndexer.run 的结果"""
+        if result:
+            self.docs += result['success']
+            self.failed += result['failed']
+            self.write_seconds += result['elapsed']
+
+    def report(self):
+        total = self.write_seconds + self.finalize_seconds
+        return {
+            'mode': self.mode,
+            'docs': self.docs,
+            'failed': self.failed,
+            'write_seconds': round(self.write_seconds, 3),
+            'finalize_seconds': round(self.finalize_seconds, 3),
+            'docs_per_second': round(self.docs / self.write_seconds, 1) if self.write_seconds else 0,
+            # 包含恢复设置、段合并和刷新的整体吞吐量
+            'overall_docs_per_second': round(self.docs / total, 1) if total else 0
+        }
+
+
+class BulkLoadMode:
+    """导入期间的索引设置切换
+
+    全量导入时关闭自动刷新（refresh_interval=-1）并去掉副本，写入结束后恢复原设置、
+    段合并（仅导入成功时）并刷新。导入失败或取消时同样恢复设置。
+    原设置在切换前写入 data/bulk_load/<索引>.json，进程中途退出时，下次导入据此恢复，
+    不会把 -1/0 误当作原设置。
+    """
+
+    def __init__(self, es_service, state_dir='data/bulk_load'):
+        self.es_service = es_service
+        self.state_dir = state_dir
+        self.enabled = os.getenv('IMPORT_BULK_LOAD', 'true').lower() == 'true'
+        # 导入后合并到的段数，0表示不合并
+        self.max_num_segments = int(os.getenv('BULK_LOAD_MAX_SEGMENTS', 1))
+        self.merge_timeout = int(os.getenv('BULK_LOAD_MERGE_TIMEOUT', 3600))
+
+    @contextlib.contextmanager
+    def session(self, index, enabled=None):
+        """在with块内以批量导入设置写入index，产出 BulkLoadSession
+
+        enabled为False时按普通模式写入（如只写入少量变化行的增量导入），只统计吞吐量。
+        """
+        enabled = self.enabled if enabled is None else enabled and self.enabled
+        session = BulkLoadSession(index, BULK_LOAD if enabled else LIVE)
+        original = self._enter(index) if enabled else None
+        if original is None:
+            session.mode = LIVE
+
+        succeeded = False
+        try:
+            yield session
+            succeeded = True
+        finally:
+            start = time.perf_counter()
+            if original is not None:
+                self._exit(index, original, merge=succeeded)
+            session.finalize_seconds = time.perf_counter() - start
+            self._print_report(session)
+
+    def _enter(self, index):
+        """记录原设置并切换为批量导入设置，失败时返回None（按普通模式导入）"""
+        es = self.es_service.require_es_client()
+        try:
+            original = self._load_state(index)
+            if original is None:
+                original = self._current_settings(es, index)
+                self._save_state(index, original)
+            es.indices.put_settings(index=index, body={
+                'index': {'refresh_interval': '-1', 'number_of_replicas': 0}
+            })
+            print(f"⚡ {index} 进入批量导入模式（原设置: 刷新间隔 {original['refresh_interval'] or '默认'}, "
+                  f"副本 {original['number_of_replicas']}）")
+            return original
+        except Exception as e:
+            print(f"⚠️ 切换批量导入设置失败，按普通模式导入: {str(e)}")
+            return None
+
+    def _exit(self, index, original, merge):
+        """恢复原设置；导入成功时段合并，最后刷新使数据可见"""
+        es = self.es_service.require_es_client()
+        try:
+            # refresh_interval为None时恢复为集群默认值
+            es.indices.put_settings(index=index, body={'index': original})
+            self._clear_state(index)
+            print(f"✅ {index} 已恢复索引设置")
+        except Exception as e:
+            print(f"❌ 恢复 {index} 的索引设置失败，下次导入时重试: {str(e)}")
+
+        try:
+            if merge and self.max_num_segments > 0:
+                es.indices.forcemerge(index=index, max_num_segments=self.max_num_segments,
+                                      request_timeout=self.merge_timeout)
+            es.indices.refresh(index=index)
+        except Exception as e:
+            print(f"⚠️ {index} 段合并/刷新失败: {str(e)}")
+
+    def _current_settings(self, es, index):
+        response = es.indices.get_settings(index=index, flat_settings=True)
+        # 索引别名可能指向具体的版本索引，取其设置
+        settings = next(iter(response.values()))['settings']
+        return {
+            'refresh_interval': settings.get('index.refresh_interval'),
+            'number_of_replicas': int(settings.get('index.number_of_replicas', 1))
+        }
+
+    def _print_report(self, session):
+        report = session.report()
+        print(f"📈 {session.index} 导入吞吐量（{report['mode']}模式）: {report['docs']} 条, "
+              f"写入 {report['write_seconds']}s ({report['docs_per_second']} 条/秒), "
+              f"收尾 {report['finalize_seconds']}s, 整体 {report['overall_docs_per_second']} 条/秒")
+
+    def _state_path(self, index):
+        return os.path.join(self.state_dir, f"{index}.json")
+
+    def _load_state(self, index):
+        try:
+            with open(self._state_path(index), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            print(f"⚠️ 发现 {index} 上次导入未恢复的设置，以其为原设置")
+            return state
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_state(self, index, settings):
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = f"{self._state_path(index)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(settings, f)
+        os.replace(tmp_path, self._state_path(index))
+
+    def _clear_state(self, index):
+        try:
+            os.remove(self._state_path(index))
+        except FileNotFoundError:
+            pass
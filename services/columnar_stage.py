@@ -0,0 +1,160 @@
+import glob
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# 暂存格式版本：规整规则变化时递增，旧版本的暂存文件不再使用
+STAGE_VERSION = 1
+
+
+class ColumnarStage:
+    """导入数据源的列式暂存（Parquet）
+
+    每个CSV文件只解析一次：第一次读取时按读取方要求的块大小（默认 IMPORT_CHUNK_SIZE）分块解析，时间戳列统一转换为秒级int64
+    （缺失为null），整数列转换为int64，其余列按与CSV导入一致的str()结果保存为字符串，
+    边转换边产出数据块，全部读完后原子写入 data/staged/<内容sha1>.v<版本>.parquet。
+    之后的导入、视频查找索引和评论摘要索引的构建都读取暂存文件，只读取需要的列。
+
+    源文件 -> 内容哈希的对应关系保存在 data/staged/sources/ 下（每个源文件一个小文件，并行导入的
+    工作进程互不覆盖），大小和修改时间未变时不重新计算哈希；内容相同的文件共用一份暂存文件。
+    IMPORT_STAGING=csv 或未安装pyarrow时按原方式直接分块读取CSV（不规整，由转换函数逐列转换）。
+    """
+
+    def __init__(self, sources, normalize, path='data/staged'):
+        self.sources = sources
+        # 数据块 -> 规整后的数据块（时间戳、整数列已转换）
+        self.normalize = normalize
+        self.path = path
+        self.enabled = os.getenv('IMPORT_STAGING', 'parquet') == 'parquet' and pq is not None
+        self.compression = os.getenv('IMPORT_STAGING_COMPRESSION', 'zstd')
+        if os.getenv('IMPORT_STAGING', 'parquet') == 'parquet' and pq is None:
+            print("⚠️ 未安装pyarrow，导入直接读取CSV")
+
+    def read(self, source, columns=None, chunk_size=None, sha1=None):
+        """分块读取源文件，产出数据块；columns为需要的列（不存在的列忽略）"""
+        chunk_size = chunk_size or int(os.getenv('IMPORT_CHUNK_SIZE', 5000))
+        if not self.enabled:
+            yield from self._read_csv(source, columns, chunk_size)
+            return
+
+        staged_path = self.staged_path(source, sha1)
+        if os.path.exists(staged_path):
+            yield from self._read_staged(staged_path, columns, chunk_size)
+        else:
+            yield from self._convert(source, staged_path, columns, chunk_size)
+
+    def count_rows(self, source, sha1=None):
+        """已暂存的文件返回准确行数，否则返回None"""
+        if not self.enabled:
+            return None
+        try:
+            return pq.ParquetFile(self.staged_path(source, sha1)).metadata.num_rows
+        except (FileNotFoundError, OSError):
+            return None
+
+    def staged_path(self, source, sha1=None):
+        """源文件对应的暂存文件路径"""
+        record_path = self._record_path(source)
+        record = self._load_record(record_path)
+        stat = os.stat(source)
+        if sha1 is None:
+            sha1 = self.sources.content_hash(source, record)
+        if record is None or record.get('sha1') != sha1 or record.get('size') != stat.st_size \
+                or record.get('mtime') != stat.st_mtime:
+            self._save_record(record_path, {'source': source, 'sha1': sha1,
+                                            'size': stat.st_size, 'mtime': stat.st_mtime})
+        return os.path.join(self.path, f'{sha1}.v{STAGE_VERSION}.parquet')
+
+    def prune(self):
+        """删除源文件已不存在的记录，以及不再被任何源文件引用的暂存文件"""
+        if not os.path.isdir(self.path):
+            return
+        referenced = set()
+        for record_path in glob.glob(os.path.join(self.path, 'sources', '*.json')):
+            record = self._load_record(record_path)
+            if record is None or not os.path.isfile(record.get('source', '')):
+                os.remove(record_path)
+            else:
+                referenced.add(f"{record['sha1']}.v{STAGE_VERSION}.parquet")
+        for staged_path in glob.glob(os.path.join(self.path, '*.parquet')):
+            if os.path.basename(staged_path) not in referenced:
+                os.remove(staged_path)
+                print(f"🗑️ 删除不再使用的暂存文件 {os.path.basename(staged_path)}")
+
+    def _convert(self, source, staged_path, columns, chunk_size):
+        """按chunk_size分块解析CSV并写入暂存文件，同时产出规整后的数据块；未读完（出错或提前结束）时不保留"""
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = os.path.join(self.path, f'.{os.path.basename(staged_path)}.{os.getpid()}.tmp')
+        writer = None
+        try:
+            for chunk in self._read_csv(source, None, chunk_size):
+                chunk = self.normalize(chunk)
+                table = self._to_table(chunk, writer.schema if writer is not None else None)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema, compression=self.compression)
+                writer.write_table(table)
+                yield chunk if columns is None else chunk[[name for name in columns if name in chunk.columns]]
+            if writer is not None:
+                writer.close()
+                writer = None
+                os.replace(tmp_path, staged_path)
+                print(f"🗜️ 已暂存 {os.path.basename(source)} -> {os.path.basename(staged_path)}")
+        finally:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _read_csv(self, source, columns, chunk_size):
+        wanted = set(columns) if columns is not None else None
+        for chunk in pd.read_csv(source, chunksize=chunk_size, low_memory=False,
+                                 usecols=None if wanted is None else lambda column: column in wanted):
+            yield chunk
+
+    def _read_staged(self, staged_path, columns, chunk_size):
+        parquet = pq.ParquetFile(staged_path)
+        if columns is not None:
+            available = set(parquet.schema_arrow.names)
+            columns = [name for name in columns if name in available]
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+
+    def _to_table(self, chunk, schema=None):
+        """规整后的数据块转换为Arrow表：数值列为int64，其余列为字符串"""
+        arrays, fields = [], []
+        for name in chunk.columns:
+            series = chunk[name]
+            if pd.api.types.is_numeric_dtype(series):
+                # 时间戳缺失为NaN，写入为null
+                arrays.append(pa.array(series, type=pa.int64(), from_pandas=True))
+            else:
+                arrays.append(pa.array(series, type=pa.string()))
+            fields.append(pa.field(name, arrays[-1].type))
+        table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+        return table if schema is None else table.cast(schema)
+
+    def _record_path(self, source):
+        name = hashlib.sha1(os.path.realpath(source).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, 'sources', f'{name}.json')
+
+    def _load_record(self, record_path):
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_record(self, record_path, record):
+        os.makedirs(os.path.dirname(record_path), exist_ok=True)
+        tmp_path = f'{record_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, record_path)
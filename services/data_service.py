@@ -1,74 +1,215 @@
+import contextlib
+import functools
+import pickle
+import shutil
+import tempfile
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import os
-import uuid
+import hashlib
+import time
 from services.elasticsearch_service import ElasticsearchService
+from services.bulk_indexer import BulkIndexer
+from services.columnar_stage import ColumnarStage
+from services.import_manifest import ImportManifest
+from services.import_sources import ImportSources
+from services.job_service import ImportJobService
+from services.lookup_store import LookupStore
+from services.rollup_store import RollupStore
+from services.text_segmenter import TextSegmenter
+
+# 默认数据源（另有上传目录），可由 IMPORT_VIDEO_SOURCES / IMPORT_COMMENT_SOURCES 配置，见 ImportSources
+VIDEO_FILES = [
+    '1747748467790_dbexport_209215447/2025-05-20-21-41-08_EXPORT_CSV_19274722_345_bilibili_video_0.csv'
+]
+
+ACCOUNT_FILE = '账号大整合3.2xlsx_已提取UID.csv'
+
+COMMENT_FILES = [
+    '1747748467790_dbexport_209215447/2025-05-20-21-41-11_EXPORT_CSV_19274722_637_bilibili_video_comment_1.csv'
+]
+
+# 视频查找索引中保存的列（评论导入时按video_id关联）
+VIDEO_INFO_COLUMNS = ['project_id', 'video_title', 'video_url',
+                      'video_uploader_nickname', 'video_uploader_uid']
+
+# 评论摘要索引中保存的列（denormalized模式下写入回复的parent_comment_info）
+COMMENT_SUMMARY_STRING_COLUMNS = ['nickname', 'content']
+COMMENT_SUMMARY_INT_COLUMNS = ['like_count', 'create_time']
+
+# 暂存（见 ColumnarStage）时规整的列：时间戳统一为秒级，计数转换为整数，其余列保存为字符串
+TIMESTAMP_COLUMNS = {'add_ts', 'last_modify_ts', 'create_time'}
+INT_COLUMNS = {'liked_count', 'video_play_count', 'video_danmaku', 'video_comment',
+               'sub_comment_count', 'like_count'}
+
+# 导入时从数据源读取的列
+VIDEO_SOURCE_COLUMNS = ['id', 'user_id', 'nickname', 'avatar', 'add_ts', 'last_modify_ts', 'video_id',
+                        'video_type', 'title', 'desc', 'create_time', 'liked_count', 'video_play_count',
+                        'video_danmaku', 'video_comment', 'video_url', 'video_cover_url', 'source_keyword']
+COMMENT_SOURCE_COLUMNS = ['id', 'user_id', 'nickname', 'avatar', 'add_ts', 'last_modify_ts', 'comment_id',
+                          'video_id', 'content', 'create_time', 'sub_comment_count', 'parent_comment_id',
+                          'like_count']
 
 class DataService:
-    def __init__(self):
-        self.es_service = ElasticsearchService()
+    def __init__(self, es_service=None):
+        self.es_service = es_service or ElasticsearchService()
         self.user_project_mapping = None
+        self.account_index_dir = 'data/account_index'
+        self._account_stat = None
+        # 账号映射新鲜度检查（CURRENT文件、账号文件stat）的最小间隔，逐行查找时不必每次都检查
+        self.account_check_interval = float(os.getenv('ACCOUNT_CHECK_INTERVAL', 5))
+        self._account_checked_at = None
+        self.job_service = None
+        self.video_lookup = None
+        self.video_index_dir = 'data/video_index'
+        self.comment_summaries = None
+        self.comment_index_dir = 'data/comment_index'
+        # 父评论信息模式: lookup（搜索时批量查询）或 denormalized（导入时写入回复文档）
+        self.parent_comment_mode = os.getenv('PARENT_COMMENT_MODE', 'lookup')
+        self.parent_excerpt_length = int(os.getenv('PARENT_EXCERPT_LENGTH', 200))
+        # 看板数据来源: aggregation（每次聚合查询）或 rollup（导入时维护的 项目×天 预聚合）
+        self.dashboard_source = os.getenv('DASHBOARD_SOURCE', 'aggregation')
+        self.rollups = RollupStore()
+        # 重建期间写入的预聚合副本，切换别名后才保存（见 reindex）
+        self.staged_rollups = None
+        # 导入期间启用的jieba预分词器（见 text_segmentation）
+        self.segmenter = None
+        # 重建期间 别名 -> 正在写入的新版本索引（见 reindex）
+        self.target_indices = {}
+        # 导入期间的增量导入清单（见 import_manifest）
+        self.manifest = None
+        self.import_manifest_dir = 'data/import_manifest'
+        # 上传文件的导入方式: incremental（跳过未变化的行）或 append（全部写入）
+        self.upload_mode = os.getenv('IMPORT_UPLOAD_MODE', 'incremental')
+        self.import_sources = ImportSources({'videos': VIDEO_FILES, 'comments': COMMENT_FILES})
+        # 数据源只解析一次，之后读取列式暂存文件
+        self.staging = ColumnarStage(self.import_sources, self.normalize_chunk)
         
     def load_user_project_mapping(self):
-        """加载用户ID到项目的映射关系"""
-        if self.user_project_mapping is not None:
-            return self.user_project_mapping
-            
-        account_file = '账号大整合3.2xlsx_已提取UID.csv'
-        self.user_project_mapping = {}
+        """加载用户ID到项目的映射关系
         
-        if os.path.exists(account_file):
+        映射编译为 data/account_index 下的查找索引，以mmap方式在各worker间只读共享。
+        账号文件的大小和修改时间未变、或内容哈希未变时直接复用；其他进程重建后自动切换。
+        距上次检查不足 ACCOUNT_CHECK_INTERVAL 秒时直接返回已加载的映射。
+        """
+        store = self.user_project_mapping
+        now = time.monotonic()
+        if store is not None and now - self._account_checked_at < self.account_check_interval:
+            return store
+        if (store is not None and store.is_current()
+                and self._account_stat == self._file_signature(ACCOUNT_FILE)):
+            self._account_checked_at = now
+            return store
+        
+        store = LookupStore(self.account_index_dir, string_columns=['project_id'])
+        if not (store.load() and self._account_index_valid(store)):
+            self._build_account_index(store)
+        
+        self._account_stat = self._file_signature(ACCOUNT_FILE)
+        self._account_checked_at = now
+        self.user_project_mapping = store
+        return store
+    
+    def reload_user_project_mapping(self):
+        """账号文件更新后重建映射
+        
+        新版本写入独立目录后原子切换，正在运行的导入继续读取已映射的旧版本，不会被阻塞。
+        """
+        store = LookupStore(self.account_index_dir, string_columns=['project_id'])
+        self._build_account_index(store)
+        self._account_stat = self._file_signature(ACCOUNT_FILE)
+        self._account_checked_at = time.monotonic()
+        self.user_project_mapping = store
+        # 视频查找索引中的项目归属随之失效
+        self.video_lookup = None
+        return store
+    
+    def _account_index_valid(self, store):
+        """大小和修改时间一致即有效；仅修改时间变化时再比较内容哈希"""
+        cached = store.extra.get('source')
+        current = self._file_signature(ACCOUNT_FILE)
+        if cached is None or current is None:
+            return cached == current
+        if cached['size'] == current['size'] and cached['mtime'] == current['mtime']:
+            return True
+        return cached['size'] == current['size'] and cached.get('sha1') == self._file_sha1(ACCOUNT_FILE)
+    
+    def _build_account_index(self, store):
+        """整列读取账号文件并编译为查找索引
+        
+        账号文件不经列式暂存：用户ID须按原文读取（dtype=str），暂存规整按类型推断后再str()，
+        数字ID会变成"123.0"之类的形式；且该文件只在内容变化时读取一次。
+        """
+        frame = pd.DataFrame({'user_id': pd.Series(dtype=object), 'project_id': pd.Series(dtype=object)})
+        source = self._file_signature(ACCOUNT_FILE)
+        
+        if source is not None:
             try:
-                df = pd.read_csv(account_file, low_memory=False)
-                
-                # 建立用户ID到项目的映射
-                for _, row in df.iterrows():
-                    user_id = str(row.get('用户ID', '')).strip()
-                    project = str(row.get('工作表', '')).strip()
-                    
-                    if user_id and project and user_id != 'nan' and project != 'nan':
-                        self.user_project_mapping[user_id] = project
-                
-                print(f"✅ 成功加载 {len(self.user_project_mapping)} 个用户的项目映射")
-                
-                # 打印项目统计
-                project_counts = {}
-                for project in self.user_project_mapping.values():
-                    project_counts[project] = project_counts.get(project, 0) + 1
-                
-                print("📊 项目分布:")
-                for project, count in sorted(project_counts.items()):
-                    print(f"   {project}: {count} 个用户")
-                    
+                df = pd.read_csv(ACCOUNT_FILE, dtype=str, keep_default_na=False,
+                                 usecols=lambda column: column in ('用户ID', '工作表'))
+                user_ids = df['用户ID'].str.strip()
+                projects = df['工作表'].str.strip()
+                valid = ~user_ids.isin(['', 'nan']) & ~projects.isin(['', 'nan'])
+                frame = pd.DataFrame({'user_id': user_ids[valid].to_numpy(dtype=object),
+                                      'project_id': projects[valid].to_numpy(dtype=object)})
+                source['sha1'] = self._file_sha1(ACCOUNT_FILE)
             except Exception as e:
                 print(f"⚠️ 加载用户项目映射失败: {str(e)}")
-                
-        return self.user_project_mapping
+        
+        store.build([frame], 'user_id', meta={'source': source})
+        print(f"✅ 成功加载 {len(store)} 个用户的项目映射")
+        
+        # 打印项目统计（仅在重建时）
+        project_counts = frame.drop_duplicates('user_id', keep='last')['project_id'].value_counts()
+        if len(project_counts):
+            print("📊 项目分布:")
+            for project, count in sorted(project_counts.items()):
+                print(f"   {project}: {count} 个用户")
+    
+    def _file_sha1(self, path):
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
     
     def get_user_project(self, user_id):
         """根据用户ID获取项目名称"""
-        if self.user_project_mapping is None:
-            self.load_user_project_mapping()
-            
-        return self.user_project_mapping.get(str(user_id), '未分类项目')
+        found = self.load_user_project_mapping().get(str(user_id))
+        return found['project_id'] if found else '未分类项目'
+    
+    def lookup_user_projects(self, user_ids):
+        """整列查找用户ID对应的项目，未命中的记为未分类项目"""
+        return self.load_user_project_mapping().lookup(user_ids, {'project_id': '未分类项目'})['project_id']
         
+    def get_job_service(self):
+        """获取后台导入任务服务"""
+        if self.job_service is None:
+            self.job_service = ImportJobService()
+        return self.job_service
+    
     def import_data_async(self, import_params):
-        """异步导入数据（返回任务ID）"""
-        task_id = str(uuid.uuid4())
-        
-        # 在实际生产环境中，这里应该使用Celery等任务队列
-        # 现在我们直接调用同步方法进行演示
-        try:
-            self.import_data_sync(import_params)
-            return task_id
-        except Exception as e:
-            print(f"数据导入失败: {str(e)}")
-            raise
+        """异步导入数据（返回任务ID），进度通过 get_import_job 查询"""
+        return self.get_job_service().submit(import_params)
+    
+    def get_import_job(self, task_id):
+        """获取导入任务状态和进度（执行进程已退出的任务标记为失败）"""
+        job_service = self.get_job_service()
+        return job_service.fail_if_stale(job_service.get_job(task_id))
+    
+    def cancel_import_job(self, task_id):
+        """取消导入任务"""
+        return self.get_job_service().cancel_job(task_id)
     
-    def import_data_sync(self, import_params):
-        """同步导入数据"""
+    def import_data_sync(self, import_params, progress=None):
+        """同步导入数据
+        
+        mode为reindex（默认）时导入到新版本索引后切换别名，导入期间搜索继续读取旧版本；
+        append时直接写入当前版本；incremental时写入当前版本，并跳过与上次导入相比未变化的行。
+        """
         data_type = import_params.get('data_type', 'all')  # 'videos', 'comments', 'all'
+        mode = import_params.get('mode') or os.getenv('IMPORT_MODE', 'reindex')
         
         # 加载用户项目映射
         self.load_user_project_mapping()
@@ -76,188 +217,677 @@ class DataService:
         # 确保索引存在
         self.es_service.create_indices()
         
+        if mode == 'reindex':
+            self.reindex(data_type, progress)
+            return
+        
+        incremental = mode == 'incremental'
         if data_type in ['videos', 'all']:
-            self.import_videos()
+            self.import_videos(progress, incremental=incremental)
         
         if data_type in ['comments', 'all']:
-            self.import_comments()
+            self.import_comments(progress, incremental=incremental)
     
-    def import_videos(self):
-        """导入视频数据"""
-        video_files = [
-            '1747748467790_dbexport_209215447/2025-05-20-21-41-08_EXPORT_CSV_19274722_345_bilibili_video_0.csv'
-        ]
-        
-        for video_file in video_files:
-            if os.path.exists(video_file):
-                print(f"正在导入视频文件: {video_file}")
-                
-                # 分块读取大文件
-                chunk_size = 1000
-                for chunk in pd.read_csv(video_file, chunksize=chunk_size, low_memory=False):
-                    self.process_video_chunk(chunk)
+    def write_index(self, alias):
+        """导入写入的索引：重建期间为新版本索引，否则为别名本身"""
+        return self.target_indices.get(alias, alias)
     
-    def process_video_chunk(self, df):
-        """处理视频数据块"""
-        bulk_data = []
+    def reindex(self, data_type='all', progress=None):
+        """蓝绿重建：在新版本索引中完成导入（批量导入设置），成功后原子切换别名
         
-        for _, row in df.iterrows():
-            # 根据用户ID获取项目
-            user_id = str(row.get('user_id', ''))
-            project_id = self.get_user_project(user_id)
+        导入失败或取消时丢弃新版本，别名仍指向旧版本；切换后按 INDEX_VERSIONS_KEEP 清理旧版本。
+        看板预聚合在副本中从清空的视频或评论部分开始计入，切换别名后才保存，失败时随新版本一起丢弃；
+        有写入失败的行时不保存副本，切换后提交重建任务。
+        """
+        imports = [(self.es_service.video_index, self.import_videos),
+                   (self.es_service.comment_index, self.import_comments)]
+        selected = {'videos': imports[:1], 'comments': imports[1:], 'all': imports}.get(data_type, [])
+        bodies = self.es_service.index_bodies()
+        aliases = self.es_service.aliases
+        
+        for alias, import_data in selected:
+            index = aliases.create_version(alias, bodies[alias])
+            print(f"🆕 重建 {alias}: 写入新版本 {index}")
+            self.target_indices[alias] = index
+            if self.rollups_enabled:
+                self.staged_rollups = RollupStore(self.rollups.path)
+                self.staged_rollups.reset(videos=alias == self.es_service.video_index,
+                                          comments=alias == self.es_service.comment_index)
+            try:
+                import_data(progress)
+            except BaseException:
+                aliases.discard(index)
+                raise
+            finally:
+                self.target_indices.pop(alias, None)
+                staged_rollups, self.staged_rollups = self.staged_rollups, None
             
-            # 清理和转换数据
-            doc = {
-                'id': str(row.get('id', '')),
-                'user_id': user_id,
-                'nickname': str(row.get('nickname', '')),
-                'avatar': str(row.get('avatar', '')),
-                'add_ts': self.convert_timestamp(row.get('add_ts')),
-                'last_modify_ts': self.convert_timestamp(row.get('last_modify_ts')),
-                'video_id': str(row.get('video_id', '')),
-                'video_type': str(row.get('video_type', 'video')),
-                'title': str(row.get('title', '')),
-                'desc': str(row.get('desc', '')),
-                'create_time': self.convert_timestamp(row.get('create_time')),
-                'liked_count': self.safe_int(row.get('liked_count', 0)),
-                'video_play_count': self.safe_int(row.get('video_play_count', 0)),
-                'video_danmaku': self.safe_int(row.get('video_danmaku', 0)),
-                'video_comment': self.safe_int(row.get('video_comment', 0)),
-                'video_url': str(row.get('video_url', '')),
-                'video_cover_url': str(row.get('video_cover_url', '')),
-                'source_keyword': str(row.get('source_keyword', '')),
-                'project_id': project_id
-            }
+            aliases.swap(alias, index)
+            if staged_rollups is not None:
+                staged_rollups.save()
+            elif self.rollups_enabled:
+                # 有写入失败的行，副本已丢弃（见 _finish_rollups），按新版本的实际数据重建
+                self.rebuild_rollups_async()
+            self.es_service.search_cache.invalidate(alias)
+            aliases.cleanup(alias)
+    
+    def index_versions(self):
+        """各别名的版本索引（文档数、是否为当前版本）"""
+        aliases = self.es_service.aliases
+        return {
+            'videos': aliases.describe(self.es_service.video_index),
+            'comments': aliases.describe(self.es_service.comment_index),
+            'keep': aliases.keep
+        }
+    
+    def rollback_index(self, data_type):
+        """把别名切换回上一个版本，返回切换到的索引
+        
+        看板预聚合记录的是最近一次导入的数据，回滚后提交后台任务从ES重建。
+        """
+        aliases = {'videos': self.es_service.video_index, 'comments': self.es_service.comment_index}
+        if data_type not in aliases:
+            raise ValueError(f'不支持的数据类型: {data_type}')
+        
+        index = self.es_service.aliases.rollback(aliases[data_type])
+        self.es_service.search_cache.invalidate(aliases[data_type])
+        if self.rollups_enabled:
+            self.rebuild_rollups_async()
+        return index
+    
+    def import_videos(self, progress=None, incremental=False):
+        """导入视频数据
+        
+        数据源见 ImportSources；incremental为True时跳过与上次导入相比未变化的行（见 ImportManifest）。
+        返回各文件的导入统计。
+        """
+        index = self.write_index(self.es_service.video_index)
+        load = None
+        completed = False
+        try:
+            # 增量导入只写入少量变化行，不切换批量导入设置
+            with self.es_service.bulk_load.session(index, enabled=not incremental) as load, \
+                    self.text_segmentation(index), \
+                    self.import_manifest('videos', index, incremental, progress) as manifest:
+                reports = self.import_files('videos', self.import_sources.resolve('videos'), load, progress)
+                # 有写入失败的行时不保存清单，下次导入重新比较
+                if load.failed == 0:
+                    manifest.save()
+                    completed = True
+            return reports
+        finally:
+            if progress is not None and load is not None:
+                progress.record_throughput('videos', load.report())
+            # 导入中途失败时已写入的数据同样需要让缓存失效
+            self.es_service.search_cache.invalidate(self.es_service.video_index)
+            if self.rollups_enabled:
+                self._finish_rollups(completed)
+    
+    def import_files(self, data_type, files, load, progress=None):
+        """按顺序导入一组文件，返回 {文件: 导入统计}
+        
+        内容（sha1）与已导入到该索引的文件相同的文件直接跳过。多个文件时在进程池中并行读取和转换，
+        转换结果暂存到磁盘，主进程按文件顺序写入，同ID文档始终以后面的文件为准。
+        """
+        manifest = self.manifest
+        name = {'videos': '视频', 'comments': '评论'}[data_type]
+        reports = {}
+        pending = []
+        hashes = {}
+        for path in files:
+            sha1 = self.import_sources.content_hash(path, manifest.files.get(path))
+            duplicate = manifest.imported(sha1) or hashes.get(sha1)
+            if duplicate:
+                print(f"⏭️ 跳过已导入的{name}文件: {path}"
+                      + ("（内容未变化）" if duplicate == path else f"（内容与 {duplicate} 相同）"))
+                reports[path] = {'rows': 0, 'written': 0, 'skipped': 0, 'duplicate_of': duplicate}
+                if progress is not None:
+                    progress.file_status(path, 'duplicate', duplicate_of=duplicate)
+                continue
+            hashes[sha1] = path
+            pending.append((path, sha1))
+            if progress is not None:
+                progress.file_status(path, 'pending')
+        
+        if progress is not None:
+            progress.set_stage(data_type, sum(self.count_source_rows(path, sha1) for path, sha1 in pending))
+        
+        if data_type == 'videos':
+            build = self.build_video_actions_with_rollups if self.rollups_enabled else self.build_video_actions
+            apply_rollups = self._apply_video_rollups
+            columns = VIDEO_SOURCE_COLUMNS
+        else:
+            build = self.build_comment_actions_with_rollups if self.rollups_enabled else self.build_comment_actions
+            apply_rollups = self._apply_comment_rollups
+            columns = COMMENT_SOURCE_COLUMNS
+        
+        def with_rollups(actions):
+            if self.rollups_enabled:
+                apply_rollups([action['_source'] for action in actions])
+            return actions
+        
+        staging = tempfile.mkdtemp(prefix=f'import_{data_type}_')
+        try:
+            if self.import_sources.workers > 1 and len(pending) > 1:
+                staged_files = self.import_sources.map_files(
+                    functools.partial(_stage_file, data_type, staging), pending,
+                    initializer=_init_stage_worker, initargs=(self.stage_worker_state(),))
+            else:
+                staged_files = ((item, None) for item in pending)
             
-            # 构建批量插入数据
-            bulk_data.append({
-                '_index': self.es_service.video_index,
-                '_id': doc['video_id'],  # 使用video_id作为文档ID实现去重
-                '_source': doc
-            })
+            for (path, sha1), staged in staged_files:
+                print(f"正在导入{name}文件: {path}")
+                if progress is not None:
+                    progress.file_status(path, 'importing')
+                if staged is None:
+                    # 分块读取大文件，流水线转换并写入
+                    manifest.start_file(path, sha1)
+                    result = self.get_bulk_indexer().run(self.read_source_chunks(path, columns, sha1=sha1), build,
+                                                         progress=progress)
+                    report = manifest.finish_file()
+                else:
+                    report, updates, staged_path = staged
+                    manifest.merge_file(path, report, updates)
+                    if progress is not None and report['skipped']:
+                        progress.skip(report['skipped'])
+                    result = self.get_bulk_indexer().run(self._read_staged(staged_path), with_rollups,
+                                                         progress=progress)
+                    os.remove(staged_path)
+                load.add(result)
+                reports[path] = report
+                if progress is not None:
+                    progress.file_status(path, 'done', rows=report['rows'], written=report['written'],
+                                         skipped=report['skipped'], failed=result['failed'])
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.staging.prune()
+        return reports
+    
+    def stage_file(self, data_type, staging, item):
+        """在导入进程池中读取并转换一个文件，动作块暂存到磁盘
+        
+        返回 (文件统计, 清单记录, 暂存文件)，看板预聚合和写入由主进程按文件顺序完成。
+        """
+        path, sha1 = item
+        if data_type == 'videos':
+            build, columns = self.build_video_actions, VIDEO_SOURCE_COLUMNS
+        else:
+            build, columns = self.build_comment_actions, COMMENT_SOURCE_COLUMNS
+        self.manifest.start_file(path, sha1)
+        staged_path = os.path.join(staging, f'{sha1}.pickle')
+        with open(staged_path, 'wb') as f:
+            for chunk in self.read_source_chunks(path, columns, sha1=sha1):
+                pickle.dump(build(chunk), f, protocol=pickle.HIGHEST_PROTOCOL)
+        report = self.manifest.finish_file()
+        return report, self.manifest.take_updates(), staged_path
+    
+    def _read_staged(self, staged_path):
+        """逐块读取 stage_file 暂存的动作"""
+        with open(staged_path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+    
+    def stage_worker_state(self):
+        """导入进程池工作进程重建转换环境所需的状态（可pickle，见 _init_stage_worker）
+        
+        查找索引只传目录，工作进程以mmap方式加载同一版本；清单随状态复制一份，工作进程中的写入记录交给主进程合并。
+        """
+        return {
+            'indices': (self.es_service.video_index, self.es_service.comment_index),
+            'target_indices': dict(self.target_indices),
+            'account_index_dir': self.account_index_dir,
+            'video_index_dir': self.video_index_dir if self.video_lookup is not None else None,
+            'comment_index_dir': self.comment_index_dir if self.comment_summaries is not None else None,
+            'parent_comment_mode': self.parent_comment_mode,
+            'staging_dir': self.staging.path,
+            'segmenter': None if self.segmenter is None else (self.segmenter.dictionary_path,
+                                                              self.segmenter.user_dict),
+            'manifest': self.manifest
+        }
+    
+    def list_import_sources(self):
+        """各类数据源展开后的文件，及其是否已导入到当前索引"""
+        result = {}
+        for data_type, alias in (('videos', self.es_service.video_index), ('comments', self.es_service.comment_index)):
+            manifest = ImportManifest(data_type, self.import_manifest_dir)
+            manifest.begin(self.es_service.aliases.current(alias) or alias)
+            result[data_type] = {'sources': self.import_sources.sources[data_type], 'files': []}
+            for path in self.import_sources.resolve(data_type):
+                imported_as = manifest.imported(self.import_sources.content_hash(path, manifest.files.get(path)))
+                entry = manifest.files.get(imported_as, {})
+                result[data_type]['files'].append({
+                    'path': path,
+                    'size': os.path.getsize(path),
+                    # 已导入的文件（内容相同的其他文件已导入时为该文件）
+                    'imported_as': imported_as,
+                    'imported_at': entry.get('imported_at'),
+                    'rows': entry.get('rows')
+                })
+        return result
+    
+    @contextlib.contextmanager
+    def import_manifest(self, data_type, index, incremental=False, progress=None):
+        """导入期间按清单比较每行的哈希，产出 ImportManifest；清单由调用方在全部写入成功后保存"""
+        manifest = ImportManifest(data_type, self.import_manifest_dir)
+        # 清单记录的是别名当前指向的实体索引
+        manifest.begin(self.es_service.aliases.current(index) or index, incremental, progress)
+        self.manifest = manifest
+        try:
+            yield manifest
+        finally:
+            self.manifest = None
+    
+    @contextlib.contextmanager
+    def text_segmentation(self, index):
+        """导入期间为带预分词字段的索引启用jieba分词
+        
+        自定义词典由项目名和UP主昵称生成，查询时使用同一词典；导入结束后关闭分词工作进程。
+        """
+        if self.segmenter is not None or not self.es_service.is_segmented(index):
+            yield
+            return
+        
+        segmenter = self.es_service.segmenter
+        segmenter.build_dictionary(self.segment_dictionary_words())
+        self.segmenter = segmenter
+        try:
+            yield
+        finally:
+            self.segmenter = None
+            segmenter.close()
+    
+    def segment_dictionary_words(self):
+        """分词词典的词语：项目名和UP主昵称"""
+        self.build_video_project_mapping()
+        return (self.load_user_project_mapping().unique_strings('project_id')
+                + self.video_lookup.unique_strings('project_id')
+                + self.video_lookup.unique_strings('video_uploader_nickname'))
+    
+    def process_video_chunk(self, df):
+        """处理视频数据块"""
+        bulk_data = self.build_video_actions(df)
         
         # 批量插入Elasticsearch
         if bulk_data:
             self.bulk_insert(bulk_data)
     
-    def import_comments(self):
-        """导入评论数据"""
-        comment_files = [
-            '1747748467790_dbexport_209215447/2025-05-20-21-41-11_EXPORT_CSV_19274722_637_bilibili_video_comment_1.csv'
-        ]
+    def build_video_actions(self, df):
+        """列式转换视频数据块，直接由列数组生成批量插入动作"""
+        user_ids = self._str_column(df, 'user_id')
+        
+        columns = {
+            'id': self._str_column(df, 'id'),
+            'user_id': user_ids,
+            'nickname': self._str_column(df, 'nickname'),
+            'avatar': self._str_column(df, 'avatar'),
+            'add_ts': self._timestamp_column(df, 'add_ts'),
+            'last_modify_ts': self._timestamp_column(df, 'last_modify_ts'),
+            'video_id': self._str_column(df, 'video_id'),
+            'video_type': self._str_column(df, 'video_type', 'video'),
+            'title': self._str_column(df, 'title'),
+            'desc': self._str_column(df, 'desc'),
+            'create_time': self._timestamp_column(df, 'create_time'),
+            'liked_count': self._int_column(df, 'liked_count'),
+            'video_play_count': self._int_column(df, 'video_play_count'),
+            'video_danmaku': self._int_column(df, 'video_danmaku'),
+            'video_comment': self._int_column(df, 'video_comment'),
+            'video_url': self._str_column(df, 'video_url'),
+            'video_cover_url': self._str_column(df, 'video_cover_url'),
+            'source_keyword': self._str_column(df, 'source_keyword'),
+            # 根据用户ID获取项目
+            'project_id': self.lookup_user_projects(user_ids)
+        }
+        
+        if self.manifest is not None:
+            # 增量导入：只保留新增或已变化的行，未变化的行也不再分词
+            columns = self.manifest.select(columns, 'video_id')
+        
+        if self.segmenter is not None:
+            # 标题和描述一起切分，一次分发到工作进程
+            rows = len(columns['title'])
+            segmented = self.segmenter.segment(columns['title'] + columns['desc'])
+            columns['title_seg'] = segmented[:rows]
+            columns['desc_seg'] = segmented[rows:]
+        
+        # 使用video_id作为文档ID实现去重
+        return self._columns_to_actions(self.write_index(self.es_service.video_index), columns, 'video_id')
+    
+    def import_comments(self, progress=None, incremental=False):
+        """导入评论数据
         
+        denormalized模式下分两遍处理：第一遍构建comment_id到评论摘要的磁盘索引，
+        第二遍写入时为每条回复附带父评论快照，搜索时无需再查询父评论。
+        incremental为True时跳过未变化的行，返回各文件的导入统计。
+        """
         # 首先构建视频ID到项目的映射
         self.build_video_project_mapping()
         
+        comment_files = self.import_sources.resolve('comments')
+        if self.parent_comment_mode == 'denormalized':
+            self.build_comment_summary_index(comment_files)
+        
+        index = self.write_index(self.es_service.comment_index)
+        load = None
+        completed = False
+        try:
+            with self.es_service.bulk_load.session(index, enabled=not incremental) as load, \
+                    self.text_segmentation(index), \
+                    self.import_manifest('comments', index, incremental, progress) as manifest:
+                reports = self.import_files('comments', comment_files, load, progress)
+                if load.failed == 0:
+                    manifest.save()
+                    completed = True
+            return reports
+        finally:
+            if progress is not None and load is not None:
+                progress.record_throughput('comments', load.report())
+            self.comment_summaries = None
+            self.es_service.search_cache.invalidate(self.es_service.comment_index)
+            if self.rollups_enabled:
+                self._finish_rollups(completed)
+    
+    def build_comment_summary_index(self, comment_files):
+        """第一遍：流式读取评论文件，构建comment_id到评论摘要的磁盘索引
+        
+        只读取摘要所需的列，字符串直接写入磁盘，内存占用与评论内容大小无关。
+        """
+        print("🔗 构建评论摘要索引...")
+        store = LookupStore(self.comment_index_dir,
+                            string_columns=COMMENT_SUMMARY_STRING_COLUMNS,
+                            int_columns=COMMENT_SUMMARY_INT_COLUMNS,
+                            intern=False)
+        store.build(self._iter_comment_summary_frames(comment_files), 'comment_id',
+                    meta={'excerpt_length': self.parent_excerpt_length})
+        self.comment_summaries = store
+        print(f"✅ 评论摘要索引构建完成: {len(store)} 条评论")
+    
+    def _iter_comment_summary_frames(self, comment_files):
+        """读取评论文件中构建摘要索引所需的列，内容截取为摘要"""
+        wanted = ['comment_id', 'nickname', 'content', 'like_count', 'create_time']
         for comment_file in comment_files:
-            if os.path.exists(comment_file):
-                print(f"正在导入评论文件: {comment_file}")
-                
-                # 分块读取大文件
-                chunk_size = 1000
-                for chunk in pd.read_csv(comment_file, chunksize=chunk_size, low_memory=False):
-                    self.process_comment_chunk(chunk)
+            for chunk in self.read_source_chunks(comment_file, wanted, chunk_size=50000):
+                frame = pd.DataFrame({
+                    'comment_id': self._str_column(chunk, 'comment_id'),
+                    'nickname': self._str_column(chunk, 'nickname'),
+                    'content': pd.Series(self._str_column(chunk, 'content'), dtype=object)
+                        .str.slice(0, self.parent_excerpt_length),
+                    'like_count': self._int_column(chunk, 'like_count'),
+                    # 缺失的时间记为-1
+                    'create_time': [-1 if value is None else value
+                                    for value in self._timestamp_column(chunk, 'create_time')]
+                })
+                yield frame[~frame['comment_id'].isin(['', 'nan'])]
+    
+    @property
+    def rollups_enabled(self):
+        return self.dashboard_source == 'rollup'
+    
+    def build_video_actions_with_rollups(self, df):
+        """转换视频数据块，同时把该块计入看板预聚合"""
+        actions = self.build_video_actions(df)
+        self._apply_video_rollups([action['_source'] for action in actions])
+        return actions
+    
+    def build_comment_actions_with_rollups(self, df):
+        """转换评论数据块，同时把该块计入看板预聚合"""
+        actions = self.build_comment_actions(df)
+        self._apply_comment_rollups([action['_source'] for action in actions])
+        return actions
+    
+    def _finish_rollups(self, completed):
+        """导入结束后处理看板预聚合
+        
+        预聚合在转换时（写入ES之前）计入，全部行写入成功时才保存；导入失败、取消或有写入失败的行时
+        丢弃本次计入的变化。重建期间副本随之丢弃（由 reindex 决定是否重建），
+        否则ES中已有部分写入的数据，提交后台任务从ES重建。
+        """
+        if completed:
+            if self.staged_rollups is None:
+                self.rollups.save()
+            return
+        if self.staged_rollups is not None:
+            self.staged_rollups.discard()
+            self.staged_rollups = None
+            return
+        self.rollups.discard()
+        print("⚠️ 导入未全部写入，看板预聚合未保存，已提交重建任务")
+        self.rebuild_rollups_async()
+    
+    def _rollup_store(self):
+        """导入计入的预聚合：重建期间为副本"""
+        return self.staged_rollups if self.staged_rollups is not None else self.rollups
+    
+    def _apply_video_rollups(self, sources):
+        if sources:
+            self._rollup_store().apply_videos([source['video_id'] for source in sources],
+                                              [source.get('project_id') or '未分类项目' for source in sources],
+                                              [source.get('create_time') for source in sources],
+                                              [source.get('video_play_count') or 0 for source in sources])
+    
+    def _apply_comment_rollups(self, sources):
+        if sources:
+            self._rollup_store().apply_comments([source['comment_id'] for source in sources],
+                                                [source.get('project_id') or '未分类项目' for source in sources],
+                                                [source.get('create_time') for source in sources])
+    
+    def rebuild_rollups(self, progress=None):
+        """从ES中的现有数据全量重建看板预聚合（首次启用或数据不一致时使用）
+        
+        在后台任务中执行（见 rebuild_rollups_async）：计入空白副本，扫描完成后才保存，
+        失败或取消时保留原有预聚合。
+        """
+        from services.bulk_indexer import ImportCancelled
+        from services.export_service import ExportService
+        
+        exporter = ExportService(self.es_service)
+        es = self.es_service.require_es_client()
+        staged_rollups = RollupStore(self.rollups.path)
+        staged_rollups.reset()
+        self.staged_rollups = staged_rollups
+        counts = {}
+        try:
+            for data_type, index, id_field, fields, apply in (
+                ('videos', self.es_service.video_index, 'video_id',
+                 ['video_id', 'project_id', 'create_time', 'video_play_count'], self._apply_video_rollups),
+                ('comments', self.es_service.comment_index, 'comment_id',
+                 ['comment_id', 'project_id', 'create_time'], self._apply_comment_rollups)
+            ):
+                counts[data_type] = 0
+                if progress is not None:
+                    progress.set_stage(data_type, es.count(index=index)['count'])
+                for hits in exporter.iter_hits(index, {"match_all": {}}, [{id_field: {"order": "asc"}}],
+                                               source=fields):
+                    if progress is not None and progress.cancelled():
+                        raise ImportCancelled('看板预聚合重建已取消')
+                    apply([hit['_source'] for hit in hits])
+                    counts[data_type] += len(hits)
+                    if progress is not None:
+                        progress.advance(len(hits))
+        finally:
+            self.staged_rollups = None
+        staged_rollups.save()
+        self.rollups = staged_rollups
+        print(f"✅ 看板预聚合重建完成: {counts['videos']} 个视频, {counts['comments']} 条评论")
+        return counts
+    
+    def rebuild_rollups_async(self):
+        """提交看板预聚合重建任务（返回任务ID），进度通过 get_import_job 查询"""
+        return self.get_job_service().submit({'task': 'rebuild_rollups'})
     
     def build_video_project_mapping(self):
-        """构建视频ID到项目的映射关系，同时构建视频详细信息映射"""
-        if hasattr(self, 'video_project_mapping'):
+        """加载视频ID到项目及视频详细信息的查找索引，数据源变化时重新构建
+        
+        索引保存在 data/video_index，以mmap方式加载，评论导入无需再读取视频CSV。
+        """
+        if self.video_lookup is not None:
             return
-            
-        self.video_project_mapping = {}
-        self.video_info_mapping = {}  # 添加视频详细信息映射
-        video_files = [
-            '1747748467790_dbexport_209215447/2025-05-20-21-41-08_EXPORT_CSV_19274722_345_bilibili_video_0.csv'
-        ]
         
-        print("🔗 构建视频-项目映射关系...")
+        store = LookupStore(self.video_index_dir, string_columns=VIDEO_INFO_COLUMNS)
+        signature = self._video_index_signature()
+        
+        if store.load() and store.extra.get('signature') == signature:
+            print(f"✅ 加载视频查找索引: {len(store)} 个视频")
+        else:
+            print("🔗 构建视频-项目映射关系...")
+            store.build(self._iter_video_lookup_frames(self.import_sources.resolve('videos')), 'video_id',
+                        meta={'signature': signature})
+            print(f"✅ 构建了 {len(store)} 个视频的项目映射和详细信息映射")
+        
+        self.video_lookup = store
+    
+    def update_video_lookup(self, video_file):
+        """将新上传的视频文件增量合并进查找索引，无需重读已有数据"""
+        store = LookupStore(self.video_index_dir, string_columns=VIDEO_INFO_COLUMNS)
+        if not store.load() or store.extra.get('signature', {}).get('account') != self._file_signature(ACCOUNT_FILE):
+            # 没有可用索引或项目归属已变化，全量构建
+            self.video_lookup = None
+            self.build_video_project_mapping()
+            return
         
+        store.merge(self._iter_video_lookup_frames([video_file]), 'video_id',
+                    meta={'signature': self._video_index_signature()})
+        self.video_lookup = store
+        print(f"✅ 视频查找索引已增量更新，共 {len(store)} 个视频")
+    
+    def _iter_video_lookup_frames(self, video_files):
+        """读取视频文件中构建查找索引所需的列"""
+        wanted = ['video_id', 'user_id', 'title', 'video_url', 'nickname']
         for video_file in video_files:
-            if os.path.exists(video_file):
-                # 分块读取视频文件
-                chunk_size = 5000
-                for chunk in pd.read_csv(video_file, chunksize=chunk_size, low_memory=False):
-                    for _, row in chunk.iterrows():
-                        video_id = str(row.get('video_id', ''))
-                        user_id = str(row.get('user_id', ''))
-                        project_id = self.get_user_project(user_id)
-                        
-                        if video_id and video_id != 'nan':
-                            self.video_project_mapping[video_id] = project_id
-                            # 同时保存视频详细信息
-                            self.video_info_mapping[video_id] = {
-                                'video_title': str(row.get('title', '')),
-                                'video_url': str(row.get('video_url', '')),
-                                'video_uploader_nickname': str(row.get('nickname', '')),
-                                'video_uploader_uid': str(row.get('user_id', ''))
-                            }
-        
-        print(f"✅ 构建了 {len(self.video_project_mapping)} 个视频的项目映射")
-        print(f"✅ 构建了 {len(self.video_info_mapping)} 个视频的详细信息映射")
+            if not os.path.exists(video_file):
+                continue
+            for chunk in self.read_source_chunks(video_file, wanted, chunk_size=50000):
+                video_ids = self._str_column(chunk, 'video_id')
+                user_ids = self._str_column(chunk, 'user_id')
+                frame = pd.DataFrame({
+                    'video_id': video_ids,
+                    'project_id': self.lookup_user_projects(user_ids),
+                    'video_title': self._str_column(chunk, 'title'),
+                    'video_url': self._str_column(chunk, 'video_url'),
+                    'video_uploader_nickname': self._str_column(chunk, 'nickname'),
+                    'video_uploader_uid': user_ids
+                })
+                yield frame[~frame['video_id'].isin(['', 'nan'])]
+    
+    def _video_index_signature(self):
+        """视频索引的数据源签名：视频文件和账号文件的大小与修改时间"""
+        return {
+            'videos': {path: self._file_signature(path) for path in self.import_sources.resolve('videos')},
+            'account': self._file_signature(ACCOUNT_FILE)
+        }
+    
+    def _file_signature(self, path):
+        try:
+            stat = os.stat(path)
+            return {'size': stat.st_size, 'mtime': stat.st_mtime}
+        except FileNotFoundError:
+            return None
     
     def get_video_project(self, video_id):
         """根据视频ID获取项目名称"""
-        if hasattr(self, 'video_project_mapping'):
-            return self.video_project_mapping.get(str(video_id), '未分类项目')
-        else:
-            return '未分类项目'
+        if self.video_lookup is not None:
+            found = self.video_lookup.get(str(video_id))
+            if found:
+                return found['project_id']
+        return '未分类项目'
 
     def process_comment_chunk(self, df):
         """处理评论数据块"""
-        bulk_data = []
+        bulk_data = self.build_comment_actions(df)
         
-        for _, row in df.iterrows():
-            # 根据视频ID获取项目（而不是评论者的user_id）
-            video_id = str(row.get('video_id', ''))
-            project_id = self.get_video_project(video_id)
-            
-            # 获取视频详细信息
-            video_info = self.get_video_info(video_id)
+        # 批量插入Elasticsearch
+        if bulk_data:
+            self.bulk_insert(bulk_data)
+    
+    def build_comment_actions(self, df):
+        """列式转换评论数据块，直接由列数组生成批量插入动作"""
+        video_ids = self._str_column(df, 'video_id')
+        
+        # 根据视频ID关联项目和视频详细信息（而不是评论者的user_id）
+        video_info = self._join_video_info(video_ids)
+        
+        # 判断是否为主评论
+        parent_comment_ids = self._str_column(df, 'parent_comment_id')
+        is_main_comment = pd.Series(parent_comment_ids, dtype=object).isin(['', '0']).tolist()
+        
+        columns = {
+            'id': self._str_column(df, 'id'),
+            'user_id': self._str_column(df, 'user_id'),  # 这是评论者的ID
+            'nickname': self._str_column(df, 'nickname'),
+            'avatar': self._str_column(df, 'avatar'),
+            'add_ts': self._timestamp_column(df, 'add_ts'),
+            'last_modify_ts': self._timestamp_column(df, 'last_modify_ts'),
+            'comment_id': self._str_column(df, 'comment_id'),
+            'video_id': video_ids,
+            'content': self._str_column(df, 'content'),
+            'create_time': self._timestamp_column(df, 'create_time'),
+            'sub_comment_count': self._int_column(df, 'sub_comment_count'),
+            'parent_comment_id': parent_comment_ids,
+            'like_count': self._int_column(df, 'like_count'),
+            'project_id': video_info['project_id'],
             
-            # 判断是否为主评论
-            parent_comment_id = str(row.get('parent_comment_id', ''))
-            is_main_comment = (parent_comment_id == '' or parent_comment_id == '0')
+            # 添加视频相关信息
+            'video_title': video_info['video_title'],
+            'video_url': video_info['video_url'],
+            'video_uploader_nickname': video_info['video_uploader_nickname'],
+            'video_uploader_uid': video_info['video_uploader_uid'],
             
-            # 清理和转换数据
-            doc = {
-                'id': str(row.get('id', '')),
-                'user_id': str(row.get('user_id', '')),  # 这是评论者的ID
-                'nickname': str(row.get('nickname', '')),
-                'avatar': str(row.get('avatar', '')),
-                'add_ts': self.convert_timestamp(row.get('add_ts')),
-                'last_modify_ts': self.convert_timestamp(row.get('last_modify_ts')),
-                'comment_id': str(row.get('comment_id', '')),
-                'video_id': video_id,  # 这是视频的ID
-                'content': str(row.get('content', '')),
-                'create_time': self.convert_timestamp(row.get('create_time')),
-                'sub_comment_count': self.safe_int(row.get('sub_comment_count', 0)),
-                'parent_comment_id': parent_comment_id,
-                'like_count': self.safe_int(row.get('like_count', 0)),
-                'project_id': project_id,  # 基于视频的项目，而不是评论者的项目
-                
-                # 添加视频相关信息
-                'video_title': video_info.get('video_title', ''),
-                'video_url': video_info.get('video_url', ''),
-                'video_uploader_nickname': video_info.get('video_uploader_nickname', ''),
-                'video_uploader_uid': video_info.get('video_uploader_uid', ''),
-                
-                # 添加评论类型标识
-                'is_main_comment': is_main_comment
+            # 添加评论类型标识
+            'is_main_comment': is_main_comment
+        }
+        
+        if self.manifest is not None:
+            columns = self.manifest.select(columns, 'comment_id')
+            parent_comment_ids = columns['parent_comment_id']
+            is_main_comment = columns['is_main_comment']
+        
+        if self.segmenter is not None:
+            columns['content_seg'] = self.segmenter.segment(columns['content'])
+        
+        # 使用comment_id作为文档ID实现去重
+        actions = self._columns_to_actions(self.write_index(self.es_service.comment_index), columns, 'comment_id')
+        
+        if self.comment_summaries is not None:
+            self._attach_parent_snapshots(actions, parent_comment_ids, is_main_comment)
+        
+        return actions
+    
+    def _attach_parent_snapshots(self, actions, parent_comment_ids, is_main_comment):
+        """为回复附带父评论快照；摘要索引中找不到的父评论不写入，搜索时再按需查询"""
+        reply_positions = [i for i, is_main in enumerate(is_main_comment) if not is_main]
+        if not reply_positions:
+            return
+        
+        parent_ids = [parent_comment_ids[i] for i in reply_positions]
+        defaults = {'nickname': None, 'content': None, 'like_count': -1, 'create_time': -1}
+        summaries = self.comment_summaries.lookup(parent_ids, defaults)
+        
+        for j, i in enumerate(reply_positions):
+            if summaries['nickname'][j] is None:
+                continue
+            create_time = summaries['create_time'][j]
+            actions[i]['_source']['parent_comment_info'] = {
+                'nickname': summaries['nickname'][j],
+                'content': summaries['content'][j],
+                'create_time': None if create_time < 0 else create_time,
+                'like_count': summaries['like_count'][j]
             }
-            
-            # 构建批量插入数据
-            bulk_data.append({
-                '_index': self.es_service.comment_index,
-                '_id': doc['comment_id'],  # 使用comment_id作为文档ID实现去重
-                '_source': doc
-            })
+    
+    def _join_video_info(self, video_ids):
+        """按视频ID整列关联项目与视频详细信息"""
+        defaults = {column: '' for column in VIDEO_INFO_COLUMNS}
+        defaults['project_id'] = '未分类项目'
         
-        # 批量插入Elasticsearch
-        if bulk_data:
-            self.bulk_insert(bulk_data)
+        if self.video_lookup is None:
+            return {column: [default] * len(video_ids) for column, default in defaults.items()}
+        
+        return self.video_lookup.lookup(video_ids, defaults)
     
     def import_account_data(self):
         """导入账号数据（可选功能）"""
-        account_file = '账号大整合3.2xlsx_已提取UID.csv'
+        account_file = ACCOUNT_FILE
         
         if os.path.exists(account_file):
             print(f"正在处理账号文件: {account_file}")
@@ -310,95 +940,175 @@ class DataService:
         except:
             return 0
     
+    def convert_timestamp_series(self, series):
+        """整列转换时间戳，统一转换为秒级时间戳（float64，缺失为NaN）"""
+        numeric = pd.to_numeric(series, errors='coerce')
+        numeric = numeric.where(np.isfinite(numeric))
+        
+        # 大于1e12视为毫秒时间戳
+        seconds = np.trunc(numeric.where(numeric <= 1e12, numeric // 1000))
+        
+        # 非数字的字符串按日期字符串整列解析
+        if not pd.api.types.is_numeric_dtype(series):
+            text = series.astype(object).where(series.notna(), '').map(str).str.strip()
+            unparsed = seconds.isna() & ~text.isin(['', 'nan'])
+            if unparsed.any():
+                parsed = pd.to_datetime(text[unparsed], errors='coerce', utc=True, format='mixed')
+                epoch = pd.Timestamp(0, tz='UTC')
+                seconds[unparsed] = (parsed - epoch) // pd.Timedelta(seconds=1)
+        
+        return seconds.astype('float64')
+    
+    def safe_int_series(self, series):
+        """整列安全转换为整数，无法转换的值记为0"""
+        numeric = pd.to_numeric(series, errors='coerce')
+        numeric = numeric.where(np.isfinite(numeric), 0)
+        return np.trunc(numeric).astype('int64')
+    
+    def _str_column(self, df, name, default=''):
+        """取出字符串列，保持与逐行str()转换一致"""
+        if name not in df.columns:
+            return [default] * len(df)
+        return [str(value) for value in df[name].tolist()]
+    
+    def _timestamp_column(self, df, name):
+        """取出时间戳列，缺失值转换为None"""
+        if name not in df.columns:
+            return [None] * len(df)
+        return [None if value != value else int(value)
+                for value in self.convert_timestamp_series(df[name]).tolist()]
+    
+    def _int_column(self, df, name):
+        """取出整数列"""
+        if name not in df.columns:
+            return [0] * len(df)
+        return self.safe_int_series(df[name]).tolist()
+    
+    def _columns_to_actions(self, index, columns, id_field):
+        """由列数组直接生成批量插入动作"""
+        names = list(columns.keys())
+        actions = []
+        for values in zip(*columns.values()):
+            doc = dict(zip(names, values))
+            actions.append({
+                '_index': index,
+                '_id': doc[id_field],
+                '_source': doc
+            })
+        return actions
+    
+    def read_csv_chunks(self, file_path, chunk_size=None):
+        """分块读取CSV文件的生成器"""
+        chunk_size = chunk_size or int(os.getenv('IMPORT_CHUNK_SIZE', 5000))
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size, low_memory=False):
+            yield chunk
+    
+    def read_source_chunks(self, file_path, columns=None, chunk_size=None, sha1=None):
+        """分块读取数据源（经列式暂存，只读取columns列）"""
+        return self.staging.read(file_path, columns, chunk_size, sha1)
+    
+    def normalize_chunk(self, df):
+        """规整数据块：时间戳列转换为秒级（float64，缺失为NaN），整数列转换为int64，其余列按str()转为字符串
+        
+        规整后的数据块经 _str_column / _timestamp_column / _int_column 取出的结果与原始数据块相同。
+        """
+        columns = {}
+        for name in df.columns:
+            if name in TIMESTAMP_COLUMNS:
+                seconds = self.convert_timestamp_series(df[name])
+                # 超出int64范围的异常值按缺失处理
+                columns[name] = seconds.where(seconds.abs() < 1e18)
+            elif name in INT_COLUMNS:
+                columns[name] = self.safe_int_series(df[name])
+            else:
+                columns[name] = pd.Series(self._str_column(df, name), index=df.index, dtype=object)
+        return pd.DataFrame(columns, index=df.index)
+    
+    def count_source_rows(self, file_path, sha1=None):
+        """数据源行数：已暂存时取暂存文件的准确行数，否则按换行符估算"""
+        rows = self.staging.count_rows(file_path, sha1)
+        return self.count_csv_rows(file_path) if rows is None else rows
+    
+    def count_csv_rows(self, file_path):
+        """按换行符快速估算CSV行数（用于进度和ETA，字段内换行会使结果略偏大）"""
+        lines = 0
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                lines += block.count(b'\n')
+        return max(lines - 1, 0)
+    
+    def get_bulk_indexer(self):
+        """创建流水线批量索引器（线程数、队列长度、批次字节数等由环境变量配置）"""
+        return BulkIndexer(self.es_service.require_es_client())
+    
     def bulk_insert(self, bulk_data):
         """批量插入Elasticsearch"""
         if not bulk_data:
             return
         
         try:
-            from elasticsearch.helpers import bulk
-            success, failed = bulk(
-                self.es_service.es,
-                bulk_data,
-                index=None,  # 每个文档都有自己的索引
-                chunk_size=1000,
-                request_timeout=60
-            )
-            print(f"成功插入: {success} 条, 失败: {len(failed)} 条")
-            
-            if failed:
-                print(f"失败的文档: {failed[:5]}")  # 只打印前5个失败的文档
-                
+            # 每个文档都有自己的索引
+            return self.get_bulk_indexer().run([bulk_data])
         except Exception as e:
             print(f"批量插入失败: {str(e)}")
             raise 
+        finally:
+            self.es_service.search_cache.invalidate(*{action['_index'] for action in bulk_data})
 
     def get_video_info(self, video_id):
         """根据视频ID获取视频详细信息"""
-        if hasattr(self, 'video_info_mapping'):
-            return self.video_info_mapping.get(str(video_id), {
-                'video_title': '',
-                'video_url': '',
-                'video_uploader_nickname': '',
-                'video_uploader_uid': ''
-            })
-        else:
-            return {
-                'video_title': '',
-                'video_url': '',
-                'video_uploader_nickname': '',
-                'video_uploader_uid': ''
-            }
+        if self.video_lookup is not None:
+            found = self.video_lookup.get(str(video_id))
+            if found:
+                found.pop('project_id')
+                return found
+        return {
+            'video_title': '',
+            'video_url': '',
+            'video_uploader_nickname': '',
+            'video_uploader_uid': ''
+        }
 
     def clear_data(self, data_type='all'):
-        """清空数据"""
+        """清空数据
+        
+        别名切换到新建的空版本索引，原版本按保留数量保留，可通过回滚恢复。
+        导入正在进行时不清空，返回False。
+        """
         try:
-            if data_type in ['videos', 'all']:
-                print(f"🗑️ 清空视频索引...")
-                self.es_service.es.indices.delete(index=self.es_service.video_index, ignore=[400, 404])
-                print(f"✅ 视频索引已清空")
-            
-            if data_type in ['comments', 'all']:
-                print(f"🗑️ 清空评论索引...")
-                self.es_service.es.indices.delete(index=self.es_service.comment_index, ignore=[400, 404])
-                print(f"✅ 评论索引已清空")
-            
-            # 重新创建索引
-            if data_type in ['videos', 'comments', 'all']:
-                self.es_service.create_indices()
-                print(f"✅ 索引重新创建完成")
-            
+            with self.get_job_service().import_lock(blocking=False):
+                self._clear_indices(data_type)
             return True
         except Exception as e:
             print(f"❌ 清空数据失败: {str(e)}")
             return False
     
+    def _clear_indices(self, data_type):
+        try:
+            bodies = self.es_service.index_bodies()
+            aliases = self.es_service.aliases
+            for selected, alias, name in (('videos', self.es_service.video_index, '视频'),
+                                          ('comments', self.es_service.comment_index, '评论')):
+                if data_type in [selected, 'all']:
+                    print(f"🗑️ 清空{name}索引...")
+                    aliases.swap(alias, aliases.create_version(alias, bodies[alias]))
+                    aliases.cleanup(alias)
+                    print(f"✅ {name}索引已清空")
+        finally:
+            cleared = {
+                'videos': [self.es_service.video_index],
+                'comments': [self.es_service.comment_index],
+                'all': [self.es_service.video_index, self.es_service.comment_index]
+            }
+            self.es_service.search_cache.invalidate(*cleared.get(data_type, []))
+            if self.rollups_enabled and data_type in cleared:
+                self.rollups.reset(videos=data_type in ['videos', 'all'], comments=data_type in ['comments', 'all'])
+                self.rollups.save()
+    
     def get_data_statistics(self):
-        """获取数据统计信息"""
+        """获取数据统计信息（来自项目目录缓存）"""
         try:
-            es = self.es_service.get_es_client()
-            
-            # 获取视频统计
-            try:
-                video_response = es.count(index=self.es_service.video_index)
-                video_count = video_response.get('count', 0)
-            except:
-                video_count = 0
-            
-            # 获取评论统计
-            try:
-                comment_response = es.count(index=self.es_service.comment_index)
-                comment_count = comment_response.get('count', 0)
-            except:
-                comment_count = 0
-            
-            # 获取项目统计
-            try:
-                projects = self.es_service.get_available_projects({'role': 'admin'})
-                project_count = len(projects)
-            except:
-                project_count = 0
-            
+            video_count, comment_count, project_count = self.es_service.project_catalog.totals()
             return {
                 'videos': video_count,
                 'comments': comment_count,
@@ -451,12 +1161,11 @@ class DataService:
         try:
             import shutil
             # 移动文件到工作目录
-            target_path = '账号大整合3.2xlsx_已提取UID.csv'
+            target_path = ACCOUNT_FILE
             shutil.copy2(file_path, target_path)
             
-            # 重新加载用户项目映射
-            self.user_project_mapping = None
-            self.load_user_project_mapping()
+            # 重建用户项目映射，视频查找索引中的项目归属随之失效
+            self.reload_user_project_mapping()
             
             return {
                 'success': True, 
@@ -466,311 +1175,369 @@ class DataService:
             return {'success': False, 'message': f'处理账号文件失败: {str(e)}'}
     
     def process_video_file(self, file_path):
-        """处理视频文件"""
+        """处理视频文件
+        
+        文件保存为上传目录中的新分片，不覆盖已有文件；已导入过的分片按内容哈希跳过。
+        其他导入正在进行时不等待，直接返回失败。
+        """
         try:
-            import shutil
-            # 移动文件到目标位置
-            target_dir = '1747748467790_dbexport_209215447'
-            if not os.path.exists(target_dir):
-                os.makedirs(target_dir)
-            
-            target_path = os.path.join(target_dir, '2025-05-20-21-41-08_EXPORT_CSV_19274722_345_bilibili_video_0.csv')
-            shutil.copy2(file_path, target_path)
-            
-            # 导入视频数据
-            self.import_videos()
+            with self.get_job_service().import_lock(blocking=False):
+                target_path = self.import_sources.upload_path('videos', file_path)
+                shutil.copy2(file_path, target_path)
+                
+                # 导入视频数据（默认只写入新增或已变化的行）
+                reports = self.import_videos(incremental=self.upload_mode == 'incremental')
+                report = reports.get(target_path)
+                if report and report.get('duplicate_of'):
+                    os.remove(target_path)
+                else:
+                    # 增量更新视频查找索引，供后续评论导入使用
+                    self.update_video_lookup(target_path)
             
-            return {'success': True, 'message': '视频文件处理完成'}
+            return self._upload_result('视频文件处理完成', report)
         except Exception as e:
             return {'success': False, 'message': f'处理视频文件失败: {str(e)}'}
     
     def process_comment_file(self, file_path):
-        """处理评论文件"""
+        """处理评论文件（保存为上传目录中的新分片）"""
         try:
-            import shutil
-            # 移动文件到目标位置
-            target_dir = '1747748467790_dbexport_209215447'
-            if not os.path.exists(target_dir):
-                os.makedirs(target_dir)
-            
-            target_path = os.path.join(target_dir, '2025-05-20-21-41-11_EXPORT_CSV_19274722_637_bilibili_video_comment_1.csv')
-            shutil.copy2(file_path, target_path)
-            
-            # 导入评论数据
-            self.import_comments()
+            with self.get_job_service().import_lock(blocking=False):
+                target_path = self.import_sources.upload_path('comments', file_path)
+                shutil.copy2(file_path, target_path)
+                
+                # 导入评论数据（默认只写入新增或已变化的行）
+                reports = self.import_comments(incremental=self.upload_mode == 'incremental')
+                report = reports.get(target_path)
+                if report and report.get('duplicate_of'):
+                    os.remove(target_path)
             
-            return {'success': True, 'message': '评论文件处理完成'}
+            return self._upload_result('评论文件处理完成', report)
         except Exception as e:
             return {'success': False, 'message': f'处理评论文件失败: {str(e)}'}
     
+    def _upload_result(self, message, report):
+        """上传处理结果，附带写入和跳过的行数"""
+        if not report:
+            return {'success': True, 'message': message}
+        if report.get('duplicate_of'):
+            return {'success': True, 'message': f"{message}：文件内容与已导入的 {report['duplicate_of']} 相同，已跳过",
+                    'import': report}
+        return {
+            'success': True,
+            'message': f"{message}：写入 {report['written']} 行，跳过未变化 {report['skipped']} 行",
+            'import': report
+        }
+    
     def get_visualization_statistics(self, params):
-        """获取数据可视化统计信息"""
+        """获取数据可视化统计信息
+        
+        所有统计由一次聚合请求完成：顶层为match_all，各部分用filter聚合限定各自的条件，
+        时间段统计使用允许重叠的range聚合。
+        """
         try:
-            es = self.es_service.get_es_client()
-            
-            # 解析参数
-            project_id = params.get('project_id')
-            time_range = params.get('time_range')  # 不设置默认值
-            start_time = params.get('start_time')
-            end_time = params.get('end_time')
-            
-            # 构建时间查询条件
-            time_query = {}
-            now = datetime.now()
-            
-            if start_time and end_time:
-                time_query = {
-                    "range": {
-                        "create_time": {
-                            "gte": int(start_time),
-                            "lte": int(end_time)
-                        }
-                    }
-                }
-            elif time_range and time_range != 'custom':  # 只有明确指定时间范围时才应用
-                days = int(time_range.replace('d', ''))
-                start_timestamp = int((now - timedelta(days=days)).timestamp())
-                time_query = {
-                    "range": {
-                        "create_time": {
-                            "gte": start_timestamp
-                        }
-                    }
-                }
-            
-            # 构建项目查询条件
-            project_query = {}
-            if project_id:
-                project_query = {"term": {"project_id": project_id}}
-            
-            # 构建基础查询
-            base_query = {"bool": {"must": []}}
-            if time_query:
-                base_query["bool"]["must"].append(time_query)
-            if project_query:
-                base_query["bool"]["must"].append(project_query)
-            
-            # 1. 播放量统计
-            play_stats = self._get_play_stats(es, base_query)
+            if self.rollups_enabled:
+                result = self._visualization_from_rollups(params)
+                if result is not None:
+                    return result
             
-            # 2. 时间段统计
-            time_period_stats = self._get_time_period_stats(es, project_id)
-            
-            # 3. 爆文率统计
-            viral_stats = self._get_viral_stats(es, base_query, project_id)
-            
-            # 4. 项目分布统计
-            project_stats = self._get_project_distribution(es, time_query)
-            
-            return {
-                'play_stats': play_stats,
-                'time_period_stats': time_period_stats,
-                'viral_stats': viral_stats,
-                'project_stats': project_stats,
-                'success': True
-            }
+            es = self.es_service.get_es_client()
+            project_id, time_query, base_query = self._visualization_queries(params)
             
-        except Exception as e:
-            print(f"❌ 获取可视化统计失败: {str(e)}")
-            return {'success': False, 'message': str(e)}
-    
-    def _get_play_stats(self, es, base_query):
-        """获取播放量统计 - 改为按项目的播放总量统计"""
-        try:
             response = es.search(
                 index=self.es_service.video_index,
                 body={
-                    "query": base_query,
-                    "aggs": {
-                        "total_plays": {"sum": {"field": "video_play_count"}},
-                        "avg_plays": {"avg": {"field": "video_play_count"}},
-                        "max_plays": {"max": {"field": "video_play_count"}},
-                        "by_project": {
-                            "terms": {"field": "project_id", "size": 50},
-                            "aggs": {
-                                "total_plays": {"sum": {"field": "video_play_count"}},
-                                "video_count": {"value_count": {"field": "video_id"}}
-                            }
-                        }
-                    },
+                    "query": {"match_all": {}},
+                    "aggs": self._build_visualization_aggs(base_query, time_query, project_id),
                     "size": 0
                 }
             )
-            
             aggs = response['aggregations']
-            
-            # 构建项目播放量数据
-            project_data = []
-            project_names = []
-            play_values = []
-            
-            for bucket in aggs['by_project']['buckets']:
-                project_name = bucket['key']
-                total_plays = int(bucket['total_plays']['value'] or 0)
-                video_count = bucket['video_count']['value']
-                
-                project_data.append({
-                    'name': project_name,
-                    'total_plays': total_plays,
-                    'video_count': video_count,
-                    'avg_plays': int(total_plays / video_count) if video_count > 0 else 0
-                })
-                project_names.append(project_name)
-                play_values.append(total_plays)
-            
-            # 按播放量排序
-            project_data.sort(key=lambda x: x['total_plays'], reverse=True)
+            play = aggs['play']
             
             return {
-                'total_plays': int(aggs['total_plays']['value'] or 0),
-                'avg_plays': int(aggs['avg_plays']['value'] or 0),
-                'max_plays': int(aggs['max_plays']['value'] or 0),
-                'project_data': project_data
+                'play_stats': self._assemble_play_stats(play),
+                'time_period_stats': self._assemble_time_period_stats(aggs['time_periods']),
+                'viral_stats': self._assemble_viral_stats(
+                    play['doc_count'], play['viral']['doc_count'],
+                    play['viral_by_project']['buckets'] if 'viral_by_project' in play else None),
+                'project_stats': self._assemble_project_distribution(aggs['distribution']),
+                'success': True
             }
+            
         except Exception as e:
-            print(f"获取播放量统计失败: {e}")
-            return {'total_plays': 0, 'avg_plays': 0, 'max_plays': 0, 'project_data': []}
+            print(f"❌ 获取可视化统计失败: {str(e)}")
+            return {'success': False, 'message': str(e)}
     
-    def _get_time_period_stats(self, es, project_id=None):
-        """获取不同时间段的统计"""
-        from datetime import datetime, timedelta
+    def _visualization_from_rollups(self, params):
+        """由 项目×天 预聚合计算看板统计，不请求ES
         
-        now = datetime.now()
-        periods = {
-            '1d': now - timedelta(days=1),
-            '7d': now - timedelta(days=7),
-            '30d': now - timedelta(days=30)
+        预聚合的最小粒度为一天（按 ROLLUP_TZ_OFFSET 划分日期）：最近N天（time_range，以及1d/7d/30d
+        时间段统计）按含今天在内的N个自然日统计，与从当前时刻往前滚动的聚合查询相比最多多出一天内的数据；
+        自定义范围需按整天对齐，否则返回None改用聚合查询。
+        """
+        window = self._rollup_window(params)
+        if window is None or not self.rollups.available():
+            return None
+        
+        project_id = params.get('project_id')
+        start_day, end_day = window
+        base = self.rollups.summarize(start_day, end_day, project_id)
+        distribution = self.rollups.summarize(start_day, end_day)
+        today = self.rollups.day_of(time.time())
+        periods = {period: int(self.rollups.summarize(today - days + 1, None, project_id)['video_count'].sum())
+                   for period, days in (('1d', 1), ('7d', 7), ('30d', 30))}
+        
+        video_count = int(base['video_count'].sum())
+        total_plays = int(base['total_plays'].sum())
+        play_aggs = {
+            'total_plays': {'value': total_plays},
+            'avg_plays': {'value': total_plays / video_count if video_count else None},
+            'max_plays': {'value': int(base['max_plays'].max()) if video_count else None},
+            'by_project': {'buckets': [{
+                'key': name,
+                'doc_count': count,
+                'total_plays': {'value': int(base['total_plays'][i])},
+                'video_count': {'value': count}
+            } for i, name, count in self._rollup_buckets(base, 50)]}
         }
         
-        stats = {}
+        viral_buckets = None
+        if not project_id:
+            viral_buckets = [{
+                'key': name,
+                'doc_count': count,
+                'viral_videos': {'doc_count': int(base['viral_count'][i])}
+            } for i, name, count in self._rollup_buckets(base, 100)]
         
-        for period, start_time in periods.items():
-            query = {
-                "bool": {
-                    "must": [
-                        {"range": {"create_time": {"gte": int(start_time.timestamp())}}}
-                    ]
+        return {
+            'play_stats': self._assemble_play_stats(play_aggs),
+            'time_period_stats': periods,
+            'viral_stats': self._assemble_viral_stats(video_count, int(base['viral_count'].sum()), viral_buckets),
+            'project_stats': self._assemble_project_distribution({'by_project': {'buckets': [{
+                'key': name,
+                'doc_count': count,
+                'total_plays': {'value': int(distribution['total_plays'][i])}
+            } for i, name, count in self._rollup_buckets(distribution, 100)]}}),
+            'success': True
+        }
+    
+    def _rollup_window(self, params):
+        """看板时间范围对应的日期编号 (开始, 结束)，不限时间或不限结束时为None，自定义范围未按整天对齐时返回None"""
+        start_time = params.get('start_time')
+        end_time = params.get('end_time')
+        time_range = params.get('time_range')
+        
+        if start_time and end_time:
+            start, end = int(start_time), int(end_time)
+            # 结束时间为当天23:59:59（lte），下一秒应是零点
+            if not (self.rollups.is_day_start(start) and self.rollups.is_day_start(end + 1)):
+                return None
+            return self.rollups.day_of(start), self.rollups.day_of(end)
+        if time_range and time_range != 'custom':
+            # 最近N天：含今天在内的N个自然日
+            days = int(time_range.replace('d', ''))
+            return self.rollups.day_of(time.time()) - days + 1, None
+        return None, None
+    
+    def _rollup_buckets(self, summary, size):
+        """与terms聚合一致：按文档数降序、同数按项目名升序，取前size个非空项目"""
+        counts = summary['video_count']
+        order = sorted((i for i in range(len(counts)) if counts[i] > 0),
+                       key=lambda i: (-counts[i], summary['projects'][i]))
+        return [(i, summary['projects'][i], int(counts[i])) for i in order[:size]]
+    
+    def _visualization_queries(self, params):
+        """解析可视化参数，返回 (项目ID, 时间查询条件, 基础查询)"""
+        project_id = params.get('project_id')
+        time_range = params.get('time_range')  # 不设置默认值
+        start_time = params.get('start_time')
+        end_time = params.get('end_time')
+        
+        # 构建时间查询条件
+        time_query = {}
+        now = datetime.now()
+        
+        if start_time and end_time:
+            time_query = {
+                "range": {
+                    "create_time": {
+                        "gte": int(start_time),
+                        "lte": int(end_time)
+                    }
                 }
             }
-            
-            if project_id:
-                query["bool"]["must"].append({"term": {"project_id": project_id}})
-            
-            try:
-                response = es.count(
-                    index=self.es_service.video_index,
-                    body={"query": query}
-                )
-                stats[period] = response['count']
-            except:
-                stats[period] = 0
-        
-        return stats
-    
-    def _get_viral_stats(self, es, base_query, project_id=None):
-        """获取爆文率统计（播放量>1000为爆文）"""
-        try:
-            # 总视频数
-            total_response = es.search(
-                index=self.es_service.video_index,
-                body={"query": base_query, "size": 0}
-            )
-            total_videos = total_response['hits']['total']['value']
-            
-            # 爆文数（播放量>1000）
-            viral_query = {
-                "bool": {
-                    "must": base_query["bool"]["must"] + [
-                        {"range": {"video_play_count": {"gt": 1000}}}
-                    ]
+        elif time_range and time_range != 'custom':  # 只有明确指定时间范围时才应用
+            days = int(time_range.replace('d', ''))
+            start_timestamp = int((now - timedelta(days=days)).timestamp())
+            time_query = {
+                "range": {
+                    "create_time": {
+                        "gte": start_timestamp
+                    }
                 }
             }
-            
-            viral_response = es.search(
-                index=self.es_service.video_index,
-                body={"query": viral_query, "size": 0}
-            )
-            viral_videos = viral_response['hits']['total']['value']
-            
-            # 各项目爆文率
-            project_viral_stats = {}
-            if not project_id:  # 只有在不限定项目时才统计各项目
-                project_agg_response = es.search(
-                    index=self.es_service.video_index,
-                    body={
-                        "query": base_query,
-                        "aggs": {
-                            "by_project": {
-                                "terms": {"field": "project_id", "size": 100},
-                                "aggs": {
-                                    "viral_videos": {
-                                        "filter": {"range": {"video_play_count": {"gt": 1000}}}
-                                    }
-                                }
-                            }
-                        },
-                        "size": 0
+        
+        # 构建基础查询
+        base_query = {"bool": {"must": []}}
+        if time_query:
+            base_query["bool"]["must"].append(time_query)
+        if project_id:
+            base_query["bool"]["must"].append({"term": {"project_id": project_id}})
+        
+        return project_id, time_query, base_query
+    
+    def _build_visualization_aggs(self, base_query, time_query, project_id=None):
+        """组合可视化统计所需的全部聚合"""
+        play_aggs = {
+            "total_plays": {"sum": {"field": "video_play_count"}},
+            "avg_plays": {"avg": {"field": "video_play_count"}},
+            "max_plays": {"max": {"field": "video_play_count"}},
+            "by_project": {
+                "terms": {"field": "project_id", "size": 50},
+                "aggs": {
+                    "total_plays": {"sum": {"field": "video_play_count"}},
+                    "video_count": {"value_count": {"field": "video_id"}}
+                }
+            },
+            # 爆文（播放量>1000）
+            "viral": {"filter": {"range": {"video_play_count": {"gt": 1000}}}}
+        }
+        if not project_id:  # 只有在不限定项目时才统计各项目爆文率
+            play_aggs["viral_by_project"] = {
+                "terms": {"field": "project_id", "size": 100},
+                "aggs": {
+                    "viral_videos": {
+                        "filter": {"range": {"video_play_count": {"gt": 1000}}}
                     }
-                )
-                
-                for bucket in project_agg_response['aggregations']['by_project']['buckets']:
-                    project_name = bucket['key']
-                    total_project_videos = bucket['doc_count']
-                    viral_project_videos = bucket['viral_videos']['doc_count']
-                    viral_rate = (viral_project_videos / total_project_videos * 100) if total_project_videos > 0 else 0
-                    
-                    project_viral_stats[project_name] = {
-                        'total': total_project_videos,
-                        'viral': viral_project_videos,
-                        'rate': round(viral_rate, 2)
+                }
+            }
+        
+        distribution_query = {"bool": {"must": [time_query] if time_query else []}}
+        
+        return {
+            "play": {"filter": base_query, "aggs": play_aggs},
+            "time_periods": self._time_period_aggs(project_id),
+            "distribution": {
+                "filter": distribution_query,
+                "aggs": {
+                    "by_project": {
+                        "terms": {"field": "project_id", "size": 100},
+                        "aggs": {
+                            "total_plays": {"sum": {"field": "video_play_count"}}
+                        }
                     }
-            
-            overall_viral_rate = (viral_videos / total_videos * 100) if total_videos > 0 else 0
-            
-            return {
-                'total_videos': total_videos,
-                'viral_videos': viral_videos,
-                'viral_rate': round(overall_viral_rate, 2),
-                'project_stats': project_viral_stats
+                }
             }
-            
-        except Exception as e:
-            print(f"获取爆文率统计失败: {e}")
-            return {'total_videos': 0, 'viral_videos': 0, 'viral_rate': 0, 'project_stats': {}}
+        }
     
-    def _get_project_distribution(self, es, time_query=None):
-        """获取项目分布统计"""
-        try:
-            query = {"bool": {"must": []}}
-            if time_query:
-                query["bool"]["must"].append(time_query)
-            
-            response = es.search(
-                index=self.es_service.video_index,
-                body={
-                    "query": query,
-                    "aggs": {
-                        "by_project": {
-                            "terms": {"field": "project_id", "size": 100},
-                            "aggs": {
-                                "total_plays": {"sum": {"field": "video_play_count"}}
-                            }
-                        }
-                    },
-                    "size": 0
+    def _time_period_aggs(self, project_id=None):
+        """最近1天/7天/30天（从当前时刻往前）的视频数，允许重叠的range聚合"""
+        now = datetime.now()
+        return {
+            "filter": {"term": {"project_id": project_id}} if project_id else {"match_all": {}},
+            "aggs": {
+                "periods": {
+                    "range": {
+                        "field": "create_time",
+                        "keyed": True,
+                        "ranges": [
+                            {"key": period, "from": int((now - timedelta(days=days)).timestamp())}
+                            for period, days in (('1d', 1), ('7d', 7), ('30d', 30))
+                        ]
+                    }
                 }
-            )
-            
-            project_data = []
-            for bucket in response['aggregations']['by_project']['buckets']:
-                project_data.append({
-                    'name': bucket['key'],
-                    'video_count': bucket['doc_count'],
-                    'total_plays': int(bucket['total_plays']['value'] or 0)
-                })
-            
-            return sorted(project_data, key=lambda x: x['video_count'], reverse=True)
-            
-        except Exception as e:
-            print(f"获取项目分布失败: {e}")
-            return [] 
\ No newline at end of file
+            }
+        }
+    
+    def _assemble_play_stats(self, aggs):
+        """由播放量聚合结果组装播放量统计"""
+        project_data = []
+        for bucket in aggs['by_project']['buckets']:
+            total_plays = int(bucket['total_plays']['value'] or 0)
+            video_count = bucket['video_count']['value']
+            project_data.append({
+                'name': bucket['key'],
+                'total_plays': total_plays,
+                'video_count': video_count,
+                'avg_plays': int(total_plays / video_count) if video_count > 0 else 0
+            })
+        
+        # 按播放量排序
+        project_data.sort(key=lambda x: x['total_plays'], reverse=True)
+        
+        return {
+            'total_plays': int(aggs['total_plays']['value'] or 0),
+            'avg_plays': int(aggs['avg_plays']['value'] or 0),
+            'max_plays': int(aggs['max_plays']['value'] or 0),
+            'project_data': project_data
+        }
+    
+    def _assemble_time_period_stats(self, aggs):
+        buckets = aggs['periods']['buckets']
+        return {period: buckets.get(period, {}).get('doc_count', 0) for period in ('1d', '7d', '30d')}
+    
+    def _assemble_viral_stats(self, total_videos, viral_videos, project_buckets=None):
+        """组装爆文率统计；project_buckets为各项目的爆文聚合桶"""
+        project_viral_stats = {}
+        for bucket in project_buckets or []:
+            total_project_videos = bucket['doc_count']
+            viral_project_videos = bucket['viral_videos']['doc_count']
+            viral_rate = (viral_project_videos / total_project_videos * 100) if total_project_videos > 0 else 0
+            project_viral_stats[bucket['key']] = {
+                'total': total_project_videos,
+                'viral': viral_project_videos,
+                'rate': round(viral_rate, 2)
+            }
+        
+        overall_viral_rate = (viral_videos / total_videos * 100) if total_videos > 0 else 0
+        
+        return {
+            'total_videos': total_videos,
+            'viral_videos': viral_videos,
+            'viral_rate': round(overall_viral_rate, 2),
+            'project_stats': project_viral_stats
+        }
+    
+    def _assemble_project_distribution(self, aggs):
+        project_data = [{
+            'name': bucket['key'],
+            'video_count': bucket['doc_count'],
+            'total_plays': int(bucket['total_plays']['value'] or 0)
+        } for bucket in aggs['by_project']['buckets']]
+        return sorted(project_data, key=lambda x: x['video_count'], reverse=True)
+
+
+# 导入进程池工作进程中的转换服务（由 _init_stage_worker 按主进程的状态创建）
+_stage_service = None
+
+
+def _init_stage_worker(state):
+    """导入进程池工作进程的初始化：加载同一版本的查找索引，在本进程内串行分词，清单记录交给主进程汇总"""
+    global _stage_service
+    service = DataService()
+    service.es_service.video_index, service.es_service.comment_index = state['indices']
+    service.target_indices = state['target_indices']
+    service.account_index_dir = state['account_index_dir']
+    service.parent_comment_mode = state['parent_comment_mode']
+    service.staging.path = state['staging_dir']
+    if state['video_index_dir'] is not None:
+        service.video_index_dir = state['video_index_dir']
+        service.video_lookup = LookupStore(service.video_index_dir, string_columns=VIDEO_INFO_COLUMNS)
+        service.video_lookup.load()
+    if state['comment_index_dir'] is not None:
+        service.comment_index_dir = state['comment_index_dir']
+        service.comment_summaries = LookupStore(service.comment_index_dir,
+                                                string_columns=COMMENT_SUMMARY_STRING_COLUMNS,
+                                                int_columns=COMMENT_SUMMARY_INT_COLUMNS,
+                                                intern=False)
+        service.comment_summaries.load()
+    if state['segmenter'] is not None:
+        service.segmenter = TextSegmenter(*state['segmenter'], workers=1)
+        service.segmenter.tokenizer()
+    service.manifest = state['manifest']
+    service.manifest.collect_updates = True
+    _stage_service = service
+
+
+def _stage_file(data_type, staging, item):
+    return _stage_service.stage_file(data_type, staging, item)
@@ -1,54 +1,119 @@
-from elasticsearch import Elasticsearch
+from elasticsearch import NotFoundError
+from elasticsearch.serializer import JSONSerializer
 from datetime import datetime
 import os
-import jieba
 import json
+import time
+import base64
+import hashlib
+import hmac
+from services.bulk_load import BulkLoadMode
+from services.cache import TTLCache
+from services.index_aliases import IndexAliases
+from services.es_client import get_client_factory
+from services.search_cache import SearchCache
+from services.text_segmenter import TextSegmenter
+from services.project_catalog import ProjectCatalog
+
+
+# 预分词字段：原文字段 -> 保存jieba分词结果的字段
+SEGMENTED_FIELDS = {'title': 'title_seg', 'desc': 'desc_seg', 'content': 'content_seg'}
+
+# 搜索结果不返回分词字段（只用于匹配）
+RESULT_SOURCE = {"excludes": list(SEGMENTED_FIELDS.values())}
+
+# 父评论信息需要的字段
+PARENT_SOURCE_FIELDS = ['nickname', 'content', 'create_time', 'like_count']
+# 父评论未找到 / 查询失败时的占位信息；页面中带有占位信息时不缓存搜索结果
+MISSING_PARENT = {'nickname': '已删除用户', 'content': '评论已删除', 'create_time': '', 'like_count': 0}
+FAILED_PARENT = {'nickname': '获取失败', 'content': '无法获取父评论信息', 'create_time': '', 'like_count': 0}
+
+
+class SearchPaginationError(Exception):
+    """分页参数或游标无效"""
+
 
 class ElasticsearchService:
     def __init__(self):
-        # 延迟初始化，避免启动时连接问题
+        # 进程内共享的客户端（连接池、健康检查、熔断）；self.es 可注入指定客户端
         self.es = None
-        self.es_host = os.getenv('ELASTICSEARCH_HOST', 'localhost')
-        self.es_port = int(os.getenv('ELASTICSEARCH_PORT', 9200))
-        self.es_user = os.getenv('ELASTICSEARCH_USER')
-        self.es_password = os.getenv('ELASTICSEARCH_PASSWORD')
+        self.client_factory = get_client_factory()
         
+        # 别名，指向当前的版本索引（见 IndexAliases）
         self.video_index = 'videos_search'
         self.comment_index = 'comments_search'
+        self.aliases = IndexAliases(self)
+        
+        # 父评论信息缓存，跨请求共享
+        self.parent_cache = TTLCache(
+            maxsize=int(os.getenv('PARENT_CACHE_SIZE', 10000)),
+            ttl=int(os.getenv('PARENT_CACHE_TTL', 300))
+        )
+        
+        # 搜索结果缓存，导入或清空数据时按索引失效
+        self.search_cache = SearchCache()
+        
+        # 项目目录（各项目的视频/评论数），随索引版本号和定时刷新
+        self.project_catalog = ProjectCatalog(self)
+        
+        # 全量导入时的索引设置切换（关闭刷新、去掉副本，结束后恢复并段合并）
+        self.bulk_load = BulkLoadMode(self)
+        
+        # 页码分页的最大深度（与索引的max_result_window一致）和游标分页的PIT保留时间
+        self.max_result_window = int(os.getenv('MAX_RESULT_WINDOW', 10000))
+        self.pit_keep_alive = os.getenv('PIT_KEEP_ALIVE', '5m')
+        
+        # 中文分词: jieba（导入时预分词写入 *_seg 字段，查询时使用同一词典切分）或 standard（按字切分）
+        self.text_segmentation = os.getenv('TEXT_SEGMENTATION', 'jieba')
+        self.segmenter = TextSegmenter()
+        self._segmented_indices = {}
+        
+        # 相似评论：按 (评论, 可见项目范围) 缓存相似评论ID列表，随评论索引版本号失效
+        self.similar_cache = TTLCache(
+            maxsize=int(os.getenv('SIMILAR_CACHE_SIZE', 10000)),
+            ttl=int(os.getenv('SIMILAR_CACHE_TTL', 3600))
+        )
+        self.similar_size = int(os.getenv('SIMILAR_SIZE', 10))
+        # 单次查询的耗时预算：ES端超时返回已找到的结果，每个分片最多收集的文档数
+        self.similar_timeout_ms = int(os.getenv('SIMILAR_TIMEOUT_MS', 500))
+        self.similar_terminate_after = int(os.getenv('SIMILAR_TERMINATE_AFTER', 100000))
+        # 评论普遍较短，词只出现一次也参与相似度计算
+        self.similar_mlt_params = {
+            'min_term_freq': int(os.getenv('SIMILAR_MIN_TERM_FREQ', 1)),
+            'max_query_terms': int(os.getenv('SIMILAR_MAX_QUERY_TERMS', 20)),
+            'min_doc_freq': int(os.getenv('SIMILAR_MIN_DOC_FREQ', 2)),
+            'minimum_should_match': os.getenv('SIMILAR_MINIMUM_SHOULD_MATCH', '30%')
+        }
     
     def get_es_client(self):
-        """获取Elasticsearch客户端，懒加载"""
-        if self.es is None:
-            try:
-                # 使用更简单的连接方式
-                if self.es_user and self.es_password:
-                    self.es = Elasticsearch(
-                        f"http://{self.es_host}:{self.es_port}",
-                        basic_auth=(self.es_user, self.es_password),
-                        verify_certs=False,
-                        request_timeout=30
-                    )
-                else:
-                    self.es = Elasticsearch(
-                        f"http://{self.es_host}:{self.es_port}",
-                        verify_certs=False,
-                        request_timeout=30
-                    )
-                
-                # 测试连接
-                self.es.info()
-                
-            except Exception as e:
-                print(f"Elasticsearch连接失败: {str(e)}")
-                # 返回一个模拟客户端，避免应用崩溃
-                self.es = MockElasticsearchClient()
+        """获取Elasticsearch客户端
+        
+        ES不可用时返回模拟客户端，避免应用崩溃；恢复后自动切回（见 ElasticsearchClientFactory）。
+        """
+        if self.es is not None:
+            return self.es
+        return self.client_factory.get_client()
+    
+    def require_es_client(self):
+        """获取用于写入和索引管理的Elasticsearch客户端
         
-        return self.es
+        ES不可用时抛出ConnectionError，不返回模拟客户端：模拟客户端对写入一律返回成功，
+        导入会被误记为完成（增量清单随之保存），别名切换也会误报成功。
+        """
+        if self.es is not None:
+            return self.es
+        return self.client_factory.require_client()
 
     def create_indices(self):
-        """创建Elasticsearch索引"""
-        es = self.get_es_client()
-        
+        """创建Elasticsearch索引（别名不存在时创建第一个版本）"""
+        try:
+            for alias, body in self.index_bodies().items():
+                self.aliases.ensure(alias, body)
+        except Exception as e:
+            print(f"创建索引失败: {str(e)}")
+    
+    def index_bodies(self):
+        """各别名对应的索引设置和映射 {别名: 请求体}"""
         # 视频索引映射
         video_mapping = {
             "mappings": {
@@ -75,6 +140,8 @@ class ElasticsearchService:
                         "type": "text",
                         "analyzer": "standard"
                     },
+                    "title_seg": {"type": "text", "analyzer": "segmented"},
+                    "desc_seg": {"type": "text", "analyzer": "segmented"},
                     "create_time": {"type": "long"},
                     "liked_count": {"type": "integer"},
                     "video_play_count": {"type": "integer"},
@@ -110,6 +177,7 @@ class ElasticsearchService:
                         "type": "text",
                         "analyzer": "standard"
                     },
+                    "content_seg": {"type": "text", "analyzer": "segmented"},
                     "create_time": {"type": "long"},
                     "sub_comment_count": {"type": "integer"},
                     "parent_comment_id": {"type": "keyword"},
@@ -130,25 +198,83 @@ class ElasticsearchService:
                     },
                     "video_uploader_uid": {"type": "keyword"},
                     # 评论类型标识
-                    "is_main_comment": {"type": "boolean"}
+                    "is_main_comment": {"type": "boolean"},
+                    # 导入时写入的父评论快照（denormalized模式），只保存不索引
+                    "parent_comment_info": {"type": "object", "enabled": False}
+                }
+            }
+        }
+        
+        if self.text_segmentation == 'jieba':
+            for mapping in (video_mapping, comment_mapping):
+                self._add_segmentation(mapping)
+        else:
+            # 不使用预分词时不创建 *_seg 字段
+            for mapping in (video_mapping, comment_mapping):
+                for field in SEGMENTED_FIELDS.values():
+                    mapping["mappings"]["properties"].pop(field, None)
+        
+        return {self.video_index: video_mapping, self.comment_index: comment_mapping}
+    
+    def _add_segmentation(self, mapping):
+        """预分词字段的分析器：按空格切分并转小写，并在映射中标记分词方式"""
+        mapping["settings"] = {
+            "analysis": {
+                "analyzer": {
+                    "segmented": {"type": "custom", "tokenizer": "whitespace", "filter": ["lowercase"]}
                 }
             }
         }
+        mapping["mappings"]["_meta"] = {"segmentation": "jieba"}
+    
+    def is_segmented(self, index):
+        """索引是否带有jieba预分词字段（按映射中的标记判断，旧索引仍按原文字段查询）
+        
+        映射在版本索引创建后不再变化，结果按索引版本号（导入、清空、切换别名时变化）缓存，
+        未带标记的结果同样缓存；获取映射失败时按原文字段查询，ES_RETRY_AFTER 秒内不再重试。
+        """
+        if self.text_segmentation != 'jieba':
+            return False
         
-        # 创建索引
+        generation = self.search_cache.generation(index)
+        cached = self._segmented_indices.get(index)
+        if cached is not None and cached[0] == generation and \
+                (cached[2] is None or time.monotonic() < cached[2]):
+            return cached[1]
+        
+        retry_at = None
         try:
-            if not es.indices.exists(index=self.video_index):
-                es.indices.create(index=self.video_index, body=video_mapping)
-                
-            if not es.indices.exists(index=self.comment_index):
-                es.indices.create(index=self.comment_index, body=comment_mapping)
+            es = self.get_es_client()
+            if isinstance(es, MockElasticsearchClient):
+                # 模拟客户端的空映射不能说明索引未分词，按失败处理，稍后重试
+                raise ConnectionError('Elasticsearch不可用')
+            mappings = es.indices.get_mapping(index=index)
+            segmented = any(item.get('mappings', {}).get('_meta', {}).get('segmentation') == 'jieba'
+                            for item in mappings.values())
         except Exception as e:
-            print(f"创建索引失败: {str(e)}")
-    
-    def search_videos(self, search_params, current_user):
-        """搜索视频"""
-        es = self.get_es_client()
+            print(f"⚠️ 获取索引映射失败，按原文字段查询: {str(e)}")
+            segmented = False
+            retry_at = time.monotonic() + self.client_factory.retry_after
         
+        self._segmented_indices[index] = (generation, segmented, retry_at)
+        return segmented
+    
+    def _text_match(self, field, text, segmented):
+        """原文字段的match查询；有预分词字段时改为查询分词字段"""
+        if segmented and field in SEGMENTED_FIELDS:
+            return {"match": {SEGMENTED_FIELDS[field]: self.segmenter.cut_query(text) or text}}
+        return {"match": {field: text}}
+    
+    def _segmented_highlight(self, highlight, texts_by_field):
+        """查询落在分词字段上时，高亮仍显示原文：按原文字段上的match查询高亮"""
+        for field, texts in texts_by_field.items():
+            clauses = [{"match": {field: text}} for text in texts if text]
+            if clauses:
+                highlight["fields"][field] = {"highlight_query": {"bool": {"should": clauses}}}
+        return highlight
+    
+    def build_video_query(self, search_params, current_user):
+        """根据搜索参数和用户权限构建视频查询"""
         query = {
             "bool": {
                 "must": [],
@@ -156,27 +282,43 @@ class ElasticsearchService:
             }
         }
         
+        segmented = self.is_segmented(self.video_index)
+        
         # 关键词搜索
         keywords = search_params.get('keywords', '')
         if keywords:
-            keyword_query = {
-                "multi_match": {
-                    "query": keywords,
-                    "fields": ["title^2", "desc", "nickname"],
-                    "type": "best_fields",
-                    "operator": "or"
+            if segmented:
+                keyword_query = {
+                    "bool": {
+                        "should": [
+                            {
+                                "multi_match": {
+                                    "query": self.segmenter.cut_query(keywords) or keywords,
+                                    "fields": ["title_seg^2", "desc_seg"],
+                                    "type": "best_fields",
+                                    "operator": "or"
+                                }
+                            },
+                            # 昵称仍使用标准分析器
+                            {"match": {"nickname": keywords}}
+                        ]
+                    }
+                }
+            else:
+                keyword_query = {
+                    "multi_match": {
+                        "query": keywords,
+                        "fields": ["title^2", "desc", "nickname"],
+                        "type": "best_fields",
+                        "operator": "or"
+                    }
                 }
-            }
             query["bool"]["must"].append(keyword_query)
         
         # 视频标题搜索
         video_title = search_params.get('video_title', '')
         if video_title:
-            query["bool"]["must"].append({
-                "match": {
-                    "title": video_title
-                }
-            })
+            query["bool"]["must"].append(self._text_match('title', video_title, segmented))
         
         # UP主昵称搜索
         uploader_nickname = search_params.get('uploader_nickname', '')
@@ -196,128 +338,11 @@ class ElasticsearchService:
                 }
             })
         
-        # 项目筛选
-        project_id = search_params.get('project_id')
-        if project_id:
-            query["bool"]["filter"].append({
-                "term": {
-                    "project_id": project_id
-                }
-            })
-        
-        # 时间范围筛选
-        time_range = search_params.get('time_range')
-        if time_range and isinstance(time_range, dict):
-            start_time = time_range.get('start')
-            end_time = time_range.get('end')
-            if start_time or end_time:
-                print(f"🕐 时间范围查询: start={start_time}, end={end_time}")
-                range_query = {"range": {"create_time": {}}}
-                if start_time:
-                    start_timestamp = int(start_time)
-                    range_query["range"]["create_time"]["gte"] = start_timestamp
-                    print(f"   开始时间戳: {start_timestamp}")
-                if end_time:
-                    end_timestamp = int(end_time)
-                    range_query["range"]["create_time"]["lte"] = end_timestamp
-                    print(f"   结束时间戳: {end_timestamp}")
-                query["bool"]["filter"].append(range_query)
-                print(f"   时间查询条件: {range_query}")
-        
-        # 如果没有任何查询条件，使用match_all
-        if not query["bool"]["must"] and not query["bool"]["filter"]:
-            query = {"match_all": {}}
-        
-        # 权限控制
-        if current_user['role'] != 'admin':
-            project_access = current_user.get('project_access', [])
-            if project_access:
-                if query == {"match_all": {}}:
-                    query = {"bool": {"filter": []}}
-                elif "filter" not in query["bool"]:
-                    query["bool"]["filter"] = []
-                query["bool"]["filter"].append({
-                    "terms": {
-                        "project_id": project_access
-                    }
-                })
-        
-        # 排序
-        sort_by = search_params.get('sort_by', 'create_time')
-        sort_order = search_params.get('sort_order', 'desc')
-        
-        # 映射前端字段到ES字段
-        sort_field_map = {
-            'create_time': 'create_time',
-            'video_play_count': 'video_play_count'
-        }
-        
-        es_sort_field = sort_field_map.get(sort_by, 'create_time')
-        sort = [{es_sort_field: {"order": sort_order}}]
-        
-        # 分页
-        page = search_params.get('page', 1)
-        page_size = search_params.get('page_size', 20)
-        from_param = (page - 1) * page_size
-        
-        # 高亮设置
-        highlight = {
-            "fields": {
-                "title": {},
-                "desc": {}
-            },
-            "pre_tags": ["<em>"],
-            "post_tags": ["</em>"]
-        }
-        
-        try:
-            # 执行搜索
-            response = es.search(
-                index=self.video_index,
-                body={
-                    "query": query,
-                    "from": from_param,
-                    "size": page_size,
-                    "sort": sort,
-                    "highlight": highlight
-                }
-            )
-            
-            # 处理结果
-            hits = response['hits']['hits']
-            total = response['hits']['total']['value']
-            
-            results = []
-            for hit in hits:
-                result = hit['_source']
-                result['_id'] = hit['_id']
-                # 添加高亮信息
-                if 'highlight' in hit:
-                    result['highlight'] = hit['highlight']
-                results.append(result)
-            
-            return {
-                'results': results,
-                'total': total,
-                'page': page,
-                'page_size': page_size,
-                'total_pages': (total + page_size - 1) // page_size
-            }
-            
-        except Exception as e:
-            print(f"搜索失败: {str(e)}")
-            return {
-                'results': [],
-                'total': 0,
-                'page': page,
-                'page_size': page_size,
-                'total_pages': 0
-            }
+        self._add_common_filters(query, search_params, '🕐 时间范围查询')
+        return self._apply_project_access(query, current_user)
     
-    def search_comments(self, search_params, current_user):
-        """搜索评论"""
-        es = self.get_es_client()
-        
+    def build_comment_query(self, search_params, current_user):
+        """根据搜索参数和用户权限构建评论查询"""
         query = {
             "bool": {
                 "must": [],
@@ -328,11 +353,8 @@ class ElasticsearchService:
         # 关键词搜索
         keywords = search_params.get('keywords', '')
         if keywords:
-            query["bool"]["must"].append({
-                "match": {
-                    "content": keywords
-                }
-            })
+            query["bool"]["must"].append(
+                self._text_match('content', keywords, self.is_segmented(self.comment_index)))
         
         # 评论者UID搜索
         commenter_uid = search_params.get('commenter_uid', '')
@@ -352,7 +374,11 @@ class ElasticsearchService:
                 }
             })
         
-        # 项目筛选
+        self._add_common_filters(query, search_params, '🕐 评论时间范围查询')
+        return self._apply_project_access(query, current_user)
+    
+    def _add_common_filters(self, query, search_params, log_label):
+        """项目筛选和时间范围筛选"""
         project_id = search_params.get('project_id')
         if project_id:
             query["bool"]["filter"].append({
@@ -361,13 +387,12 @@ class ElasticsearchService:
                 }
             })
         
-        # 时间范围筛选
         time_range = search_params.get('time_range')
         if time_range and isinstance(time_range, dict):
             start_time = time_range.get('start')
             end_time = time_range.get('end')
             if start_time or end_time:
-                print(f"🕐 评论时间范围查询: start={start_time}, end={end_time}")
+                print(f"{log_label}: start={start_time}, end={end_time}")
                 range_query = {"range": {"create_time": {}}}
                 if start_time:
                     start_timestamp = int(start_time)
@@ -379,12 +404,12 @@ class ElasticsearchService:
                     print(f"   结束时间戳: {end_timestamp}")
                 query["bool"]["filter"].append(range_query)
                 print(f"   时间查询条件: {range_query}")
-        
-        # 如果没有任何查询条件，使用match_all
+    
+    def _apply_project_access(self, query, current_user):
+        """无条件时使用match_all，普通用户追加项目权限过滤"""
         if not query["bool"]["must"] and not query["bool"]["filter"]:
             query = {"match_all": {}}
         
-        # 权限控制
         if current_user['role'] != 'admin':
             project_access = current_user.get('project_access', [])
             if project_access:
@@ -397,24 +422,51 @@ class ElasticsearchService:
                         "project_id": project_access
                     }
                 })
-        
-        # 排序
+        return query
+    
+    def build_sort(self, search_params, sort_field_map, tiebreaker):
+        """构建排序，末尾追加唯一字段作为tiebreaker，保证search_after翻页稳定"""
         sort_by = search_params.get('sort_by', 'create_time')
         sort_order = search_params.get('sort_order', 'desc')
+        es_sort_field = sort_field_map.get(sort_by, 'create_time')
+        return [{es_sort_field: {"order": sort_order}}, {tiebreaker: {"order": "asc"}}]
+    
+    def video_search_spec(self, search_params, current_user):
+        """视频搜索的 (查询, 排序, 高亮)"""
+        query = self.build_video_query(search_params, current_user)
         
         # 映射前端字段到ES字段
-        sort_field_map = {
+        sort = self.build_sort(search_params, {
             'create_time': 'create_time',
-            'like_count': 'like_count'
-        }
+            'video_play_count': 'video_play_count'
+        }, 'video_id')
         
-        es_sort_field = sort_field_map.get(sort_by, 'create_time')
-        sort = [{es_sort_field: {"order": sort_order}}]
+        # 高亮设置
+        highlight = {
+            "fields": {
+                "title": {},
+                "desc": {}
+            },
+            "pre_tags": ["<em>"],
+            "post_tags": ["</em>"]
+        }
+        if self.is_segmented(self.video_index):
+            keywords = search_params.get('keywords', '')
+            self._segmented_highlight(highlight, {
+                'title': [keywords, search_params.get('video_title', '')],
+                'desc': [keywords]
+            })
+        return query, sort, highlight
+    
+    def comment_search_spec(self, search_params, current_user):
+        """评论搜索的 (查询, 排序, 高亮)"""
+        query = self.build_comment_query(search_params, current_user)
         
-        # 分页
-        page = search_params.get('page', 1)
-        page_size = search_params.get('page_size', 20)
-        from_param = (page - 1) * page_size
+        # 映射前端字段到ES字段
+        sort = self.build_sort(search_params, {
+            'create_time': 'create_time',
+            'like_count': 'like_count'
+        }, 'comment_id')
         
         # 高亮设置
         highlight = {
@@ -424,108 +476,452 @@ class ElasticsearchService:
             "pre_tags": ["<em>"],
             "post_tags": ["</em>"]
         }
+        if self.is_segmented(self.comment_index):
+            self._segmented_highlight(highlight, {'content': [search_params.get('keywords', '')]})
+        return query, sort, highlight
+    
+    def search_videos(self, search_params, current_user):
+        """搜索视频"""
+        cache_key, cached = self.search_cache.get(self.video_index, search_params, current_user)
+        if cached is not None:
+            return cached
+        
+        es = self.get_es_client()
+        query, sort, highlight = self.video_search_spec(search_params, current_user)
         
         try:
-            # 执行搜索
-            response = es.search(
-                index=self.comment_index,
-                body={
-                    "query": query,
-                    "from": from_param,
-                    "size": page_size,
-                    "sort": sort,
-                    "highlight": highlight
-                }
-            )
+            response, page_info = self.paged_search(es, self.video_index, query, sort, highlight, search_params)
+            result = dict(page_info, results=self._hits_to_results(response['hits']['hits']))
+            # 熔断期间模拟客户端的空结果不缓存
+            if not isinstance(es, MockElasticsearchClient):
+                self.search_cache.set(cache_key, result)
+            return result
             
-            # 处理结果
-            hits = response['hits']['hits']
-            total = response['hits']['total']['value']
+        except SearchPaginationError:
+            raise
+        except Exception as e:
+            print(f"搜索失败: {str(e)}")
+            return self._empty_page(search_params)
+    
+    def search_comments(self, search_params, current_user):
+        """搜索评论"""
+        cache_key, cached = self.search_cache.get(self.comment_index, search_params, current_user)
+        if cached is not None:
+            return dict(cached, metrics={'es_calls': 0, 'cache_hit': True})
+        
+        es = self.get_es_client()
+        query, sort, highlight = self.comment_search_spec(search_params, current_user)
+        
+        try:
+            metrics = {'es_calls': 0}
+            response, page_info = self.paged_search(es, self.comment_index, query, sort, highlight,
+                                                    search_params, metrics)
+            results = self._hits_to_results(response['hits']['hits'])
             
-            results = []
-            for hit in hits:
-                result = hit['_source']
-                result['_id'] = hit['_id']
-                # 添加高亮信息
-                if 'highlight' in hit:
-                    result['highlight'] = hit['highlight']
-                
-                # 如果不是主评论，获取父评论信息
-                if not result.get('is_main_comment', True) and result.get('parent_comment_id'):
-                    parent_info = self.get_parent_comment_info(result['parent_comment_id'])
-                    result['parent_comment_info'] = parent_info
-                
-                results.append(result)
+            # 如果不是主评论，获取父评论信息（整页一次批量查询）
+            parent_ids = self._parent_ids_to_fetch(results)
+            resolved = True
+            if parent_ids:
+                resolved = self._attach_parents(results, self.get_parent_comments_info(parent_ids, metrics))
             
-            return {
-                'results': results,
-                'total': total,
-                'page': page,
-                'page_size': page_size,
-                'total_pages': (total + page_size - 1) // page_size
-            }
+            result = dict(page_info, results=results)
+            # 模拟客户端的空结果、带父评论占位信息的页面不缓存（父评论可能稍后导入或恢复）
+            if resolved and not isinstance(es, MockElasticsearchClient):
+                self.search_cache.set(cache_key, result)
+            return dict(result, metrics=metrics)
             
+        except SearchPaginationError:
+            raise
         except Exception as e:
             print(f"搜索失败: {str(e)}")
-            return {
-                'results': [],
-                'total': 0,
-                'page': page,
-                'page_size': page_size,
-                'total_pages': 0
-            }
+            return self._empty_page(search_params)
+    
+    def paged_search(self, es, index, query, sort, highlight, search_params, metrics=None):
+        """执行分页搜索，返回 (ES响应, 分页信息)
+        
+        默认按页码分页（from/size），适合浅层翻页；
+        请求带 cursor 或 pagination='cursor' 时使用 PIT + search_after 游标分页，
+        翻页深度不受 max_result_window 限制，响应中的 next_cursor 用于获取下一页。
+        """
+        if self._is_cursor_request(search_params):
+            return self._cursor_search(es, index, query, sort, highlight, search_params, metrics)
+        
+        body, page, page_size = self._page_request(query, sort, highlight, search_params)
+        if metrics is not None:
+            metrics['es_calls'] += 1
+        response = es.search(index=index, body=body)
+        return response, self._page_info(response, page, page_size)
+    
+    def _cursor_search(self, es, index, query, sort, highlight, search_params, metrics=None):
+        """PIT + search_after 游标分页
+        
+        游标中保存PIT、上一页最后一条的排序值、页码和总数，并用SECRET_KEY签名。
+        查询条件每次由请求参数和用户权限重新构建，游标只能用于生成它的同一查询。
+        """
+        state = self._cursor_state(index, query, sort, search_params)
+        if state['page'] == 0:
+            state['pit'] = self.open_point_in_time(es, index, metrics)
+        body = self._cursor_body(state, query, sort, highlight)
+        
+        if metrics is not None:
+            metrics['es_calls'] += 1
+        try:
+            if state['pit']:
+                response = es.search(body=body)
+            else:
+                response = es.search(index=index, body=body)
+        except NotFoundError:
+            raise SearchPaginationError('游标已过期，请重新查询')
+        
+        page_info, finished_pit = self._cursor_page(state, response)
+        if finished_pit:
+            # 最后一页，提前释放PIT
+            self.close_point_in_time(es, finished_pit)
+        return response, page_info
+    
+    def _is_cursor_request(self, search_params):
+        return bool(search_params.get('cursor')) or search_params.get('pagination') == 'cursor'
+    
+    def _page_request(self, query, sort, highlight, search_params):
+        """页码分页的请求体，返回 (请求体, 页码, 每页条数)"""
+        page = self._positive_int(search_params.get('page', 1), '页码')
+        page_size = self._positive_int(search_params.get('page_size', 20), '每页条数')
+        from_param = (page - 1) * page_size
+        if from_param + page_size > self.max_result_window:
+            raise SearchPaginationError(f'页码过深（超过{self.max_result_window}条），请使用游标分页')
+        
+        body = {
+            "query": query,
+            "from": from_param,
+            "size": page_size,
+            "sort": sort,
+            "highlight": highlight,
+            "_source": RESULT_SOURCE
+        }
+        return body, page, page_size
+    
+    def _page_info(self, response, page, page_size):
+        total = response['hits']['total']['value']
+        return {
+            'total': total,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total + page_size - 1) // page_size
+        }
+    
+    def _cursor_state(self, index, query, sort, search_params):
+        """解码并校验请求中的游标；首页返回page为0、尚未打开PIT的新状态"""
+        fingerprint = self._query_fingerprint(index, query, sort)
+        token = search_params.get('cursor')
+        if token:
+            state = self.decode_cursor(token)
+            if state.get('fp') != fingerprint:
+                raise SearchPaginationError('游标与当前查询条件不匹配，请重新查询')
+            return state
+        return {
+            'fp': fingerprint,
+            'pit': None,
+            'after': None,
+            'page': 0,
+            'total': None,
+            'size': self._positive_int(search_params.get('page_size', 20), '每页条数')
+        }
+    
+    def _positive_int(self, value, name):
+        """分页参数转换为正整数（接受数字字符串），无效时抛出 SearchPaginationError"""
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            raise SearchPaginationError(f'{name}必须是正整数')
+        if number < 1 or isinstance(value, bool):
+            raise SearchPaginationError(f'{name}必须是正整数')
+        return number
+    
+    def _cursor_body(self, state, query, sort, highlight):
+        body = {
+            "query": query,
+            "size": state['size'],
+            "sort": sort,
+            "highlight": highlight,
+            "_source": RESULT_SOURCE,
+            # 总数只在第一页统计，之后从游标中读取
+            "track_total_hits": state['total'] is None
+        }
+        if state['after'] is not None:
+            body["search_after"] = state['after']
+        if state['pit']:
+            body["pit"] = {"id": state['pit'], "keep_alive": self.pit_keep_alive}
+        return body
+    
+    def _cursor_page(self, state, response):
+        """由游标分页的响应生成分页信息，返回 (分页信息, 需要释放的PIT)"""
+        hits = response['hits']['hits']
+        total = response['hits']['total']['value'] if state['total'] is None else state['total']
+        pit = response.get('pit_id', state['pit'])
+        page = state['page'] + 1
+        page_size = state['size']
+        
+        next_cursor = None
+        finished_pit = None
+        if len(hits) == page_size and hits and hits[-1].get('sort'):
+            next_cursor = self.encode_cursor(dict(state, pit=pit, after=hits[-1]['sort'],
+                                                  page=page, total=total))
+        elif pit:
+            finished_pit = pit
+        
+        return {
+            'total': total,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total + page_size - 1) // page_size,
+            'next_cursor': next_cursor
+        }, finished_pit
+    
+    def open_point_in_time(self, es, index, metrics=None):
+        """打开PIT；集群不支持时返回None，退化为不带PIT的search_after"""
+        try:
+            if metrics is not None:
+                metrics['es_calls'] += 1
+            return es.open_point_in_time(index=index, keep_alive=self.pit_keep_alive)['id']
+        except Exception as e:
+            print(f"⚠️ 打开PIT失败，使用普通search_after: {str(e)}")
+            return None
+    
+    def close_point_in_time(self, es, pit):
+        """关闭PIT；失败时只记录日志，PIT在保留时间到期后由ES释放"""
+        try:
+            es.close_point_in_time(body={'id': pit})
+        except Exception as e:
+            print(f"⚠️ 关闭PIT失败: {str(e)}")
+    
+    def _query_fingerprint(self, index, query, sort):
+        content = json.dumps([index, query, sort], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+    
+    def encode_cursor(self, state):
+        """将游标状态编码为不透明的签名字符串"""
+        payload = base64.urlsafe_b64encode(
+            json.dumps(state, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+        return f"{payload}.{self._sign_cursor(payload)}"
+    
+    def decode_cursor(self, token):
+        try:
+            payload, signature = str(token).rsplit('.', 1)
+            if not hmac.compare_digest(signature, self._sign_cursor(payload)):
+                raise ValueError('签名不匹配')
+            return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        except Exception:
+            raise SearchPaginationError('无效的游标')
+    
+    def _sign_cursor(self, payload):
+        secret = os.getenv('SECRET_KEY', 'your-secret-key-here').encode('utf-8')
+        return hmac.new(secret, payload.encode('ascii'), hashlib.sha256).hexdigest()[:32]
+    
+    def _hits_to_results(self, hits):
+        results = []
+        for hit in hits:
+            result = hit['_source']
+            result['_id'] = hit['_id']
+            # 添加高亮信息
+            if 'highlight' in hit:
+                result['highlight'] = hit['highlight']
+            results.append(result)
+        return results
+    
+    def _empty_page(self, search_params):
+        """ES请求失败时返回的空结果页（分页参数无效时抛出 SearchPaginationError，不返回空页）"""
+        return {
+            'results': [],
+            'total': 0,
+            'page': search_params.get('page', 1),
+            'page_size': search_params.get('page_size', 20),
+            'total_pages': 0
+        }
     
     def get_parent_comment_info(self, parent_comment_id):
         """获取父评论信息"""
-        es = self.get_es_client()
+        return self.get_parent_comments_info([parent_comment_id])[str(parent_comment_id)]
+    
+    def get_parent_comments_info(self, parent_comment_ids, metrics=None):
+        """批量获取父评论信息
+        
+        先查跨请求共享的LRU缓存，未命中的父评论用一次mget取回（文档ID即comment_id）。
+        metrics 不为空时累计ES调用次数和缓存命中数。
+        """
+        parents, missing = self._cached_parents(parent_comment_ids, metrics)
+        if not missing:
+            return parents
         
+        es = self.get_es_client()
         try:
-            # 通过comment_id查找父评论
-            response = es.search(
+            if isinstance(es, MockElasticsearchClient):
+                # 模拟客户端的空结果不能说明父评论已删除
+                raise ConnectionError('Elasticsearch不可用')
+            if metrics is not None:
+                metrics['es_calls'] = metrics.get('es_calls', 0) + 1
+            response = es.mget(
                 index=self.comment_index,
-                body={
-                    "query": {
-                        "term": {
-                            "comment_id": parent_comment_id
-                        }
-                    },
-                    "size": 1
-                }
+                body={'ids': missing},
+                _source_includes=PARENT_SOURCE_FIELDS
             )
-            
-            if response['hits']['hits']:
-                parent_comment = response['hits']['hits'][0]['_source']
-                return {
+            self._store_parents(parents, missing, response)
+        except Exception as e:
+            print(f"获取父评论信息失败: {str(e)}")
+            self._failed_parents(parents, missing)
+        
+        return parents
+    
+    def _parent_ids_to_fetch(self, results):
+        # 导入时已写入父评论快照的回复直接使用快照
+        return [
+            result['parent_comment_id'] for result in results
+            if not result.get('is_main_comment', True) and result.get('parent_comment_id')
+            and not result.get('parent_comment_info')
+        ]
+    
+    def _attach_parents(self, results, parents):
+        """为回复附加父评论信息；返回是否全部取到（有未找到或查询失败的占位信息时为False）"""
+        resolved = True
+        for result in results:
+            parent_id = str(result.get('parent_comment_id'))
+            if (parent_id in parents and not result.get('is_main_comment', True)
+                    and not result.get('parent_comment_info')):
+                result['parent_comment_info'] = parents[parent_id]
+                resolved = resolved and parents[parent_id] not in (MISSING_PARENT, FAILED_PARENT)
+        return resolved
+    
+    def _cached_parents(self, parent_comment_ids, metrics=None):
+        """返回 (缓存命中的父评论, 需要查询的ID列表)"""
+        unique_ids = list(dict.fromkeys(str(comment_id) for comment_id in parent_comment_ids))
+        parents, missing = self.parent_cache.get_many(unique_ids)
+        
+        if metrics is not None:
+            metrics['parent_lookups'] = metrics.get('parent_lookups', 0) + len(unique_ids)
+            metrics['parent_cache_hits'] = metrics.get('parent_cache_hits', 0) + len(parents)
+        return parents, missing
+    
+    def _store_parents(self, parents, missing, response):
+        """将mget结果写入parents和缓存"""
+        docs = {doc['_id']: doc for doc in response.get('docs', [])}
+        for comment_id in missing:
+            doc = docs.get(comment_id, {})
+            if doc.get('found'):
+                parent_comment = doc['_source']
+                info = {
                     'nickname': parent_comment.get('nickname', ''),
                     'content': parent_comment.get('content', ''),
                     'create_time': parent_comment.get('create_time', ''),
                     'like_count': parent_comment.get('like_count', 0)
                 }
+                self.parent_cache.set(comment_id, info)
             else:
-                return {
-                    'nickname': '已删除用户',
-                    'content': '评论已删除',
-                    'create_time': '',
-                    'like_count': 0
-                }
-                
-        except Exception as e:
-            print(f"获取父评论信息失败: {str(e)}")
-            return {
-                'nickname': '获取失败',
-                'content': '无法获取父评论信息',
-                'create_time': '',
-                'like_count': 0
-            }
+                info = dict(MISSING_PARENT)
+                # 父评论可能稍后才被导入，未找到的结果只短暂缓存
+                self.parent_cache.set(comment_id, info, ttl=min(self.parent_cache.ttl, 30))
+            parents[comment_id] = info
+    
+    def _failed_parents(self, parents, missing):
+        # 失败结果不写入缓存
+        for comment_id in missing:
+            parents[comment_id] = dict(FAILED_PARENT)
     
     def find_similar_comments(self, comment_id, current_user):
-        """查找相似评论"""
+        """查找相似评论（more_like_this）
+        
+        返回 {'source_comment', 'similar_comments', 'timed_out'}，评论不存在或无权访问时source_comment为None。
+        相似评论ID列表按用户可见的项目范围缓存，导入或清空评论后失效；未命中缓存时共两次ES请求
+        （MLT查询 + 批量读取原评论和相似评论），超出耗时预算时返回已找到的部分结果。
+        """
         es = self.get_es_client()
+        cache_key = (self.search_cache.generation(self.comment_index), comment_id,
+                     self._access_scope(current_user))
+        similar = self.similar_cache.get(cache_key)
+        timed_out = False
+        
+        try:
+            if similar is None:
+                similar, timed_out = self._similar_comment_ids(es, comment_id, current_user)
+                # 部分结果只短暂缓存
+                self.similar_cache.set(cache_key, similar,
+                                       ttl=min(self.similar_cache.ttl, 30) if timed_out else None)
+            
+            docs = self._load_comments(es, [comment_id] + [item['id'] for item in similar])
+        except Exception as e:
+            print(f"查找相似评论失败: {str(e)}")
+            return {'source_comment': None, 'similar_comments': [], 'timed_out': True, 'message': str(e)}
+        
+        source = docs.get(comment_id)
+        if source is None or not self._can_access(source.get('project_id'), current_user):
+            return {'source_comment': None, 'similar_comments': [], 'timed_out': False}
+        
+        similar_comments = []
+        for item in similar:
+            doc = docs.get(item['id'])
+            if doc is not None:
+                similar_comments.append(dict(doc, _score=item['score']))
         
         return {
-            'source_comment': {'content': '示例评论'},
-            'similar_comments': []
+            'source_comment': source,
+            'similar_comments': similar_comments,
+            'timed_out': timed_out
+        }
+    
+    def build_similar_query(self, comment_id, current_user):
+        """与指定评论内容相似的评论（不含其本身），普通用户限定在有权限的项目内"""
+        field = SEGMENTED_FIELDS['content'] if self.is_segmented(self.comment_index) else 'content'
+        query = {
+            "bool": {
+                "must": [{
+                    "more_like_this": dict(
+                        self.similar_mlt_params,
+                        fields=[field],
+                        like=[{"_index": self.comment_index, "_id": comment_id}]
+                    )
+                }],
+                "filter": []
+            }
         }
+        return self._apply_project_access(query, current_user)
+    
+    def _similar_comment_ids(self, es, comment_id, current_user):
+        """执行MLT查询，返回 ([{'id', 'score'}], 是否超出预算)"""
+        response = es.search(
+            index=self.comment_index,
+            body={
+                "query": self.build_similar_query(comment_id, current_user),
+                "size": self.similar_size,
+                "_source": False,
+                "track_total_hits": False,
+                "timeout": f"{self.similar_timeout_ms}ms",
+                "terminate_after": self.similar_terminate_after
+            },
+            # ES端超时不包含排队和网络，客户端再留出同样的余量
+            request_timeout=self.similar_timeout_ms * 2 / 1000
+        )
+        similar = [{'id': hit['_id'], 'score': hit.get('_score')} for hit in response['hits']['hits']]
+        return similar, bool(response.get('timed_out') or response.get('terminated_early'))
+    
+    def _load_comments(self, es, comment_ids):
+        """批量读取评论，返回 {comment_id: 文档}"""
+        response = es.mget(
+            index=self.comment_index,
+            body={'ids': comment_ids},
+            _source_excludes=RESULT_SOURCE['excludes'],
+            request_timeout=self.similar_timeout_ms * 2 / 1000
+        )
+        return {doc['_id']: dict(doc['_source'], _id=doc['_id'])
+                for doc in response['docs'] if doc.get('found')}
+    
+    def _access_scope(self, current_user):
+        """用户可见的项目范围（与 _apply_project_access 的过滤条件一致）"""
+        project_access = current_user.get('project_access', [])
+        if current_user['role'] == 'admin' or not project_access:
+            return '*'
+        return ','.join(sorted(project_access))
+    
+    def _can_access(self, project_id, current_user):
+        scope = self._access_scope(current_user)
+        return scope == '*' or project_id in current_user.get('project_access', [])
     
     def get_time_range(self, data_type):
         """获取指定数据类型的时间范围"""
@@ -563,95 +959,9 @@ class ElasticsearchService:
             return {'min': 0, 'max': 0, 'count': 0}
 
     def get_available_projects(self, current_user):
-        """获取用户可访问的项目列表"""
-        es = self.get_es_client()
-        
+        """获取用户可访问的项目列表（来自项目目录缓存）"""
         try:
-            # 获取所有项目的视频数量统计
-            video_stats = es.search(
-                index=self.video_index,
-                body={
-                    "size": 0,
-                    "aggs": {
-                        "projects": {
-                            "terms": {
-                                "field": "project_id",
-                                "size": 100  # 获取最多100个项目
-                            }
-                        }
-                    }
-                }
-            )
-            
-            # 获取所有项目的评论数量统计
-            comment_stats = es.search(
-                index=self.comment_index,
-                body={
-                    "size": 0,
-                    "aggs": {
-                        "projects": {
-                            "terms": {
-                                "field": "project_id",
-                                "size": 100
-                            }
-                        }
-                    }
-                }
-            )
-            
-            # 合并统计信息
-            project_data = {}
-            
-            # 处理视频数据
-            if 'aggregations' in video_stats and 'projects' in video_stats['aggregations']:
-                for bucket in video_stats['aggregations']['projects']['buckets']:
-                    project_id = bucket['key']
-                    video_count = bucket['doc_count']
-                    project_data[project_id] = {
-                        'id': project_id,
-                        'name': project_id,
-                        'video_count': video_count,
-                        'comment_count': 0
-                    }
-            
-            # 处理评论数据
-            if 'aggregations' in comment_stats and 'projects' in comment_stats['aggregations']:
-                for bucket in comment_stats['aggregations']['projects']['buckets']:
-                    project_id = bucket['key']
-                    comment_count = bucket['doc_count']
-                    if project_id in project_data:
-                        project_data[project_id]['comment_count'] = comment_count
-                    else:
-                        project_data[project_id] = {
-                            'id': project_id,
-                            'name': project_id,
-                            'video_count': 0,
-                            'comment_count': comment_count
-                        }
-            
-            # 转换为列表格式
-            projects = []
-            for project_id, data in project_data.items():
-                total_docs = data['video_count'] + data['comment_count']
-                
-                # 权限控制：普通用户只能看到有权限的项目
-                if current_user['role'] != 'admin':
-                    project_access = current_user.get('project_access', [])
-                    if project_id not in project_access:
-                        continue
-                
-                projects.append({
-                    'id': project_id,
-                    'name': project_id,
-                    'doc_count': total_docs,
-                    'video_count': data['video_count'],
-                    'comment_count': data['comment_count']
-                })
-            
-            # 按文档数量降序排序
-            projects.sort(key=lambda x: x['doc_count'], reverse=True)
-            
-            return projects
+            return self.project_catalog.projects(current_user)
             
         except Exception as e:
             print(f"获取项目列表失败: {str(e)}")
@@ -670,17 +980,22 @@ class ElasticsearchService:
 
 
 class MockElasticsearchClient:
-    """模拟Elasticsearch客户端，用于在ES不可用时避免应用崩溃"""
+    """模拟Elasticsearch客户端，用于在ES不可用时避免应用崩溃
+
+    与elasticsearch-py的接口保持一致（indices为属性），覆盖服务代码用到的全部调用：
+    查询返回空结果，写入和索引管理操作不做任何事。
+    """
     
     def __init__(self):
         self.options = MockOptions()
         self.transport = MockTransport()
+        self.indices = MockIndices()
     
     def info(self):
         return {"version": {"number": "mock"}}
     
-    def indices(self):
-        return MockIndices()
+    def ping(self, **kwargs):
+        return False
     
     def search(self, **kwargs):
         return {
@@ -693,6 +1008,9 @@ class MockElasticsearchClient:
     def count(self, **kwargs):
         return {'count': 0}
     
+    def mget(self, **kwargs):
+        return {'docs': []}
+    
     def index(self, **kwargs):
         return {'_id': 'mock_id', 'result': 'created'}
     
@@ -702,6 +1020,12 @@ class MockElasticsearchClient:
             'errors': False,
             'items': []
         }
+    
+    def open_point_in_time(self, **kwargs):
+        return {'id': 'mock_pit'}
+    
+    def close_point_in_time(self, **kwargs):
+        return {'succeeded': True, 'num_freed': 1}
 
 
 class MockOptions:
@@ -712,14 +1036,44 @@ class MockOptions:
 class MockTransport:
     def __init__(self):
         self.hosts = [{'host': 'localhost', 'port': 9200}]
+        # bulk辅助函数需要序列化器
+        self.serializer = JSONSerializer()
 
 
 class MockIndices:
     def exists(self, **kwargs):
         return False
     
+    def exists_alias(self, **kwargs):
+        return False
+    
     def create(self, **kwargs):
-        pass
+        return {'acknowledged': True}
     
     def delete(self, **kwargs):
-        pass 
\ No newline at end of file
+        return {'acknowledged': True}
+    
+    def get_alias(self, **kwargs):
+        # 没有任何别名（真实客户端在别名不存在时抛出NotFoundError，调用方两种情况均按无别名处理）
+        return {}
+    
+    def update_aliases(self, **kwargs):
+        return {'acknowledged': True}
+    
+    def get_mapping(self, index=None, **kwargs):
+        return {index: {'mappings': {}}} if index else {}
+    
+    def put_mapping(self, **kwargs):
+        return {'acknowledged': True}
+    
+    def get_settings(self, index=None, **kwargs):
+        return {index: {'settings': {}}} if index else {}
+    
+    def put_settings(self, **kwargs):
+        return {'acknowledged': True}
+    
+    def refresh(self, **kwargs):
+        return {'_shards': {'total': 0, 'successful': 0, 'failed': 0}}
+    
+    def forcemerge(self, **kwargs):
+        return {'_shards': {'total': 0, 'successful': 0, 'failed': 0}}
@@ -0,0 +1,283 @@
+import os
+import socket
+import threading
+import time
+
+from elasticsearch import ConnectionError as ESConnectionError
+from elasticsearch import Elasticsearch, Transport, TransportError, Urllib3HttpConnection
+
+# 熔断状态
+CLOSED = 'closed'        # 正常
+OPEN = 'open'            # ES不可用：搜索使用模拟客户端，写入直接失败，等待重试
+HALF_OPEN = 'half_open'  # 重试中：探测成功后恢复
+
+
+class KeepAliveConnection(Urllib3HttpConnection):
+    """为连接池中的连接开启TCP keepalive，避免空闲连接被防火墙/负载均衡静默断开"""
+
+    def __init__(self, *args, tcp_keepalive=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        if tcp_keepalive > 0:
+            from urllib3.connection import HTTPConnection
+
+            options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                options += [(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, tcp_keepalive),
+                            (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, tcp_keepalive // 3)),
+                            (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)]
+            self.pool.conn_kw['socket_options'] = options
+
+
+class ElasticsearchClientFactory:
+    """进程内共享的Elasticsearch客户端
+
+    同一进程中的所有服务共用一个客户端和连接池，并在此基础上：
+      - 健康检查：距上次检查超过 ES_HEALTH_INTERVAL 秒时，取客户端前先ping一次
+      - 熔断：连续 ES_FAILURE_THRESHOLD 次连接失败/5xx（或启动、健康检查失败）后熔断，
+        ES_RETRY_AFTER 秒内搜索使用模拟客户端（返回空结果而不是等待超时），写入和索引管理
+        （require_client）直接抛出ConnectionError；到期后重新创建客户端并探测，成功即恢复
+      - 指标：请求数、失败数、并发中的请求、连接池中已建立/空闲的连接
+    """
+
+    def __init__(self, host=None, port=None, user=None, password=None, pool_size=None, timeout=None,
+                 tcp_keepalive=None, health_interval=None, failure_threshold=None, retry_after=None):
+        self.host = host or os.getenv('ELASTICSEARCH_HOST', 'localhost')
+        self.port = int(port or os.getenv('ELASTICSEARCH_PORT', 9200))
+        self.user = user or os.getenv('ELASTICSEARCH_USER')
+        self.password = password or os.getenv('ELASTICSEARCH_PASSWORD')
+        self.pool_size = int(pool_size or os.getenv('ES_POOL_SIZE', 25))
+        self.timeout = int(timeout or os.getenv('ES_TIMEOUT', 30))
+        self.tcp_keepalive = int(tcp_keepalive if tcp_keepalive is not None else os.getenv('ES_TCP_KEEPALIVE', 60))
+        self.health_interval = float(health_interval or os.getenv('ES_HEALTH_INTERVAL', 30))
+        self.failure_threshold = int(failure_threshold or os.getenv('ES_FAILURE_THRESHOLD', 5))
+        self.retry_after = float(retry_after or os.getenv('ES_RETRY_AFTER', 10))
+
+        self._lock = threading.Lock()
+        # 计数器单独加锁：健康检查在持有 _lock 时发出的请求同样会更新计数
+        self._stats_lock = threading.Lock()
+        self._client = None
+        self._fallback = None
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._last_check = 0.0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.reconnects = 0
+        self.last_error = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def connection_options(self):
+        """创建客户端的连接参数（异步客户端共用）"""
+        options = {'verify_certs': False, 'timeout': self.timeout, 'maxsize': self.pool_size}
+        if self.user and self.password:
+            options['http_auth'] = (self.user, self.password)
+        return options
+
+    def get_client(self):
+        """返回可用的客户端；熔断期间返回模拟客户端（只用于只读的搜索和统计）"""
+        return self._acquire() or self._mock()
+
+    def require_client(self):
+        """返回可用的客户端；熔断期间抛出ConnectionError
+
+        写入和索引管理（批量写入、别名切换、索引设置）使用，模拟客户端的"成功"不能当作已写入。
+        """
+        client = self._acquire()
+        if client is None:
+            raise ConnectionError(f"Elasticsearch不可用，稍后重试: {self.last_error}")
+        return client
+
+    def _acquire(self):
+        """返回真实客户端；熔断期间（或探测失败）返回None"""
+        now = time.monotonic()
+        if self.state == CLOSED and self._client is not None and now - self._last_check < self.health_interval:
+            return self._client
+
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at < self.retry_after:
+                return None
+
+            if self._client is None or self.state != CLOSED:
+                # 首次创建，或熔断到期后重建客户端（重新解析地址、丢弃旧连接）
+                self._replace_client()
+            elif now - self._last_check < self.health_interval:
+                return self._client
+
+            self._last_check = now
+            if self._probe():
+                return self._client
+            return None
+
+    def ensure_available(self):
+        """熔断期间（重试时间未到）返回False；到期后探测一次，恢复时返回True
+
+        供不经过 get_client 的客户端（如ASGI入口的异步客户端）在请求前检查熔断状态。
+        """
+        if self.state == CLOSED:
+            return True
+        self._acquire()
+        return self.state == CLOSED
+
+    def create_async_client(self, maxsize=None):
+        """创建异步客户端：地址、认证和超时与同步客户端一致，请求同样计入指标和熔断"""
+        from elasticsearch import AsyncElasticsearch
+
+        options = dict(self.connection_options(), maxsize=maxsize or self.pool_size)
+        return AsyncElasticsearch(self.url, transport_class=_tracked_async_transport(self), **options)
+
+    def stats(self):
+        """客户端状态和连接池指标"""
+        stats = {
+            'url': self.url,
+            'state': self.state,
+            'requests': self.requests,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'pool_size': self.pool_size,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+            'connections': []
+        }
+        client = self._client
+        if client is not None:
+            for connection in client.transport.connection_pool.connections:
+                pool = getattr(connection, 'pool', None)
+                if pool is None:
+                    continue
+                stats['connections'].append({
+                    'host': connection.host,
+                    # 已建立的连接数、空闲可复用的连接数、累计请求数
+                    'opened': pool.num_connections,
+                    'idle': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                    'requests': pool.num_requests
+                })
+        return stats
+
+    def _probe(self):
+        """ping集群并更新熔断状态（需持有锁）"""
+        try:
+            alive = self._client.ping()
+        except Exception as e:
+            self._open(e)
+            return False
+        if not alive:
+            # ping() 吞掉了异常，具体原因已由传输层记录在 last_error
+            self._open(self.last_error or 'ping失败')
+            return False
+        if self.state != CLOSED:
+            print(f"✅ Elasticsearch已恢复连接: {self.url}")
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        return True
+
+    def _open(self, error):
+        if self.state != OPEN:
+            print(f"⚠️ Elasticsearch不可用，{self.retry_after:g}秒后重试: {str(error)}")
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.last_error = str(error)
+
+    def _replace_client(self):
+        old_client = self._client
+        transport_class = type('TrackedTransport', (_TrackedTransport,), {'factory': self})
+        self._client = Elasticsearch(self.url, transport_class=transport_class,
+                                     connection_class=KeepAliveConnection,
+                                     tcp_keepalive=self.tcp_keepalive, **self.connection_options())
+        if old_client is not None:
+            self.reconnects += 1
+            self.state = HALF_OPEN
+            try:
+                old_client.transport.close()
+            except Exception:
+                pass
+
+    def _mock(self):
+        if self._fallback is None:
+            from services.elasticsearch_service import MockElasticsearchClient
+            self._fallback = MockElasticsearchClient()
+        return self._fallback
+
+    def _request_started(self):
+        with self._stats_lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _request_finished(self, error=None):
+        with self._stats_lock:
+            self.in_flight -= 1
+            if error is None:
+                self.consecutive_failures = 0
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            if self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open(error)
+
+
+class _TrackedTransport(Transport):
+    """统计请求并把连接失败和5xx计入熔断"""
+
+    factory = None
+
+    def perform_request(self, *args, **kwargs):
+        self.factory._request_started()
+        error = None
+        try:
+            return super().perform_request(*args, **kwargs)
+        except ESConnectionError as e:
+            error = e
+            raise
+        except TransportError as e:
+            if isinstance(e.status_code, int) and e.status_code >= 500:
+                error = e
+            raise
+        finally:
+            self.factory._request_finished(error)
+
+
+def _tracked_async_transport(factory):
+    """与 _TrackedTransport 相同的统计和熔断计数，用于异步客户端"""
+    from elasticsearch import AsyncTransport
+
+    class _TrackedAsyncTransport(AsyncTransport):
+        async def perform_request(self, *args, **kwargs):
+            factory._request_started()
+            error = None
+            try:
+                return await super().perform_request(*args, **kwargs)
+            except ESConnectionError as e:
+                error = e
+                raise
+            except TransportError as e:
+                if isinstance(e.status_code, int) and e.status_code >= 500:
+                    error = e
+                raise
+            finally:
+                factory._request_finished(error)
+
+    return _TrackedAsyncTransport
+
+
+_factory = None
+_factory_lock = threading.Lock()
+
+
+def get_client_factory():
+    """进程内共享的客户端工厂"""
+    global _factory
+    if _factory is None:
+        with _factory_lock:
+            if _factory is None:
+                _factory = ElasticsearchClientFactory()
+    return _factory
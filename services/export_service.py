@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+import os
+
+from elasticsearch import NotFoundError
+
+from services.elasticsearch_service import RESULT_SOURCE
+
+# 导出的列（CSV按此顺序输出，NDJSON输出完整文档）
+VIDEO_EXPORT_COLUMNS = ['video_id', 'title', 'desc', 'create_time', 'user_id', 'nickname',
+                        'liked_count', 'video_play_count', 'video_comment', 'video_danmaku',
+                        'video_url', 'project_id']
+
+COMMENT_EXPORT_COLUMNS = ['comment_id', 'video_id', 'user_id', 'nickname', 'content', 'create_time',
+                          'like_count', 'sub_comment_count', 'parent_comment_id', 'is_main_comment',
+                          'project_id', 'video_title', 'video_url', 'video_uploader_nickname']
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8'
+}
+
+
+class ExportService:
+    """搜索结果流式导出
+
+    复用搜索的查询构建和权限过滤，用 PIT + search_after 按大批次遍历全部结果，
+    每批转换为CSV/NDJSON文本后立即交给响应输出，内存占用与结果总数无关。
+
+    响应头（200）在第一批数据之前已经发出，中途出错时无法再改为错误状态码：
+      - CSV: 异常继续抛出，服务器中止分块传输（不发送结束块），客户端得到不完整传输的错误，
+        不会把错误信息当作数据行写入文件
+      - NDJSON: 最后一行输出 {"error": "..."} 记录，客户端按行解析时可以识别
+    limit须为正整数，由调用方校验。
+    """
+
+    def __init__(self, es_service, batch_size=None):
+        self.es_service = es_service
+        self.batch_size = batch_size or int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+
+    def export_videos(self, search_params, current_user, export_format='csv'):
+        """导出视频搜索结果，返回逐块产出文本的生成器"""
+        es_service = self.es_service
+        query = es_service.build_video_query(search_params, current_user)
+        sort = es_service.build_sort(search_params, {
+            'create_time': 'create_time',
+            'video_play_count': 'video_play_count'
+        }, 'video_id')
+        return self._export(es_service.video_index, query, sort, VIDEO_EXPORT_COLUMNS,
+                            export_format, search_params.get('limit'))
+
+    def export_comments(self, search_params, current_user, export_format='csv'):
+        """导出评论搜索结果，返回逐块产出文本的生成器"""
+        es_service = self.es_service
+        query = es_service.build_comment_query(search_params, current_user)
+        sort = es_service.build_sort(search_params, {
+            'create_time': 'create_time',
+            'like_count': 'like_count'
+        }, 'comment_id')
+        return self._export(es_service.comment_index, query, sort, COMMENT_EXPORT_COLUMNS,
+                            export_format, search_params.get('limit'))
+
+    def iter_hits(self, index, query, sort, source=None, limit=None):
+        """按批次遍历查询的全部命中文档，每次产出一批hits
+
+        优先使用PIT保证遍历期间结果一致；打开失败时退化为不带PIT的search_after。
+        生成器被提前关闭（如客户端断开）时也会释放PIT。
+        """
+        es = self.es_service.get_es_client()
+        pit = self.es_service.open_point_in_time(es, index)
+        search_after = None
+        exported = 0
+
+        try:
+            while limit is None or exported < limit:
+                size = self.batch_size if limit is None else min(self.batch_size, limit - exported)
+                body = {
+                    "query": query,
+                    "size": size,
+                    "sort": sort,
+                    "track_total_hits": False
+                }
+                body["_source"] = source if source is not None else RESULT_SOURCE
+                if search_after is not None:
+                    body["search_after"] = search_after
+
+                if pit:
+                    body["pit"] = {"id": pit, "keep_alive": self.es_service.pit_keep_alive}
+                    response = es.search(body=body)
+                    pit = response.get('pit_id', pit)
+                else:
+                    response = es.search(index=index, body=body)
+
+                hits = response['hits']['hits']
+                if not hits:
+                    break
+                yield hits
+                exported += len(hits)
+                if len(hits) < size:
+                    break
+                search_after = hits[-1]['sort']
+        finally:
+            if pit:
+                self.es_service.close_point_in_time(es, pit)
+
+    def _export(self, index, query, sort, columns, export_format, limit=None):
+        if export_format == 'ndjson':
+            return self._ndjson_stream(index, query, sort, limit)
+        return self._csv_stream(index, query, sort, columns, limit)
+
+    def _csv_stream(self, index, query, sort, columns, limit):
+        # 带BOM，Excel打开中文不乱码
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')
+        writer.writerow(columns)
+        yield buffer.getvalue()
+
+        try:
+            for hits in self.iter_hits(index, query, sort, source=columns, limit=limit):
+                buffer.seek(0)
+                buffer.truncate()
+                for hit in hits:
+                    source = hit['_source']
+                    writer.writerow(['' if source.get(column) is None else source.get(column)
+                                     for column in columns])
+                yield buffer.getvalue()
+        except Exception as e:
+            # 中止分块传输，见类说明
+            print(f"导出失败: {self._error_message(e)}")
+            raise
+
+    def _ndjson_stream(self, index, query, sort, limit):
+        try:
+            for hits in self.iter_hits(index, query, sort, limit=limit):
+                yield ''.join(json.dumps(dict(hit['_source'], _id=hit['_id']), ensure_ascii=False) + '\n'
+                              for hit in hits)
+        except Exception as e:
+            print(f"导出失败: {str(e)}")
+            yield json.dumps({'error': f'导出中断: {self._error_message(e)}'}, ensure_ascii=False) + '\n'
+
+    def _error_message(self, error):
+        if isinstance(error, NotFoundError):
+            return '导出时间过长，PIT已过期'
+        return str(error)
@@ -0,0 +1,196 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.ledger import Ledger
+from services.lookup_store import hash_keys
+
+# 没有时间戳的行
+UNKNOWN_TS = -1
+
+
+class ImportManifest:
+    """增量导入清单：已写入索引的每个文档的行哈希和更新时间，以及每个文件的水位线
+
+    文件结构（data/import_manifest）:
+        <类型>.npz   文档ID哈希 -> 行哈希、last_modify_ts（缺失时为add_ts）
+        <类型>.json  清单对应的实体索引、各文件的内容哈希、水位线和上次导入统计
+
+    行哈希按转换后的文档字段计算（包含关联出的项目、视频信息），账号或视频归属变化的行同样视为已变化。
+    增量模式下跳过哈希未变的行，以及时间戳早于已写入版本的行（旧文件重复上传）；
+    其余模式只记录不跳过。清单只对其记录的实体索引有效，别名切换到其他版本后从空清单开始。
+    """
+
+    def __init__(self, data_type, path='data/import_manifest'):
+        self.data_type = data_type
+        self.path = path
+        self.index = None
+        self.incremental = False
+        self.progress = None
+        self.files = {}
+        self.ledger = Ledger(['row_hash', 'ts'])
+        self.current_file = None
+        self._file_stats = None
+        self._previous_watermark = None
+        # 进程池中转换时记录当前文件写入清单的记录，随结果交给主进程合并
+        self.collect_updates = False
+        self._updates = []
+
+    def __getstate__(self):
+        # 传给导入进程池的工作进程时不带进度（其中的锁不能pickle），跳过的行数由主进程汇总
+        return dict(self.__dict__, progress=None)
+
+    def begin(self, index, incremental=False, progress=None):
+        """加载index对应的清单；返回是否可按清单跳过未变化的行"""
+        self.index = index
+        self.progress = progress
+        meta = self._load_meta()
+        data = self._load_arrays() if meta is not None and meta.get('index') == index else None
+        if data is not None:
+            self.files = meta.get('files', {})
+            if len(data['keys']):
+                self.ledger.segments = [(data['keys'], {'row_hash': data['row_hash'], 'ts': data['ts']})]
+        elif incremental:
+            print(f"⚠️ {index} 没有可用的增量导入清单，本次写入全部行")
+        self.incremental = incremental and data is not None
+        return self.incremental
+
+    def start_file(self, file_path, sha1=None):
+        """开始导入一个文件，之后的 select 结果计入该文件"""
+        self.current_file = file_path
+        self._previous_watermark = self.files.get(file_path, {}).get('watermark')
+        self._updates = []
+        stat = os.stat(file_path)
+        self._file_stats = {'rows': 0, 'written': 0, 'skipped': 0, 'stale': 0, 'above_watermark': 0,
+                            'watermark': self._previous_watermark, 'previous_watermark': self._previous_watermark,
+                            'sha1': sha1, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def imported(self, sha1):
+        """内容相同的文件已导入到该索引时返回其路径"""
+        for path, entry in self.files.items():
+            if sha1 and entry.get('sha1') == sha1:
+                return path
+        return None
+
+    def select(self, columns, id_field):
+        """比较一个数据块与清单，返回只含新增或已变化行的列；所有写入的行记入清单"""
+        ids = columns[id_field]
+        count = len(ids)
+        if count == 0:
+            return columns
+
+        hashes = hash_keys(ids)
+        row_hashes = pd.util.hash_pandas_object(pd.DataFrame(columns).astype(str), index=False).to_numpy()
+        timestamps = self._timestamps(columns)
+
+        found, stored = self.ledger.lookup(hashes)
+        write = np.ones(count, dtype=bool)
+        stale = np.zeros(count, dtype=bool)
+        if self.incremental:
+            unchanged = found & (stored['row_hash'].view(np.uint64) == row_hashes)
+            # 已写入的版本更新：旧文件重复上传时不回退文档
+            stale = found & ~unchanged & (timestamps != UNKNOWN_TS) & (timestamps < stored['ts'])
+            write = ~(unchanged | stale)
+
+        # 同一块内重复的ID以最后一条为准
+        written = np.flatnonzero(write)
+        if len(written):
+            keys, last_in_reversed = np.unique(hashes[written][::-1], return_index=True)
+            latest = written[len(written) - 1 - last_in_reversed]
+            values = {'row_hash': row_hashes[latest].view(np.int64), 'ts': timestamps[latest]}
+            self.ledger.upsert(keys, values)
+            if self.collect_updates:
+                self._updates.append((keys, values))
+
+        self._count(count, int(write.sum()), int(stale.sum()), timestamps)
+        if write.all():
+            return columns
+        return {name: [values[i] for i in written] for name, values in columns.items()}
+
+    def report(self):
+        """当前文件的导入统计"""
+        return dict(self._file_stats) if self._file_stats is not None else None
+
+    def finish_file(self):
+        """当前文件导入完成，记录水位线"""
+        if self.current_file is None:
+            return None
+        report = self.report()
+        self.files[self.current_file] = dict(report, imported_at=time.time())
+        print(f"📑 {os.path.basename(self.current_file)}: {report['rows']} 行，写入 {report['written']} 行，"
+              f"跳过未变化 {report['skipped'] - report['stale']} 行、过期 {report['stale']} 行，"
+              f"水位线 {report['previous_watermark']} -> {report['watermark']}")
+        self.current_file = None
+        return report
+
+    def take_updates(self):
+        """取出当前文件写入清单的记录"""
+        updates, self._updates = self._updates, []
+        return updates
+
+    def merge_file(self, file_path, report, updates):
+        """合并工作进程中转换的文件：写入清单记录和文件统计"""
+        for keys, values in updates:
+            self.ledger.upsert(keys, values)
+        self.files[file_path] = dict(report, imported_at=time.time())
+
+    def save(self):
+        """原子写入清单（只在全部行写入成功后调用）"""
+        os.makedirs(self.path, exist_ok=True)
+        keys, values = self.ledger.compacted()
+        tmp_path = os.path.join(self.path, f'.{self.data_type}.{os.getpid()}.tmp.npz')
+        np.savez(tmp_path, keys=keys, **values)
+        os.replace(tmp_path, self._file('npz'))
+
+        tmp_path = os.path.join(self.path, f'.{self.data_type}.{os.getpid()}.tmp.json')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'index': self.index, 'files': self.files, 'documents': int(len(keys)),
+                       'updated_at': time.time()}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._file('json'))
+
+    def _count(self, rows, written, stale, timestamps):
+        stats = self._file_stats
+        if stats is None:
+            return
+        stats['rows'] += rows
+        stats['written'] += written
+        stats['skipped'] += rows - written
+        stats['stale'] += stale
+        known = timestamps[timestamps != UNKNOWN_TS]
+        if self._previous_watermark is not None:
+            stats['above_watermark'] += int((known > self._previous_watermark).sum())
+        if len(known):
+            stats['watermark'] = max(stats['watermark'] or UNKNOWN_TS, int(known.max()))
+        if self.progress is not None and rows > written:
+            self.progress.skip(rows - written)
+
+    def _timestamps(self, columns):
+        """每行的更新时间：last_modify_ts，缺失时取add_ts"""
+        count = len(next(iter(columns.values())))
+        timestamps = np.full(count, UNKNOWN_TS, dtype=np.int64)
+        for name in ('add_ts', 'last_modify_ts'):
+            values = pd.to_numeric(pd.Series(columns.get(name, [None] * count), dtype=object),
+                                   errors='coerce').to_numpy(dtype=float)
+            known = ~np.isnan(values)
+            timestamps[known] = values[known].astype(np.int64)
+        return timestamps
+
+    def _file(self, extension):
+        return os.path.join(self.path, f'{self.data_type}.{extension}')
+
+    def _load_meta(self):
+        try:
+            with open(self._file('json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _load_arrays(self):
+        try:
+            with np.load(self._file('npz')) as data:
+                return {key: data[key] for key in data.files}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
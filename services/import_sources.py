@@ -0,0 +1,132 @@
+import glob
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# 清单文件：每行一个CSV路径或通配符（相对清单所在目录），#开头为注释
+LIST_SUFFIXES = ('.txt', '.list')
+
+
+class ImportSources:
+    """导入数据源登记
+
+    每种数据（videos / comments）的来源是一组条目，按配置顺序展开：
+      - 文件: 直接使用
+      - 目录: 目录下（含子目录）的全部 *.csv
+      - 通配符: glob，支持 **
+      - 清单: *.txt / *.list，每行一个路径或通配符
+    同一条目展开的文件按路径排序，同一文件只出现一次，因此导入顺序是确定的，后导入的文件覆盖先导入的同ID文档。
+    来源由 IMPORT_VIDEO_SOURCES / IMPORT_COMMENT_SOURCES 配置（逗号分隔），默认为原导出文件和上传目录。
+    多个文件在 IMPORT_FILE_WORKERS 个进程中并行读取和转换（见 map_files），进程数不超过可用CPU数：
+    转换是纯计算，进程多于CPU时只增加进程启动和结果传输的开销。
+    """
+
+    def __init__(self, defaults, upload_dir='data/uploads', workers=None):
+        self.upload_dir = upload_dir
+        self.workers = min(int(workers or os.getenv('IMPORT_FILE_WORKERS') or 4), available_cpus())
+        self.sources = {}
+        for data_type, files in defaults.items():
+            configured = os.getenv(f'IMPORT_{data_type[:-1].upper()}_SOURCES', '')
+            entries = [entry.strip() for entry in configured.split(',') if entry.strip()]
+            self.sources[data_type] = entries or list(files) + [os.path.join(upload_dir, data_type)]
+
+    def resolve(self, data_type):
+        """展开数据源，返回按导入顺序排列的已存在文件"""
+        files = []
+        seen = set()
+        for entry in self.sources.get(data_type, []):
+            for path in self._expand(entry):
+                key = os.path.realpath(path)
+                if key not in seen:
+                    seen.add(key)
+                    files.append(path)
+        return files
+
+    def upload_path(self, data_type, filename):
+        """上传文件在上传目录中的保存路径，以时间戳开头，按上传顺序排序"""
+        directory = os.path.join(self.upload_dir, data_type)
+        os.makedirs(directory, exist_ok=True)
+        name = os.path.basename(filename) or f'{data_type}.csv'
+        return os.path.join(directory, f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{name}")
+
+    def content_hash(self, path, known=None):
+        """文件内容的sha1；大小和修改时间与known（上次导入的记录）一致时直接复用"""
+        stat = os.stat(path)
+        if known and known.get('sha1') and known.get('size') == stat.st_size and known.get('mtime') == stat.st_mtime:
+            return known['sha1']
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    def map_files(self, task, items, initializer=None, initargs=()):
+        """按items顺序产出 (item, task(item))
+
+        多于一个文件时在进程池中执行，task、initializer和initargs须可pickle（模块级函数或其partial），
+        工作进程由initializer按initargs重建所需的状态，不依赖模块全局变量，多个导入任务可以同时调用。
+        当前进程只有一个线程时以fork启动工作进程；在导入任务线程等多线程环境中改用forkserver或spawn，
+        避免子进程继承其他线程持有的锁。
+        同时最多提交 2×进程数 个文件，结果按顺序取回，主进程可以边写入前面的文件边等待后面的文件。
+        只有一个进程时在当前进程中依次执行。
+        """
+        items = list(items)
+        if self.workers <= 1 or len(items) <= 1:
+            for item in items:
+                yield item, task(item)
+            return
+
+        pool = ProcessPoolExecutor(max_workers=min(self.workers, len(items)), mp_context=start_context(),
+                                   initializer=initializer, initargs=initargs)
+        try:
+            remaining = iter(items)
+            futures = deque()
+            for item in remaining:
+                futures.append((item, pool.submit(task, item)))
+                if len(futures) >= self.workers * 2:
+                    break
+            while futures:
+                item, future = futures.popleft()
+                result = future.result()
+                for next_item in remaining:
+                    futures.append((next_item, pool.submit(task, next_item)))
+                    break
+                yield item, result
+        finally:
+            # 提前结束（出错或取消）时不再启动排队中的文件
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _expand(self, entry):
+        if any(ch in entry for ch in '*?['):
+            return sorted(path for path in glob.glob(entry, recursive=True) if os.path.isfile(path))
+        if os.path.isdir(entry):
+            return sorted(glob.glob(os.path.join(entry, '**', '*.csv'), recursive=True))
+        if os.path.isfile(entry) and entry.endswith(LIST_SUFFIXES):
+            base = os.path.dirname(entry)
+            files = []
+            with open(entry, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        files.extend(self._expand(line if os.path.isabs(line) else os.path.join(base, line)))
+            return files
+        return [entry] if os.path.isfile(entry) else []
+
+
+def available_cpus():
+    """当前进程可用的CPU数（考虑CPU亲和性限制）"""
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def start_context():
+    """进程池的启动方式：单线程时fork，多线程时forkserver（不可用时spawn）"""
+    methods = multiprocessing.get_all_start_methods()
+    if 'fork' in methods and threading.active_count() == 1:
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
@@ -0,0 +1,158 @@
+import os
+import time
+from datetime import datetime
+
+from elasticsearch import NotFoundError
+
+
+class IndexAliases:
+    """版本化索引与别名（蓝绿切换）
+
+    搜索、统计和导出都通过别名（videos_search / comments_search）访问，别名指向
+    <别名>_v<时间戳> 版本索引。重建时在新版本索引中完成导入后一次性切换别名，
+    切换前搜索始终读取旧版本；保留最近 INDEX_VERSIONS_KEEP 个版本用于回滚，更早的自动删除。
+    旧部署中与别名同名的实体索引在第一次切换时随同一个请求删除。
+    """
+
+    def __init__(self, es_service):
+        self.es_service = es_service
+        # 保留的版本数（含当前版本）
+        self.keep = max(1, int(os.getenv('INDEX_VERSIONS_KEEP', 2)))
+
+    def ensure(self, alias, body):
+        """别名和实体索引都不存在时创建第一个版本"""
+        es = self.es_service.require_es_client()
+        if es.indices.exists_alias(name=alias) or es.indices.exists(index=alias):
+            return
+        index = self.create_version(alias, body)
+        self._mark_released(es, index)
+        es.indices.update_aliases(body={'actions': [{'add': {'index': index, 'alias': alias}}]})
+        print(f"✅ 创建索引 {index}，别名 {alias}")
+
+    def create_version(self, alias, body):
+        """创建新的版本索引（尚未挂到别名上）；先删除之前中途退出遗留的未完成版本"""
+        self.discard_orphans(alias)
+        index = f"{alias}_v{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        self.es_service.require_es_client().indices.create(index=index, body=body)
+        return index
+
+    def current(self, alias):
+        """别名当前指向的版本索引；旧部署的实体索引返回其本身，都不存在时返回None"""
+        es = self.es_service.require_es_client()
+        try:
+            indices = sorted(es.indices.get_alias(name=alias))
+            if indices:
+                return indices[-1]
+        except NotFoundError:
+            pass
+        return alias if es.indices.exists(index=alias) else None
+
+    def versions(self, alias):
+        """全部版本索引，按创建时间升序"""
+        try:
+            return sorted(self.es_service.require_es_client().indices.get_alias(index=f"{alias}_v*"))
+        except NotFoundError:
+            return []
+
+    def released(self, alias, current=None):
+        """挂上过别名的版本索引
+
+        还没有任何版本带标记时（标记之前创建的版本），当前版本及更早的版本视为挂过别名，
+        下次切换时补上标记。
+        """
+        try:
+            mappings = self.es_service.require_es_client().indices.get_mapping(index=f"{alias}_v*")
+        except NotFoundError:
+            return set()
+        released = {index for index, item in mappings.items()
+                    if item.get('mappings', {}).get('_meta', {}).get('released')}
+        if not released and current is not None:
+            released = {index for index in mappings if index <= current}
+        return released
+
+    def swap(self, alias, index):
+        """原子地把别名切换到index（切换前标记为已挂过别名）"""
+        es = self.es_service.require_es_client()
+        for version in self.released(alias, self.current(alias)) | {index}:
+            self._mark_released(es, version)
+        actions = []
+        try:
+            for old_index in es.indices.get_alias(name=alias):
+                actions.append({'remove': {'index': old_index, 'alias': alias}})
+        except NotFoundError:
+            if es.indices.exists(index=alias):
+                # 旧部署的同名实体索引，与挂别名在同一个请求中删除
+                actions.append({'remove_index': {'index': alias}})
+        actions.append({'add': {'index': index, 'alias': alias}})
+        es.indices.update_aliases(body={'actions': actions})
+        print(f"🔀 别名 {alias} 已切换到 {index}")
+
+    def rollback(self, alias):
+        """切换回当前版本之前（挂过别名）的版本，返回切换到的索引"""
+        current = self.current(alias)
+        released = self.released(alias, current)
+        previous = [index for index in self.versions(alias)
+                    if index in released and (current is None or index < current)]
+        if not previous:
+            raise ValueError('没有可回滚的版本')
+        self.swap(alias, previous[-1])
+        return previous[-1]
+
+    def cleanup(self, alias):
+        """删除超出保留数量的旧版本和未完成的版本，当前版本始终保留
+
+        以当前版本为基准，保留它之前最近的 INDEX_VERSIONS_KEEP-1 个挂过别名的版本；
+        晚于当前版本且挂过别名的版本（回滚前的版本）保留到下次重建。
+        """
+        current = self.current(alias)
+        versions = self.versions(alias)
+        released = self.released(alias, current)
+        older = [index for index in versions if index in released and current is not None and index < current]
+        keep = set(older[-(self.keep - 1):] if self.keep > 1 else []) | {current}
+        keep |= {index for index in versions if index in released and current is not None and index > current}
+        es = self.es_service.require_es_client()
+        for index in versions:
+            if index not in keep:
+                try:
+                    es.indices.delete(index=index)
+                    print(f"🗑️ 删除{'旧版本' if index in released else '未完成的'}索引 {index}")
+                except Exception as e:
+                    print(f"⚠️ 删除索引 {index} 失败: {str(e)}")
+
+    def discard_orphans(self, alias):
+        """删除晚于当前版本、从未挂过别名的版本（重建进程中途退出时遗留）"""
+        current = self.current(alias)
+        released = self.released(alias, current)
+        for index in self.versions(alias):
+            if index not in released and (current is None or index > current):
+                print(f"⚠️ 发现未完成的版本索引 {index}")
+                self.discard(index)
+
+    def discard(self, index):
+        """丢弃未切换的新版本（导入失败或取消时）"""
+        try:
+            self.es_service.require_es_client().indices.delete(index=index, ignore=[404])
+            print(f"🗑️ 已丢弃未完成的索引 {index}")
+        except Exception as e:
+            print(f"⚠️ 丢弃索引 {index} 失败: {str(e)}")
+
+    def _mark_released(self, es, index):
+        """在版本索引映射的 _meta 中标记已挂过别名（_meta整体替换，保留其中的其他标记）"""
+        mappings = es.indices.get_mapping(index=index)
+        meta = dict(next(iter(mappings.values()), {}).get('mappings', {}).get('_meta', {}))
+        if not meta.get('released'):
+            meta['released'] = int(time.time())
+            es.indices.put_mapping(index=index, body={'_meta': meta})
+
+    def describe(self, alias):
+        """各版本的文档数和是否为当前版本"""
+        es = self.es_service.require_es_client()
+        current = self.current(alias)
+        result = []
+        for index in self.versions(alias) or ([current] if current else []):
+            try:
+                docs = es.count(index=index)['count']
+            except Exception:
+                docs = None
+            result.append({'index': index, 'current': index == current, 'docs': docs})
+        return result
@@ -0,0 +1,393 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from services.bulk_indexer import ImportCancelled
+
+# 任务状态
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# 没有fcntl（Windows）时只在进程内互斥
+_local_import_lock = threading.Lock()
+
+
+class ImportBusy(RuntimeError):
+    """其他导入正在进行"""
+
+
+class ImportProgress:
+    """单个导入任务的进度记录，由导入流水线在每个批次后回调"""
+
+    def __init__(self, job_service, task_id):
+        self.job_service = job_service
+        self.task_id = task_id
+        self.started = time.time()
+        self.total_rows = 0
+        self.rows_processed = 0
+        self.rows_failed = 0
+        # 增量导入中未变化而跳过的行（计入已处理）
+        self.rows_skipped = 0
+        self.stage = None
+        # 各阶段的写入模式和吞吐量（见 BulkLoadSession.report）
+        self.throughput = {}
+        # 各文件的导入状态和统计
+        self.files = {}
+        self._lock = threading.Lock()
+        self._last_persist = 0
+        self._last_cancel_check = 0
+        self._cancelled = False
+
+    def set_stage(self, stage, total_rows=0):
+        """进入新的导入阶段（videos / comments），并累加预估总行数"""
+        with self._lock:
+            self.stage = stage
+            self.total_rows += total_rows
+        self.persist(force=True)
+
+    def record_throughput(self, stage, report):
+        with self._lock:
+            self.throughput[stage] = report
+        self.persist(force=True)
+
+    def file_status(self, path, status, **stats):
+        """记录文件的导入状态: pending / importing / done / duplicate"""
+        with self._lock:
+            entry = self.files.setdefault(path, {})
+            entry.update(stats, status=status)
+        self.persist(force=status != 'pending')
+
+    def advance(self, success, failed=0):
+        with self._lock:
+            self.rows_processed += success + failed
+            self.rows_failed += failed
+        self.persist()
+
+    def skip(self, rows):
+        with self._lock:
+            self.rows_processed += rows
+            self.rows_skipped += rows
+        self.persist()
+
+    def cancelled(self):
+        """是否已请求取消；跨进程时每秒最多检查一次取消标记文件"""
+        if self._cancelled or self.job_service.is_cancel_requested_locally(self.task_id):
+            self._cancelled = True
+            return True
+
+        now = time.time()
+        if now - self._last_cancel_check >= 1:
+            self._last_cancel_check = now
+            self._cancelled = os.path.exists(self.job_service.cancel_path(self.task_id))
+        return self._cancelled
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = max(time.time() - self.started, 1e-6)
+            rate = self.rows_processed / elapsed
+            remaining = max(self.total_rows - self.rows_processed, 0)
+            return {
+                'stage': self.stage,
+                'total_rows': self.total_rows,
+                'rows_processed': self.rows_processed,
+                'rows_failed': self.rows_failed,
+                'rows_skipped': self.rows_skipped,
+                'rows_per_second': round(rate, 1),
+                'eta_seconds': round(remaining / rate, 1) if rate > 0 else None,
+                'elapsed_seconds': round(elapsed, 1),
+                'throughput': dict(self.throughput),
+                'files': {path: dict(entry) for path, entry in self.files.items()}
+            }
+
+    def persist(self, force=False):
+        """写入任务文件，默认每秒最多一次"""
+        now = time.time()
+        if not force and now - self._last_persist < 1:
+            return
+        self._last_persist = now
+        self.job_service.update_job(self.task_id, progress=self.snapshot())
+
+
+class ImportJobService:
+    """后台导入任务管理
+
+    任务状态保存在 data/import_jobs/<task_id>.json，gunicorn的任意worker都能查询。
+    取消请求写入单独的 <task_id>.cancel 标记文件，不会被执行方的进度写入覆盖。
+    配置 IMPORT_BACKEND=celery 且Redis可用时通过Celery执行，否则使用进程内线程池。
+
+    导入会改写增量导入清单和看板预聚合，任务执行期间持有导入锁（data/import_jobs/import.lock 上的flock，
+    同一主机的所有进程互斥），其他任务排队等待。执行进程退出时锁随之释放，
+    因此状态为running但导入锁空闲的任务视为执行进程已退出，查询时标记为失败；
+    在线程池中排队（pending）的任务记录提交进程，该进程已退出时同样标记为失败。
+    """
+
+    def __init__(self, jobs_dir='data/import_jobs', max_workers=None, backend=None, runner=None):
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers or int(os.getenv('IMPORT_WORKERS', 1))
+        self.backend = backend or os.getenv('IMPORT_BACKEND', 'thread')
+        self.runner = runner or _run_import
+        self.executor = None
+        self._lock = threading.Lock()
+        self._cancel_events = {}
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def submit(self, import_params):
+        """创建导入任务并交给后台执行，立即返回task_id"""
+        task_id = str(uuid.uuid4())
+        self._write_job({
+            'task_id': task_id,
+            'status': PENDING,
+            'params': import_params,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'progress': None,
+            'message': '任务已排队'
+        })
+
+        if self.backend == 'celery' and self._submit_celery(task_id):
+            return task_id
+
+        # 线程池中排队的任务随本进程退出而丢失，记录进程以便查询时识别
+        self.update_job(task_id, pid=os.getpid(), pid_started=_process_start_time(os.getpid()))
+        with self._lock:
+            self._cancel_events[task_id] = threading.Event()
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                   thread_name_prefix='import-job')
+        self.executor.submit(self.run_job, task_id)
+        return task_id
+
+    def _submit_celery(self, task_id):
+        try:
+            if celery_app is None:
+                raise RuntimeError('Celery未安装或未启用')
+            celery_app.send_task('import_jobs.run_import_job', args=[task_id])
+            return True
+        except Exception as e:
+            print(f"⚠️ 提交Celery任务失败，改用进程内执行: {str(e)}")
+            return False
+
+    def run_job(self, task_id):
+        """执行导入任务（线程池或Celery worker中调用）"""
+        if not self.get_job(task_id):
+            return
+
+        try:
+            with contextlib.ExitStack() as stack:
+                try:
+                    stack.enter_context(self.import_lock(blocking=False))
+                except ImportBusy:
+                    self.update_job(task_id, message='等待其他导入任务完成')
+                    stack.enter_context(self.import_lock())
+                self._run_locked(task_id)
+        finally:
+            with self._lock:
+                self._cancel_events.pop(task_id, None)
+
+    def _run_locked(self, task_id):
+        """持有导入锁时执行任务，结束状态在释放锁之前写入"""
+        job = self.get_job(task_id)
+        if job.get('cancel_requested') or self.is_cancel_requested_locally(task_id):
+            self.update_job(task_id, status=CANCELLED, finished_at=datetime.now().isoformat(),
+                            message='任务在开始前已取消')
+            return
+
+        progress = ImportProgress(self, task_id)
+        self.update_job(task_id, status=RUNNING, started_at=datetime.now().isoformat(),
+                        message='导入中', pid=os.getpid())
+        try:
+            self.runner(job['params'], progress)
+            status, message = COMPLETED, '导入完成'
+        except ImportCancelled:
+            status, message = CANCELLED, '任务已取消'
+        except Exception as e:
+            print(f"❌ 导入任务 {task_id} 失败: {str(e)}")
+            status, message = FAILED, f'导入失败: {str(e)}'
+
+        self.update_job(task_id, status=status, finished_at=datetime.now().isoformat(),
+                        progress=progress.snapshot(), message=message)
+
+    @contextlib.contextmanager
+    def import_lock(self, blocking=True):
+        """跨进程的导入锁；blocking为False时拿不到锁抛出 ImportBusy"""
+        if fcntl is None:
+            if not _local_import_lock.acquire(blocking):
+                raise ImportBusy('其他导入任务正在进行，请稍后重试')
+            try:
+                yield
+            finally:
+                _local_import_lock.release()
+            return
+
+        with open(os.path.join(self.jobs_dir, 'import.lock'), 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ImportBusy('其他导入任务正在进行，请稍后重试')
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def fail_if_stale(self, job):
+        """执行进程已退出的任务标记为失败，返回最新的任务记录
+
+        running: 导入锁空闲；pending: 排队所在的进程已不存在（Celery排队的任务不记录进程，不做判断）。
+        """
+        if job is None:
+            return job
+        if job['status'] == PENDING and job.get('pid') and \
+                not _process_alive(job['pid'], job.get('pid_started')):
+            job = self.get_job(job['task_id'])
+            if job['status'] == PENDING:
+                print(f"⚠️ 导入任务 {job['task_id']} 排队所在的进程已退出，标记为失败")
+                job = self.update_job(job['task_id'], status=FAILED, finished_at=datetime.now().isoformat(),
+                                      message='导入失败: 排队所在的进程已退出，任务未执行')
+            return job
+        if job['status'] != RUNNING:
+            return job
+        try:
+            with self.import_lock(blocking=False):
+                # 持有锁后重新读取：执行方在释放锁之前写入结束状态
+                job = self.get_job(job['task_id'])
+                if job['status'] == RUNNING:
+                    print(f"⚠️ 导入任务 {job['task_id']} 的执行进程已退出，标记为失败")
+                    job = self.update_job(job['task_id'], status=FAILED, finished_at=datetime.now().isoformat(),
+                                          message='导入失败: 执行任务的进程已退出')
+        except ImportBusy:
+            pass
+        return job
+
+    def cancel_job(self, task_id):
+        """请求取消任务，正在执行的流水线会在下一个数据块前停止"""
+        job = self.fail_if_stale(self.get_job(task_id))
+        if not job:
+            return None
+        if job['status'] in FINISHED_STATES:
+            return job
+
+        with self._lock:
+            event = self._cancel_events.get(task_id)
+        if event:
+            event.set()
+        open(self.cancel_path(task_id), 'a').close()
+        return self.update_job(task_id, message='正在取消')
+
+    def is_cancel_requested_locally(self, task_id):
+        with self._lock:
+            event = self._cancel_events.get(task_id)
+        return bool(event and event.is_set())
+
+    def get_job(self, task_id):
+        try:
+            with open(self._job_path(task_id), 'r', encoding='utf-8') as f:
+                job = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, ValueError):
+            return None
+        job['cancel_requested'] = os.path.exists(self.cancel_path(task_id))
+        return job
+
+    def list_jobs(self, limit=20):
+        """按创建时间倒序列出最近的任务"""
+        jobs = []
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith('.json'):
+                job = self.fail_if_stale(self.get_job(name[:-5]))
+                if job:
+                    jobs.append(job)
+        jobs.sort(key=lambda job: job.get('created_at') or '', reverse=True)
+        return jobs[:limit]
+
+    def update_job(self, task_id, **fields):
+        with self._lock:
+            job = self.get_job(task_id)
+            if job is None:
+                return None
+            job.update(fields)
+            job['updated_at'] = datetime.now().isoformat()
+            self._write_job(job)
+            return job
+
+    def _job_path(self, task_id):
+        # task_id只允许uuid，避免路径穿越
+        return os.path.join(self.jobs_dir, f"{uuid.UUID(str(task_id))}.json")
+
+    def cancel_path(self, task_id):
+        return os.path.join(self.jobs_dir, f"{uuid.UUID(str(task_id))}.cancel")
+
+    def _write_job(self, job):
+        """原子写入任务文件"""
+        path = self._job_path(job['task_id'])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        job = {key: value for key, value in job.items() if key != 'cancel_requested'}
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+def _process_start_time(pid):
+    """进程的启动时间（Linux的/proc中以时钟滴答计），用于识别PID被复用；无法获取时返回None"""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            # 进程名可能含空格，从最后一个右括号之后按空格切分，启动时间为第22个字段
+            return int(f.read().rsplit(')', 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _process_alive(pid, started=None):
+    """本机上的进程是否仍在运行（且不是复用了同一PID的其他进程）"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    except OSError:
+        # 其他平台上无法判断时视为仍在运行
+        return True
+    return started is None or _process_start_time(pid) in (None, started)
+
+
+def _run_import(import_params, progress):
+    """默认的任务执行函数：每个任务使用独立的DataService实例"""
+    from services.data_service import DataService
+    if import_params.get('task') == 'rebuild_rollups':
+        DataService().rebuild_rollups(progress)
+    else:
+        DataService().import_data_sync(import_params, progress=progress)
+
+
+def create_celery_app():
+    """创建Celery应用，worker启动方式: celery -A services.job_service:celery_app worker"""
+    try:
+        from celery import Celery
+    except ImportError:
+        return None
+
+    app = Celery('bili_import', broker=os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+
+    @app.task(name='import_jobs.run_import_job')
+    def run_import_job(task_id):
+        ImportJobService(backend='thread').run_job(task_id)
+
+    return app
+
+
+celery_app = create_celery_app() if os.getenv('IMPORT_BACKEND') == 'celery' else None
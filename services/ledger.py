@@ -0,0 +1,62 @@
+import numpy as np
+
+
+class Ledger:
+    """按uint64键哈希保存若干int64列的记录（看板预聚合和增量导入清单共用）
+
+    RollupStore 用它记录文档已计入汇总的值（项目编号、日期、播放量），重复导入时先扣除旧值；
+    ImportManifest 用它记录每个文档的行哈希和更新时间。
+
+    分段保存：每次写入追加一个按键排序的段，新段不小于前一段时合并，
+    查找和写入的均摊开销为O(log n)。后写入的段覆盖先写入的同键记录。
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.segments = []
+
+    def lookup(self, hashes):
+        """返回 (是否存在, {列: 旧值数组})"""
+        found = np.zeros(len(hashes), dtype=bool)
+        values = {column: np.zeros(len(hashes), dtype=np.int64) for column in self.columns}
+        for keys, segment in reversed(self.segments):
+            if len(keys) == 0:
+                continue
+            positions = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+            hit = ~found & (keys[positions] == hashes)
+            for column in self.columns:
+                values[column][hit] = segment[column][positions[hit]]
+            found |= hit
+        return found, values
+
+    def upsert(self, hashes, values):
+        """写入一批键（批内不重复）"""
+        order = np.argsort(hashes, kind='stable')
+        self.segments.append((hashes[order], {column: np.asarray(values[column])[order]
+                                              for column in self.columns}))
+        while len(self.segments) >= 2 and len(self.segments[-1][0]) >= len(self.segments[-2][0]):
+            newer = self.segments.pop()
+            older = self.segments.pop()
+            self.segments.append(self._merge(older, newer))
+
+    def compacted(self):
+        """合并为单个段，返回 (键, {列: 值})"""
+        if not self.segments:
+            return np.array([], dtype=np.uint64), {column: np.array([], dtype=np.int64)
+                                                   for column in self.columns}
+        while len(self.segments) > 1:
+            newer = self.segments.pop()
+            older = self.segments.pop()
+            self.segments.append(self._merge(older, newer))
+        return self.segments[0]
+
+    def clear(self):
+        self.segments = []
+
+    def _merge(self, older, newer):
+        keys = np.concatenate([older[0], newer[0]])
+        # 同键保留较新的记录；np.unique同时完成排序
+        unique_keys, first_in_reversed = np.unique(keys[::-1], return_index=True)
+        selected = len(keys) - 1 - first_in_reversed
+        return unique_keys, {column: np.concatenate([older[1][column], newer[1][column]])[selected]
+                             for column in self.columns}
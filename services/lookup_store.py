@@ -0,0 +1,344 @@
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，只保证进程内互斥
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+
+# 没有fcntl时发布新版本只在进程内互斥
+_local_publish_lock = threading.Lock()
+
+
+def hash_keys(keys):
+    """将字符串键整列哈希为uint64，结果跨进程稳定"""
+    return pd.util.hash_array(np.asarray(keys, dtype=object))
+
+
+class LookupStore:
+    """按字符串键查找的紧凑磁盘索引
+
+    目录结构（每次写入生成新的版本目录，CURRENT文件原子切换）:
+        CURRENT              当前版本目录名
+        g<时间戳>/meta.json   格式版本、列定义、数据源签名等
+        g<时间戳>/keys.npy    排序后的uint64键哈希
+        g<时间戳>/<列>.npy    字符串列为int32字符串编号，整数列为int64
+        g<时间戳>/strings.bin 去重后的字符串池（utf-8字节）
+        g<时间戳>/offsets.npy 字符串池偏移
+
+    所有数组以mmap方式只读加载，多个进程共享同一份页缓存。
+    键只保存64位哈希，百万级键的碰撞概率可以忽略。
+    构建时字符串直接写入磁盘，大部分字符串互不相同的列（如评论内容）可设置intern=False，
+    跳过去重以免驻留表占用内存。
+    """
+
+    def __init__(self, path, string_columns=(), int_columns=(), intern=True):
+        self.path = path
+        self.string_columns = list(string_columns)
+        self.int_columns = list(int_columns)
+        self.intern = intern
+        self.meta = {}
+        self.generation = None
+        self.keys = None
+        self.columns = {}
+        self._pool = None
+        self._offsets = None
+
+    def __len__(self):
+        return 0 if self.keys is None else len(self.keys)
+
+    @property
+    def loaded(self):
+        return self.keys is not None
+
+    def load(self):
+        """加载当前版本，不存在或格式不匹配时返回False"""
+        generation = self._current_generation()
+        if not generation:
+            return False
+
+        directory = os.path.join(self.path, generation)
+        try:
+            with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if (meta.get('format_version') != FORMAT_VERSION
+                    or meta.get('string_columns') != self.string_columns
+                    or meta.get('int_columns') != self.int_columns):
+                return False
+
+            self.keys = np.load(os.path.join(directory, 'keys.npy'), mmap_mode='r')
+            self.columns = {
+                column: np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r')
+                for column in self.string_columns + self.int_columns
+            }
+            self._pool = self._map_file(os.path.join(directory, 'strings.bin'))
+            self._offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')
+            self.meta = meta
+            self.generation = generation
+            return True
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 加载查找索引失败 {self.path}: {str(e)}")
+            return False
+
+    def build(self, frames, key_column, meta=None):
+        """由DataFrame分块流式构建索引，重复键以后出现的为准"""
+        self._write(((hash_keys(frame[key_column].to_numpy()), frame) for frame in frames), meta)
+
+    def merge(self, frames, key_column, meta=None):
+        """将新数据合并进已有索引（新数据覆盖同键的旧数据），无已有索引时等同于build"""
+        if not self.loaded and not self.load():
+            return self.build(frames, key_column, meta)
+
+        existing = pd.DataFrame({
+            column: self._decode(np.asarray(self.columns[column]), '')
+            for column in self.string_columns
+        })
+        for column in self.int_columns:
+            existing[column] = np.asarray(self.columns[column])
+
+        def parts():
+            yield np.asarray(self.keys), existing
+            for frame in frames:
+                yield hash_keys(frame[key_column].to_numpy()), frame
+
+        merged_meta = dict(self.meta.get('extra', {}))
+        merged_meta.update(meta or {})
+        self._write(parts(), merged_meta)
+
+    def lookup(self, keys, defaults=None):
+        """整列查找，返回 {列名: 值列表}，未命中的键使用defaults中的默认值"""
+        defaults = defaults or {}
+        count = len(keys)
+        if not self.loaded or len(self.keys) == 0 or count == 0:
+            return {column: [defaults.get(column, '' if column in self.string_columns else 0)] * count
+                    for column in self.string_columns + self.int_columns}
+
+        hashes = hash_keys(keys)
+        positions = np.searchsorted(self.keys, hashes)
+        positions = np.minimum(positions, len(self.keys) - 1)
+        found = self.keys[positions] == hashes
+
+        result = {}
+        for column in self.string_columns:
+            codes = np.where(found, self.columns[column][positions], -1)
+            result[column] = self._decode(codes, defaults.get(column, ''))
+        for column in self.int_columns:
+            values = np.where(found, self.columns[column][positions], defaults.get(column, 0))
+            result[column] = values.tolist()
+        return result
+
+    def get(self, key):
+        """查找单个键，未命中返回None"""
+        if not self.loaded or len(self.keys) == 0:
+            return None
+        found = self.lookup([key], defaults={column: None for column in self.string_columns + self.int_columns})
+        row = {column: values[0] for column, values in found.items()}
+        if all(value is None for value in row.values()):
+            return None
+        return row
+
+    def unique_strings(self, column):
+        """字符串列中出现过的不同取值"""
+        if not self.loaded or len(self.keys) == 0:
+            return []
+        return self._decode(np.unique(np.asarray(self.columns[column])), '')
+
+    def is_current(self):
+        """已加载的版本是否仍是最新版本（其他进程可能已重建）"""
+        return self.loaded and self._current_generation() == self.generation
+
+    @property
+    def extra(self):
+        """写入时附带的自定义元数据（如数据源签名）"""
+        return self.meta.get('extra', {})
+
+    def _decode(self, codes, default):
+        """字符串编号转换为字符串，只解码去重后的编号"""
+        if len(codes) == 0:
+            return []
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        valid = np.maximum(unique_codes, 0)
+        starts = np.asarray(self._offsets[valid]).tolist()
+        ends = np.asarray(self._offsets[valid + 1]).tolist()
+        pool = self._pool
+        strings = np.empty(len(unique_codes), dtype=object)
+        strings[:] = [pool[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+        strings[unique_codes < 0] = default
+        return strings[inverse.reshape(-1)].tolist()
+
+    def _write(self, parts, meta):
+        """流式写入新的版本目录，并切换CURRENT
+
+        parts为 (键哈希数组, DataFrame) 的迭代器。字符串边读边追加到磁盘上的字符串池，
+        内存中只保留每行的哈希、编号和整数列；intern=True时相同字符串只写一次。
+        """
+        generation = f"g{time.time_ns()}"
+        os.makedirs(self.path, exist_ok=True)
+        tmp_directory = os.path.join(self.path, f".{generation}.{os.getpid()}.tmp")
+        os.makedirs(tmp_directory)
+
+        hashes = []
+        codes = {column: [] for column in self.string_columns}
+        ints = {column: [] for column in self.int_columns}
+        offsets = array('q', [0])
+        interned = {} if self.intern else None
+
+        with open(os.path.join(tmp_directory, 'strings.bin'), 'wb') as pool:
+            for part_hashes, frame in parts:
+                if not len(frame):
+                    continue
+                hashes.append(np.asarray(part_hashes, dtype=np.uint64))
+                for column in self.string_columns:
+                    codes[column].append(self._append_strings(frame[column], pool, offsets, interned))
+                for column in self.int_columns:
+                    ints[column].append(frame[column].to_numpy(dtype=np.int64))
+
+        # 重复键保留最后一次出现的记录；np.unique同时完成排序
+        all_hashes = np.concatenate(hashes) if hashes else np.array([], dtype=np.uint64)
+        keys, first_in_reversed = np.unique(all_hashes[::-1], return_index=True)
+        selected = len(all_hashes) - 1 - first_in_reversed
+
+        np.save(os.path.join(tmp_directory, 'keys.npy'), keys.astype(np.uint64))
+        for column in self.string_columns:
+            values = np.concatenate(codes[column]) if codes[column] else np.array([], dtype=np.int32)
+            np.save(os.path.join(tmp_directory, f'{column}.npy'), values[selected].astype(np.int32))
+        for column in self.int_columns:
+            values = np.concatenate(ints[column]) if ints[column] else np.array([], dtype=np.int64)
+            np.save(os.path.join(tmp_directory, f'{column}.npy'), values[selected])
+        np.save(os.path.join(tmp_directory, 'offsets.npy'), np.frombuffer(offsets, dtype=np.int64))
+
+        with open(os.path.join(tmp_directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'format_version': FORMAT_VERSION,
+                'string_columns': self.string_columns,
+                'int_columns': self.int_columns,
+                'rows': int(len(keys)),
+                'strings': len(offsets) - 1,
+                'created_at': time.time(),
+                'extra': meta or {}
+            }, f, ensure_ascii=False, indent=2)
+
+        self._publish(tmp_directory, generation)
+        self.load()
+
+    def _append_strings(self, values, pool, offsets, interned):
+        """将一列字符串追加到字符串池，返回每行的字符串编号"""
+        values = values.fillna('')
+        if interned is None:
+            encoded = [str(value).encode('utf-8') for value in values.tolist()]
+            base = len(offsets) - 1
+            pool.write(b''.join(encoded))
+            ends = offsets[-1] + np.cumsum([len(item) for item in encoded], dtype=np.int64)
+            offsets.extend(ends.tolist())
+            return np.arange(base, base + len(encoded), dtype=np.int32)
+
+        chunk_codes, uniques = pd.factorize(values.to_numpy(dtype=object))
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            value = str(value)
+            code = interned.get(value)
+            if code is None:
+                encoded = value.encode('utf-8')
+                code = interned[value] = len(offsets) - 1
+                pool.write(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+            mapping[i] = code
+        return mapping[chunk_codes]
+
+    def _map_file(self, path):
+        """只读mmap整个文件；空文件无法mmap，直接返回空字节串"""
+        if os.path.getsize(path) == 0:
+            return b''
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _current_generation(self):
+        try:
+            with open(os.path.join(self.path, 'CURRENT'), 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _set_current(self, generation):
+        tmp_path = os.path.join(self.path, f"CURRENT.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(generation)
+        os.replace(tmp_path, os.path.join(self.path, 'CURRENT'))
+
+    def _publish(self, tmp_directory, generation):
+        """在发布锁内切换CURRENT并清理旧版本
+
+        多个进程同时构建时，CURRENT只会指向更新的版本；清理时重新读取CURRENT，
+        只删除比它旧的版本，不会删掉其他进程刚发布的版本。
+        """
+        with self._publish_lock():
+            os.rename(tmp_directory, os.path.join(self.path, generation))
+            current = self._current_generation()
+            if _generation_time(current) < _generation_time(generation):
+                self._set_current(generation)
+                current = generation
+            self._cleanup(current)
+
+    @contextmanager
+    def _publish_lock(self):
+        with _local_publish_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.path, 'publish.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _cleanup(self, current):
+        """删除比当前版本旧的版本目录，以及构建进程已退出的临时目录
+
+        已mmap旧版本的进程在文件删除后仍可继续读取。
+        """
+        current_time = _generation_time(current)
+        for name in os.listdir(self.path):
+            if name.startswith('g'):
+                stale = _generation_time(name) < current_time
+            elif name.startswith('.g') and name.endswith('.tmp'):
+                stale = not _builder_alive(name)
+            else:
+                continue
+            if stale:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+
+def _generation_time(name):
+    """版本目录名中的时间戳，无法解析时返回-1"""
+    try:
+        return int(name[1:])
+    except (TypeError, ValueError):
+        return -1
+
+
+def _builder_alive(tmp_name):
+    """临时目录（.g<时间戳>.<PID>.tmp）的构建进程是否仍在运行；无法判断时视为仍在运行"""
+    try:
+        pid = int(tmp_name.split('.')[2])
+    except (IndexError, ValueError):
+        # 旧格式的临时目录没有PID，只能是已中断的构建
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+
+
+class ProjectCatalog:
+    """项目目录：各项目的视频数、评论数和索引文档总数
+
+    目录保存在进程内，/projects 和数据统计直接从内存按权限过滤返回。
+    以下情况下一次请求时重新统计：
+      - 距上次统计超过 PROJECT_CATALOG_TTL 秒
+      - 导入或清空数据后（搜索缓存的索引版本号变化，其他worker和导入进程同样可见）
+    统计使用composite聚合分页遍历全部项目，项目数量没有上限。
+    """
+
+    def __init__(self, es_service, ttl=None, page_size=None):
+        self.es_service = es_service
+        self.ttl = ttl if ttl is not None else int(os.getenv('PROJECT_CATALOG_TTL', 300))
+        self.page_size = page_size or int(os.getenv('PROJECT_CATALOG_PAGE_SIZE', 1000))
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def projects(self, current_user):
+        """返回用户可访问的项目列表，按文档数量降序"""
+        snapshot = self.snapshot()
+        projects = snapshot['projects']
+        if current_user['role'] != 'admin':
+            project_access = set(current_user.get('project_access', []))
+            projects = [project for project in projects if project['id'] in project_access]
+        return [dict(project) for project in projects]
+
+    def totals(self):
+        """返回 (视频总数, 评论总数, 项目数)"""
+        snapshot = self.snapshot()
+        return snapshot['videos'], snapshot['comments'], len(snapshot['projects'])
+
+    def snapshot(self):
+        """返回当前目录，过期或数据变化时重新统计；统计失败时沿用旧目录"""
+        generations = self._generations()
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot, generations):
+            return snapshot
+
+        with self._lock:
+            # 等待锁期间其他线程可能已完成统计
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot, generations):
+                return snapshot
+            try:
+                snapshot = self._load(generations)
+            except Exception:
+                if snapshot is None:
+                    raise
+                print("⚠️ 项目目录统计失败，沿用上次结果")
+                return snapshot
+            self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self):
+        """丢弃当前进程的目录，下次请求时重新统计"""
+        self._snapshot = None
+
+    def _is_fresh(self, snapshot, generations):
+        return (snapshot is not None and snapshot['generations'] == generations
+                and time.monotonic() - snapshot['loaded_at'] < self.ttl)
+
+    def _generations(self):
+        cache = self.es_service.search_cache
+        return (cache.generation(self.es_service.video_index),
+                cache.generation(self.es_service.comment_index))
+
+    def _load(self, generations):
+        video_total, video_counts = self._count_projects(self.es_service.video_index)
+        comment_total, comment_counts = self._count_projects(self.es_service.comment_index)
+
+        projects = []
+        for project_id in set(video_counts) | set(comment_counts):
+            video_count = video_counts.get(project_id, 0)
+            comment_count = comment_counts.get(project_id, 0)
+            projects.append({
+                'id': project_id,
+                'name': project_id,
+                'doc_count': video_count + comment_count,
+                'video_count': video_count,
+                'comment_count': comment_count
+            })
+        # 按文档数量降序排序，数量相同时按项目名
+        projects.sort(key=lambda project: (-project['doc_count'], project['id']))
+
+        return {
+            'projects': projects,
+            'videos': video_total,
+            'comments': comment_total,
+            'generations': generations,
+            'loaded_at': time.monotonic()
+        }
+
+    def _count_projects(self, index):
+        """用composite聚合分页统计索引中每个项目的文档数，返回 (文档总数, {项目: 文档数})
+
+        熔断期间（不使用模拟客户端的空结果）或响应中没有聚合结果时抛出异常，由 snapshot 沿用旧目录。
+        """
+        es = self.es_service.require_es_client()
+        counts = {}
+        total = 0
+        after_key = None
+
+        while True:
+            composite = {
+                "size": self.page_size,
+                "sources": [{"project_id": {"terms": {"field": "project_id"}}}]
+            }
+            if after_key is not None:
+                composite["after"] = after_key
+            body = {
+                "size": 0,
+                "track_total_hits": after_key is None,
+                "aggs": {"projects": {"composite": composite}}
+            }
+            response = es.search(index=index, body=body)
+
+            if after_key is None:
+                hits_total = response.get('hits', {}).get('total', 0)
+                total = hits_total.get('value', 0) if isinstance(hits_total, dict) else hits_total
+
+            aggregation = response.get('aggregations', {}).get('projects')
+            if aggregation is None:
+                raise ValueError(f'{index} 的项目统计响应中没有聚合结果')
+            buckets = aggregation.get('buckets', [])
+            for bucket in buckets:
+                counts[bucket['key']['project_id']] = bucket['doc_count']
+
+            after_key = aggregation.get('after_key')
+            if len(buckets) < self.page_size or after_key is None:
+                break
+
+        return total, counts
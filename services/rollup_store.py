@@ -0,0 +1,306 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.ledger import Ledger
+from services.lookup_store import hash_keys
+
+# 播放量超过该值视为爆文
+VIRAL_THRESHOLD = 1000
+
+# 没有发布时间的文档计入该日期，只在不限时间范围时统计
+UNKNOWN_DAY = -1
+
+CELL_COLUMNS = ['video_count', 'total_plays', 'max_plays', 'viral_count', 'comment_count']
+
+
+class RollupStore:
+    """按 项目 × 天 预聚合的看板指标
+
+    每个单元格保存视频数、总播放量、最高播放量、爆文数和评论数，导入时按数据块增量更新。
+    单元格文件 cells.npz 很小，看板查询时整体加载到内存，按日期和项目过滤后求和，耗时在毫秒以下。
+    最小粒度为一天：最近N天按含今天在内的N个自然日统计。
+    账本 videos_ledger.npz / comments_ledger.npz 记录每个文档已计入的值，只在导入时使用。
+    日期按 ROLLUP_TZ_OFFSET（小时，默认东八区）划分。
+    """
+
+    def __init__(self, path='data/rollups', tz_offset_hours=None):
+        self.path = path
+        hours = tz_offset_hours if tz_offset_hours is not None else float(os.getenv('ROLLUP_TZ_OFFSET', 8))
+        self.tz_offset = int(hours * 3600)
+        self._lock = threading.RLock()
+        self._loaded_mtime = None
+        self._ledgers_loaded = False
+        self._dirty_max = False
+        self.projects = []
+        self._project_codes = {}
+        self.cells = {}
+        self._arrays = None
+        self.video_ledger = Ledger(['project', 'day', 'plays'])
+        self.comment_ledger = Ledger(['project', 'day'])
+
+    # ---------- 日期 ----------
+
+    def day_of(self, timestamp):
+        """秒级时间戳所在的日期编号"""
+        return int((int(timestamp) + self.tz_offset) // 86400)
+
+    def is_day_start(self, timestamp):
+        return (int(timestamp) + self.tz_offset) % 86400 == 0
+
+    def _days(self, create_times):
+        values = pd.to_numeric(pd.Series(create_times, dtype=object), errors='coerce').to_numpy(dtype=float)
+        days = np.full(len(values), UNKNOWN_DAY, dtype=np.int64)
+        known = ~np.isnan(values)
+        days[known] = ((values[known].astype(np.int64) + self.tz_offset) // 86400)
+        return days
+
+    # ---------- 增量更新（导入时调用） ----------
+
+    def apply_videos(self, video_ids, project_ids, create_times, play_counts):
+        """计入一个数据块的视频；已计入过的视频先扣除旧值"""
+        with self._lock:
+            self._ensure_ledgers()
+            hashes, selected = self._dedupe(video_ids)
+            codes = self._codes(project_ids)[selected]
+            days = self._days(create_times)[selected]
+            plays = np.asarray(play_counts, dtype=np.int64)[selected]
+
+            found, old = self.video_ledger.lookup(hashes)
+            if found.any():
+                self._add_videos(old['project'][found], old['day'][found], old['plays'][found], -1)
+            self._add_videos(codes, days, plays, 1)
+            self.video_ledger.upsert(hashes, {'project': codes, 'day': days, 'plays': plays})
+
+    def apply_comments(self, comment_ids, project_ids, create_times):
+        """计入一个数据块的评论；已计入过的评论先扣除旧值"""
+        with self._lock:
+            self._ensure_ledgers()
+            hashes, selected = self._dedupe(comment_ids)
+            codes = self._codes(project_ids)[selected]
+            days = self._days(create_times)[selected]
+
+            found, old = self.comment_ledger.lookup(hashes)
+            if found.any():
+                self._add_comments(old['project'][found], old['day'][found], -1)
+            self._add_comments(codes, days, 1)
+            self.comment_ledger.upsert(hashes, {'project': codes, 'day': days})
+
+    def reset(self, videos=True, comments=True):
+        """清空视频或评论部分的汇总（对应索引被清空时）"""
+        with self._lock:
+            self._ensure_ledgers()
+            for cell in self.cells.values():
+                if videos:
+                    cell[:4] = 0
+                if comments:
+                    cell[4] = 0
+            if videos:
+                self.video_ledger.clear()
+            if comments:
+                self.comment_ledger.clear()
+            self.cells = {key: cell for key, cell in self.cells.items() if cell.any()}
+            self._arrays = None
+
+    def discard(self):
+        """丢弃尚未保存的更新（导入失败或有写入失败的行时），之后的查询重新读取文件"""
+        with self._lock:
+            self._ledgers_loaded = False
+            self._dirty_max = False
+            self.video_ledger.clear()
+            self.comment_ledger.clear()
+            self.cells = {}
+            self.projects = []
+            self._project_codes = {}
+            self._arrays = None
+
+    def save(self):
+        """原子写入账本和单元格文件"""
+        with self._lock:
+            if not self._ledgers_loaded:
+                return
+            if self._dirty_max:
+                self._recompute_max()
+            os.makedirs(self.path, exist_ok=True)
+
+            for name, ledger in (('videos_ledger', self.video_ledger), ('comments_ledger', self.comment_ledger)):
+                keys, values = ledger.compacted()
+                self._save_npz(name, keys=keys, **values)
+
+            keys = sorted(self.cells)
+            matrix = np.array([self.cells[key] for key in keys], dtype=np.int64).reshape(-1, len(CELL_COLUMNS))
+            self._save_npz('cells',
+                           projects=np.array(self.projects, dtype=str),
+                           project=np.array([key[0] for key in keys], dtype=np.int64),
+                           day=np.array([key[1] for key in keys], dtype=np.int64),
+                           tz_offset=np.array([self.tz_offset]),
+                           updated_at=np.array([time.time()]),
+                           **{column: matrix[:, i] for i, column in enumerate(CELL_COLUMNS)})
+            # 释放账本，之后的查询从文件读取，其他进程的导入结果也能看到
+            self._ledgers_loaded = False
+            self.video_ledger.clear()
+            self.comment_ledger.clear()
+            self.cells = {}
+            self._arrays = None
+
+    # ---------- 查询（看板调用） ----------
+
+    def available(self):
+        """单元格文件存在且日期划分与当前配置一致"""
+        return self._current_arrays() is not None
+
+    def summarize(self, start_day=None, end_day=None, project_id=None):
+        """按项目汇总某个日期范围（含两端）内的单元格
+
+        返回 {'projects': 项目名列表, 列名: 各项目的值数组}；
+        指定日期范围时不包含没有发布时间的文档。
+        """
+        arrays = self._current_arrays()
+        if arrays is None:
+            return None
+
+        mask = np.ones(len(arrays['day']), dtype=bool)
+        if start_day is not None or end_day is not None:
+            mask &= arrays['day'] != UNKNOWN_DAY
+        if start_day is not None:
+            mask &= arrays['day'] >= start_day
+        if end_day is not None:
+            mask &= arrays['day'] <= end_day
+        if project_id is not None:
+            code = arrays['codes'].get(project_id)
+            if code is None:
+                mask[:] = False
+            else:
+                mask &= arrays['project'] == code
+
+        count = len(arrays['projects'])
+        projects = arrays['project'][mask]
+        result = {'projects': arrays['projects']}
+        for column in CELL_COLUMNS:
+            values = arrays[column][mask]
+            if column == 'max_plays':
+                maxima = np.zeros(count, dtype=np.int64)
+                np.maximum.at(maxima, projects, values)
+                result[column] = maxima
+            else:
+                result[column] = np.bincount(projects, weights=values, minlength=count).astype(np.int64)
+        return result
+
+    # ---------- 内部实现 ----------
+
+    def _dedupe(self, ids):
+        """整块哈希并去重（同一块内重复的ID以最后一条为准）"""
+        hashes = hash_keys(ids)
+        unique_hashes, first_in_reversed = np.unique(hashes[::-1], return_index=True)
+        selected = len(hashes) - 1 - first_in_reversed
+        return unique_hashes, selected
+
+    def _codes(self, project_ids):
+        codes = np.empty(len(project_ids), dtype=np.int64)
+        for i, project_id in enumerate(project_ids):
+            code = self._project_codes.get(project_id)
+            if code is None:
+                code = self._project_codes[project_id] = len(self.projects)
+                self.projects.append(project_id)
+            codes[i] = code
+        return codes
+
+    def _add_videos(self, codes, days, plays, sign):
+        frame = pd.DataFrame({'project': codes, 'day': days, 'plays': plays,
+                              'viral': (plays > VIRAL_THRESHOLD).astype(np.int64)})
+        grouped = frame.groupby(['project', 'day']).agg(
+            count=('plays', 'size'), total=('plays', 'sum'), max=('plays', 'max'), viral=('viral', 'sum'))
+        for (code, day), row in zip(grouped.index, grouped.itertuples(index=False)):
+            cell = self.cells.setdefault((int(code), int(day)), np.zeros(len(CELL_COLUMNS), dtype=np.int64))
+            cell[0] += sign * row.count
+            cell[1] += sign * row.total
+            cell[3] += sign * row.viral
+            if sign > 0:
+                cell[2] = max(cell[2], row.max)
+            elif row.max >= cell[2]:
+                # 扣除的文档可能是该单元格的最高播放量，保存前按账本重新计算
+                self._dirty_max = True
+        self._arrays = None
+
+    def _add_comments(self, codes, days, sign):
+        frame = pd.DataFrame({'project': codes, 'day': days})
+        grouped = frame.groupby(['project', 'day']).size()
+        for (code, day), count in grouped.items():
+            cell = self.cells.setdefault((int(code), int(day)), np.zeros(len(CELL_COLUMNS), dtype=np.int64))
+            cell[4] += sign * count
+        self._arrays = None
+
+    def _recompute_max(self):
+        keys, values = self.video_ledger.compacted()
+        maxima = pd.DataFrame(values).groupby(['project', 'day'])['plays'].max() if len(keys) else {}
+        for key, cell in self.cells.items():
+            cell[2] = int(maxima.get(key, 0)) if len(keys) else 0
+        self._dirty_max = False
+
+    def _ensure_ledgers(self):
+        """首次更新前加载已有的账本和单元格"""
+        if self._ledgers_loaded:
+            return
+        cells = self._load_npz('cells')
+        if cells is not None and int(cells['tz_offset'][0]) == self.tz_offset:
+            self.projects = [str(project) for project in cells['projects']]
+            self._project_codes = {project: i for i, project in enumerate(self.projects)}
+            matrix = np.stack([cells[column] for column in CELL_COLUMNS], axis=1) if len(cells['day']) else []
+            self.cells = {(int(code), int(day)): np.array(row, dtype=np.int64)
+                          for code, day, row in zip(cells['project'], cells['day'], matrix)}
+            for name, ledger in (('videos_ledger', self.video_ledger), ('comments_ledger', self.comment_ledger)):
+                data = self._load_npz(name)
+                if data is not None and len(data['keys']):
+                    ledger.segments = [(data['keys'], {column: data[column] for column in ledger.columns})]
+        self._ledgers_loaded = True
+
+    def _current_arrays(self):
+        """看板查询使用的单元格数组；文件被其他进程更新后自动重新加载"""
+        with self._lock:
+            if self._ledgers_loaded:
+                # 导入进程直接使用内存中的最新单元格
+                if self._arrays is None:
+                    self._arrays = self._arrays_from_cells()
+                return self._arrays
+
+            try:
+                mtime = os.stat(self._file('cells')).st_mtime_ns
+            except FileNotFoundError:
+                return None
+            if self._arrays is None or mtime != self._loaded_mtime:
+                cells = self._load_npz('cells')
+                if cells is None or int(cells['tz_offset'][0]) != self.tz_offset:
+                    return None
+                projects = [str(project) for project in cells['projects']]
+                self._arrays = dict({column: cells[column] for column in CELL_COLUMNS},
+                                    project=cells['project'], day=cells['day'], projects=projects,
+                                    codes={project: i for i, project in enumerate(projects)})
+                self._loaded_mtime = mtime
+            return self._arrays
+
+    def _arrays_from_cells(self):
+        keys = sorted(self.cells)
+        matrix = np.array([self.cells[key] for key in keys], dtype=np.int64).reshape(-1, len(CELL_COLUMNS))
+        return dict({column: matrix[:, i] for i, column in enumerate(CELL_COLUMNS)},
+                    project=np.array([key[0] for key in keys], dtype=np.int64),
+                    day=np.array([key[1] for key in keys], dtype=np.int64),
+                    projects=list(self.projects),
+                    codes=dict(self._project_codes))
+
+    def _file(self, name):
+        return os.path.join(self.path, f'{name}.npz')
+
+    def _save_npz(self, name, **arrays):
+        tmp_path = os.path.join(self.path, f'.{name}.{os.getpid()}.tmp.npz')
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self._file(name))
+
+    def _load_npz(self, name):
+        try:
+            with np.load(self._file(name)) as data:
+                return {key: data[key] for key in data.files}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from services.cache import TTLCache
+
+# 只有这些参数影响搜索结果，其余参数（如前端附带的字段）不参与缓存键
+CACHE_KEY_PARAMS = {
+    'keywords', 'video_title', 'uploader_nickname', 'uploader_uid', 'commenter_uid',
+    'commenter_nickname', 'project_id', 'time_range', 'sort_by', 'sort_order', 'page', 'page_size'
+}
+
+DEFAULT_PARAMS = {'page': 1, 'page_size': 20, 'sort_by': 'create_time', 'sort_order': 'desc'}
+
+
+class SearchCache:
+    """搜索结果缓存
+
+    缓存键由归一化的搜索参数和用户实际可见的项目范围组成，相同条件的请求共享结果。
+    每个索引有一个版本号，导入或清空数据时递增，旧版本的缓存随之失效：
+      memory: 结果保存在进程内LRU，版本号为 data/search_cache/<索引>.gen 的修改时间，
+              同一台机器上的其他worker和导入进程写入后立即可见
+      redis:  结果和版本号都保存在Redis（REDIS_URL），多台机器共享
+      off:    不缓存
+    """
+
+    def __init__(self, backend=None, maxsize=None, ttl=None, marker_dir='data/search_cache'):
+        self.backend = backend or os.getenv('SEARCH_CACHE_BACKEND', 'memory')
+        self.ttl = ttl or int(os.getenv('SEARCH_CACHE_TTL', 60))
+        self.marker_dir = marker_dir
+        self.local = TTLCache(maxsize=maxsize or int(os.getenv('SEARCH_CACHE_SIZE', 1000)), ttl=self.ttl)
+        self.redis = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        if self.backend == 'redis':
+            self.redis = self._connect_redis()
+            if self.redis is None:
+                self.backend = 'memory'
+
+    def _connect_redis(self):
+        try:
+            import redis
+            client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+                                          socket_timeout=1, socket_connect_timeout=1)
+            client.ping()
+            return client
+        except Exception as e:
+            print(f"⚠️ Redis不可用，搜索缓存改用进程内缓存: {str(e)}")
+            return None
+
+    @property
+    def enabled(self):
+        return self.backend != 'off'
+
+    def make_key(self, search_params, current_user):
+        """由搜索参数和用户项目范围生成摘要；游标分页等不适合缓存的请求返回None"""
+        if not self.enabled or search_params.get('cursor') or search_params.get('pagination') == 'cursor':
+            return None
+
+        params = dict(DEFAULT_PARAMS)
+        for name, value in search_params.items():
+            if name not in CACHE_KEY_PARAMS:
+                continue
+            if isinstance(value, str):
+                value = value.strip()
+            if isinstance(value, dict):
+                value = {k: v for k, v in value.items() if v not in (None, '')}
+            if value in (None, '', {}, []):
+                continue
+            params[name] = value
+
+        # 管理员可见全部项目；普通用户按权限范围区分
+        if current_user.get('role') == 'admin':
+            projects = '*'
+        else:
+            projects = sorted(current_user.get('project_access', []))
+
+        content = json.dumps({'params': params, 'projects': projects}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get(self, index, search_params, current_user):
+        """查询缓存，返回 (缓存键, 结果)；未命中时结果为None，不缓存的请求缓存键为None
+
+        缓存键包含查询时的索引版本号，查询期间数据被导入时结果会写入已失效的旧版本。
+        """
+        key = self.make_key(search_params, current_user)
+        if key is None:
+            return None, None
+        full_key = self._full_key(index, key)
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(full_key)
+                value = json.loads(raw) if raw is not None else None
+            except Exception as e:
+                print(f"⚠️ 读取搜索缓存失败: {str(e)}")
+                value = None
+        else:
+            value = self.local.get(full_key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return full_key, value
+
+    def set(self, full_key, value):
+        if full_key is None:
+            return
+        if self.redis is not None:
+            try:
+                self.redis.setex(full_key, self.ttl, json.dumps(value, ensure_ascii=False))
+            except Exception as e:
+                print(f"⚠️ 写入搜索缓存失败: {str(e)}")
+        else:
+            self.local.set(full_key, value)
+
+    def invalidate(self, *indices):
+        """使指定索引的缓存失效（递增版本号）"""
+        for name in indices:
+            if self.redis is not None:
+                try:
+                    self.redis.incr(f"search_cache:gen:{name}")
+                except Exception as e:
+                    print(f"⚠️ 更新搜索缓存版本失败: {str(e)}")
+            os.makedirs(self.marker_dir, exist_ok=True)
+            marker = self._marker_path(name)
+            with open(marker, 'a'):
+                pass
+            now = time.time_ns()
+            os.utime(marker, ns=(now, now))
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        """命中统计（当前进程）"""
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                'backend': self.backend,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0,
+                'invalidations': self.invalidations
+            }
+        if self.redis is None:
+            stats['size'] = len(self.local)
+            stats['maxsize'] = self.local.maxsize
+        return stats
+
+    def _full_key(self, index, key):
+        return f"search_cache:{index}:{self.generation(index)}:{key}"
+
+    def generation(self, index):
+        """索引的当前版本号，导入、清空或切换别名时变化；其他按数据版本缓存的结果以此为键"""
+        if self.redis is not None:
+            try:
+                return int(self.redis.get(f"search_cache:gen:{index}") or 0)
+            except Exception:
+                pass
+        try:
+            return os.stat(self._marker_path(index)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _marker_path(self, index):
+        return os.path.join(self.marker_dir, f"{index}.gen")
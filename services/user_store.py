@@ -0,0 +1,418 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，只保证进程内互斥
+    fcntl = None
+
+
+class UserStore(ABC):
+    """用户存储接口
+
+    用户以字典表示：id, username, password_hash, role, project_access, version,
+    created_at, updated_at（可选）。修改操作在存储内部完成冲突检查，
+    多个gunicorn worker并发修改时不会互相覆盖。
+    缺少任一方法的实现在创建实例时即抛出TypeError。
+    """
+
+    @abstractmethod
+    def seed(self, users):
+        """存储为空时写入给定用户（保留ID），返回是否写入"""
+
+    @abstractmethod
+    def get(self, user_id):
+        """按ID获取用户，不存在时返回None"""
+
+    @abstractmethod
+    def get_by_username(self, username):
+        """按用户名获取用户，不存在时返回None"""
+
+    @abstractmethod
+    def all(self):
+        """全部用户"""
+
+    @abstractmethod
+    def version(self, user_id):
+        """用户版本号，用户不存在时返回None"""
+
+    @abstractmethod
+    def token_state(self, user_id):
+        """校验令牌声明所需的 (版本号, 创建时间)，用户不存在时返回None"""
+
+    @abstractmethod
+    def create(self, user):
+        """创建用户并分配ID（删除的用户ID不会再分配），用户名已存在时抛出ValueError"""
+
+    @abstractmethod
+    def update(self, user_id, changes):
+        """更新用户字段并递增版本号，返回更新后的用户；用户不存在时返回None"""
+
+    @abstractmethod
+    def delete(self, user_id):
+        """删除用户，不能删除最后一个管理员"""
+
+
+def create_user_store():
+    """按 USER_STORE 创建用户存储（sqlite: data/users.db; json: data/users.json）"""
+    backend = os.getenv('USER_STORE', 'sqlite')
+    if backend == 'json':
+        return JsonUserStore(os.getenv('USERS_FILE', 'data/users.json'))
+    return SqliteUserStore(os.getenv('USERS_DB', 'data/users.db'),
+                           legacy_file=os.getenv('USERS_FILE', 'data/users.json'))
+
+
+class JsonUserStore(UserStore):
+    """JSON文件存储
+
+    进程内缓存全部用户并建立ID和用户名索引，每次查询前检查文件的 (inode, mtime, size)，
+    其他gunicorn worker修改后自动重新加载。
+    修改用户时持有文件锁，先重新读取最新文件，再写入临时文件并原子替换。
+    已分配的最大ID记录在 <用户文件>.seq，删除用户后其ID不会分配给新用户。
+    """
+
+    def __init__(self, users_file='data/users.json'):
+        self.users_file = users_file
+        self._lock = threading.RLock()
+        # (用户列表, ID索引, 用户名索引)，整体替换
+        self._state = ([], {}, {})
+        self._signature = None
+        os.makedirs(os.path.dirname(users_file) or '.', exist_ok=True)
+
+    def seed(self, users):
+        with self._file_lock():
+            if self.load_users():
+                return False
+            self.save_users(users)
+            return True
+
+    def load_users(self):
+        """从文件加载用户数据"""
+        try:
+            with open(self.users_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def save_users(self, users):
+        """原子写入用户数据并更新进程内缓存"""
+        tmp_path = f"{self.users_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(users, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.users_file)
+        with self._lock:
+            self._index(users, self._file_signature())
+
+    def get(self, user_id):
+        user = self._refresh()[1].get(user_id)
+        return _copy(user) if user else None
+
+    def get_by_username(self, username):
+        user = self._refresh()[2].get(username)
+        return _copy(user) if user else None
+
+    def all(self):
+        return [_copy(user) for user in self._refresh()[0]]
+
+    def version(self, user_id):
+        user = self._refresh()[1].get(user_id)
+        return user.get('version', 0) if user else None
+
+    def token_state(self, user_id):
+        user = self._refresh()[1].get(user_id)
+        return (user.get('version', 0), user.get('created_at')) if user else None
+
+    def create(self, user):
+        with self._file_lock():
+            users = self.load_users()
+
+            # 检查用户名是否已存在
+            for other_user in users:
+                if other_user['username'] == user['username']:
+                    raise ValueError('用户名已存在')
+
+            # 生成新的用户ID（与SQLite的AUTOINCREMENT一致，不复用已删除用户的ID）
+            max_id = max([other_user['id'] for other_user in users]) if users else 0
+            new_user = dict(user, id=max(max_id, self._last_id()) + 1)
+            self._save_last_id(new_user['id'])
+            users.append(new_user)
+            self.save_users(users)
+        return _copy(new_user)
+
+    def update(self, user_id, changes):
+        with self._file_lock():
+            users = self.load_users()
+
+            for user in users:
+                if user['id'] == user_id:
+                    # 检查用户名是否与其他用户冲突
+                    if 'username' in changes:
+                        for other_user in users:
+                            if other_user['id'] != user_id and other_user['username'] == changes['username']:
+                                raise ValueError('用户名已存在')
+
+                    user.update(changes)
+                    user['updated_at'] = datetime.now().isoformat()
+                    # 使按旧版本签发的令牌声明失效
+                    user['version'] = user.get('version', 0) + 1
+                    self.save_users(users)
+                    return _copy(user)
+
+        return None
+
+    def delete(self, user_id):
+        with self._file_lock():
+            users = self.load_users()
+
+            for i, user in enumerate(users):
+                if user['id'] == user_id:
+                    if user['role'] == 'admin':
+                        # 检查是否是最后一个管理员
+                        admin_count = sum(1 for u in users if u['role'] == 'admin')
+                        if admin_count <= 1:
+                            raise ValueError('不能删除最后一个管理员')
+
+                    users.pop(i)
+                    self.save_users(users)
+                    return True
+
+        return False
+
+    def _last_id(self):
+        try:
+            with open(f"{self.users_file}.seq", 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _save_last_id(self, user_id):
+        tmp_path = f"{self.users_file}.seq.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(user_id))
+        os.replace(tmp_path, f"{self.users_file}.seq")
+
+    def _refresh(self):
+        """文件变化时重新加载，返回 (用户列表, ID索引, 用户名索引)"""
+        signature = self._file_signature()
+        if signature != self._signature:
+            with self._lock:
+                if signature != self._signature:
+                    self._index(self.load_users(), signature)
+        return self._state
+
+    def _index(self, users, signature):
+        # 先构建完整的新索引再整体替换，并发读取的线程不会看到一半的数据
+        by_id = {user['id']: user for user in users}
+        by_username = {user['username']: user for user in users}
+        self._state = (users, by_id, by_username)
+        self._signature = signature
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.users_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @contextmanager
+    def _file_lock(self):
+        """修改用户文件的互斥锁（进程内 + 跨worker的文件锁）"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.users_file}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SqliteUserStore(UserStore):
+    """SQLite存储
+
+    WAL模式下读写互不阻塞，多个worker各自持有连接；用户名有唯一索引，
+    项目权限保存在 project_access 表，按ID和用户名查询都走索引。
+    首次启动且数据库为空时，自动迁移旧的 users.json。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            version INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS project_access (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            project_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (user_id, project_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_project_access_project ON project_access(project_id);
+    """
+
+    def __init__(self, db_path='data/users.db', legacy_file=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(self.SCHEMA)
+
+        if legacy_file and os.path.exists(legacy_file):
+            legacy_users = JsonUserStore(legacy_file).load_users()
+            if legacy_users and self.seed(legacy_users):
+                print(f"✅ 已从 {legacy_file} 迁移 {len(legacy_users)} 个用户到 {db_path}")
+
+    def seed(self, users):
+        with self._transaction() as connection:
+            if connection.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                return False
+            for user in users:
+                self._insert(connection, user)
+            return True
+
+    def get(self, user_id):
+        row = self._connection().execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        return self._to_user(row) if row else None
+
+    def get_by_username(self, username):
+        row = self._connection().execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        return self._to_user(row) if row else None
+
+    def all(self):
+        connection = self._connection()
+        projects = {}
+        for user_id, project_id in connection.execute(
+                "SELECT user_id, project_id FROM project_access ORDER BY user_id, position"):
+            projects.setdefault(user_id, []).append(project_id)
+        return [self._to_user(row, projects.get(row['id'], []))
+                for row in connection.execute("SELECT * FROM users ORDER BY id")]
+
+    def version(self, user_id):
+        row = self._connection().execute("SELECT version FROM users WHERE id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def token_state(self, user_id):
+        row = self._connection().execute("SELECT version, created_at FROM users WHERE id = ?",
+                                         (user_id,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def create(self, user):
+        try:
+            with self._transaction() as connection:
+                user_id = self._insert(connection, user)
+        except sqlite3.IntegrityError:
+            raise ValueError('用户名已存在')
+        return self.get(user_id)
+
+    def update(self, user_id, changes):
+        columns = {key: value for key, value in changes.items()
+                   if key in ('username', 'password_hash', 'role')}
+        try:
+            with self._transaction() as connection:
+                assignments = ''.join(f"{column} = ?, " for column in columns)
+                cursor = connection.execute(
+                    f"UPDATE users SET {assignments}version = version + 1, updated_at = ? WHERE id = ?",
+                    (*columns.values(), datetime.now().isoformat(), user_id))
+                if cursor.rowcount == 0:
+                    return None
+                if 'project_access' in changes:
+                    connection.execute("DELETE FROM project_access WHERE user_id = ?", (user_id,))
+                    self._insert_projects(connection, user_id, changes['project_access'])
+        except sqlite3.IntegrityError:
+            raise ValueError('用户名已存在')
+        return self.get(user_id)
+
+    def delete(self, user_id):
+        with self._transaction() as connection:
+            row = connection.execute("SELECT role FROM users WHERE id = ?", (user_id,)).fetchone()
+            if row is None:
+                return False
+            if row[0] == 'admin':
+                # 检查是否是最后一个管理员
+                admin_count = connection.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'").fetchone()[0]
+                if admin_count <= 1:
+                    raise ValueError('不能删除最后一个管理员')
+            connection.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            return True
+
+    def _insert(self, connection, user):
+        columns = ['username', 'password_hash', 'role', 'version', 'created_at', 'updated_at']
+        values = [user['username'], user['password_hash'], user.get('role', 'user'),
+                  user.get('version', 0), user.get('created_at'), user.get('updated_at')]
+        if 'id' in user:
+            columns.insert(0, 'id')
+            values.insert(0, user['id'])
+        cursor = connection.execute(
+            f"INSERT INTO users ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+        self._insert_projects(connection, cursor.lastrowid, user.get('project_access', []))
+        return cursor.lastrowid
+
+    def _insert_projects(self, connection, user_id, project_access):
+        # 去重并保留原有顺序
+        project_access = list(dict.fromkeys(project_access or []))
+        connection.executemany(
+            "INSERT INTO project_access (user_id, project_id, position) VALUES (?, ?, ?)",
+            [(user_id, project_id, position) for position, project_id in enumerate(project_access)])
+
+    def _to_user(self, row, project_access=None):
+        if project_access is None:
+            project_access = [project_id for (project_id,) in self._connection().execute(
+                "SELECT project_id FROM project_access WHERE user_id = ? ORDER BY position", (row['id'],))]
+        user = {
+            'id': row['id'],
+            'username': row['username'],
+            'password_hash': row['password_hash'],
+            'role': row['role'],
+            'project_access': project_access,
+            'version': row['version'],
+            'created_at': row['created_at']
+        }
+        if row['updated_at']:
+            user['updated_at'] = row['updated_at']
+        return user
+
+    def _connection(self):
+        # sqlite3连接不能跨线程使用，每个线程一个连接
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE：开始时即获取写锁，检查和修改之间不会被其他worker插入写操作
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        else:
+            connection.execute("COMMIT")
+
+
+def _copy(user):
+    # 调用方可能修改返回的用户，避免污染缓存
+    user = dict(user)
+    user['project_access'] = list(user.get('project_access', []))
+    return user
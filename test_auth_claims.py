@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+令牌声明信任测试
+校验 AUTH_TRUST_CLAIMS 下修改、删除用户后旧令牌不再按声明认证，不依赖Elasticsearch
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import jwt
+
+from services.auth_service import AuthService
+from services.user_store import JsonUserStore
+
+SECRET = 'test-secret-key-for-hs256-signing'
+
+
+def trusting_service(tmp):
+    users_file = os.path.join(tmp, 'users.json')
+    return AuthService(store=JsonUserStore(users_file), trust_claims=True), users_file
+
+
+def login(auth, user_id):
+    claims = auth.token_claims(auth.get_user_by_id(user_id))
+    return jwt.encode(dict(claims, exp=int(time.time()) + 3600), SECRET, algorithm='HS256')
+
+
+def test_unchanged_user_uses_claims():
+    """未修改的用户按令牌声明认证"""
+    with tempfile.TemporaryDirectory() as tmp:
+        auth, _ = trusting_service(tmp)
+        user = auth.create_user({'username': 'alice', 'password': 'x', 'project_access': ['项目A']})
+        current = auth.verify_token(login(auth, user['id']), SECRET)
+        assert current['id'] == user['id'] and current['project_access'] == ['项目A']
+
+
+def test_updated_user_falls_back_to_record():
+    """修改用户后旧令牌按用户记录认证"""
+    with tempfile.TemporaryDirectory() as tmp:
+        auth, _ = trusting_service(tmp)
+        user = auth.create_user({'username': 'alice', 'password': 'x', 'project_access': ['项目A']})
+        token = login(auth, user['id'])
+        auth.update_user(user['id'], {'project_access': ['项目B']})
+        assert auth.verify_token(token, SECRET)['project_access'] == ['项目B']
+
+
+def test_deleted_user_token_rejected():
+    """删除用户后旧令牌失效"""
+    with tempfile.TemporaryDirectory() as tmp:
+        auth, _ = trusting_service(tmp)
+        user = auth.create_user({'username': 'alice', 'password': 'x', 'project_access': ['项目A']})
+        token = login(auth, user['id'])
+        auth.delete_user(user['id'])
+        assert auth.verify_token(token, SECRET) is None
+
+
+def test_reused_id_does_not_trust_old_claims():
+    """删除用户后ID被新用户复用时，旧令牌的声明不被信任"""
+    with tempfile.TemporaryDirectory() as tmp:
+        auth, users_file = trusting_service(tmp)
+        user = auth.create_user({'username': 'alice', 'password': 'x', 'project_access': ['项目A']})
+        token = login(auth, user['id'])
+        auth.delete_user(user['id'])
+        # 旧的JSON存储没有ID序号文件，删除后新用户会复用同一ID
+        os.remove(f'{users_file}.seq')
+        reused = auth.create_user({'username': 'mallory', 'password': 'x', 'project_access': ['项目C']})
+        assert reused['id'] == user['id']
+        current = auth.verify_token(token, SECRET)
+        assert current['username'] == 'mallory' and current['project_access'] == ['项目C']
+
+
+def main():
+    """依次运行全部测试，有失败时返回False"""
+    print("🧪 令牌声明信任测试")
+    failures = 0
+    for test in (test_unchanged_user_uses_claims, test_updated_user_falls_back_to_record,
+                 test_deleted_user_token_rejected, test_reused_id_does_not_trust_old_claims):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError:
+            failures += 1
+            print(f"❌ {test.__doc__}")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
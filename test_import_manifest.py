@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+增量导入清单测试
+校验跳过未变化行、过期行的规则，不依赖Elasticsearch
+"""
+
+import os
+import sys
+import tempfile
+
+from services.import_manifest import ImportManifest
+
+ROWS = {'video_id': ['a', 'b', 'c'], 'title': ['一', '二', '三'], 'last_modify_ts': [100, 100, 100]}
+CHANGED = {'video_id': ['a', 'b', 'c', 'd'], 'title': ['一', '二改', '三改', '四'],
+           'last_modify_ts': [100, 200, 50, 100]}
+
+
+def import_rows(path, source, index, rows, incremental):
+    """按一次导入的流程比较一个数据块，返回 (写入的列, 文件统计, 是否按增量导入)"""
+    manifest = ImportManifest('video', path=path)
+    incremental = manifest.begin(index, incremental=incremental)
+    manifest.start_file(source)
+    written = manifest.select(rows, 'video_id')
+    report = manifest.finish_file()
+    manifest.save()
+    return written, report, incremental
+
+
+def first_import(tmp):
+    source = os.path.join(tmp, 'videos.csv')
+    with open(source, 'w', encoding='utf-8') as f:
+        f.write('video_id\n')
+    path = os.path.join(tmp, 'manifest')
+    written, _, incremental = import_rows(path, source, 'videos_v1', ROWS, incremental=True)
+    return path, source, written, incremental
+
+
+def test_first_import_writes_all_rows():
+    """没有清单时不按增量导入，写入全部行"""
+    with tempfile.TemporaryDirectory() as tmp:
+        _, _, written, incremental = first_import(tmp)
+        assert not incremental
+        assert written['video_id'] == ['a', 'b', 'c']
+
+
+def test_incremental_skips_unchanged_and_stale_rows():
+    """增量导入只写入已变化和新增的行，时间戳早于已写入版本的行计为过期"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path, source, _, _ = first_import(tmp)
+        written, report, incremental = import_rows(path, source, 'videos_v1', CHANGED, incremental=True)
+        assert incremental
+        assert written == {'video_id': ['b', 'd'], 'title': ['二改', '四'], 'last_modify_ts': [200, 100]}
+        assert report['skipped'] == 2 and report['stale'] == 1
+        assert report['watermark'] == 200
+
+
+def test_full_import_writes_all_rows():
+    """非增量模式只记录不跳过"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path, source, _, _ = first_import(tmp)
+        written, report, incremental = import_rows(path, source, 'videos_v1', CHANGED, incremental=False)
+        assert not incremental
+        assert written['video_id'] == ['a', 'b', 'c', 'd']
+        assert report['skipped'] == 0
+
+
+def test_manifest_only_applies_to_its_index():
+    """别名切换到其他版本后从空清单开始"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path, source, _, _ = first_import(tmp)
+        written, _, incremental = import_rows(path, source, 'videos_v2', CHANGED, incremental=True)
+        assert not incremental
+        assert written['video_id'] == ['a', 'b', 'c', 'd']
+
+
+def main():
+    """依次运行全部测试，有失败时返回False"""
+    print("🧪 增量导入清单测试")
+    failures = 0
+    for test in (test_first_import_writes_all_rows, test_incremental_skips_unchanged_and_stale_rows,
+                 test_full_import_writes_all_rows, test_manifest_only_applies_to_its_index):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError:
+            failures += 1
+            print(f"❌ {test.__doc__}")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
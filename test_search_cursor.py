@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+搜索分页参数测试
+校验游标的签名和查询绑定、页码参数的校验，不依赖Elasticsearch
+"""
+
+import os
+import sys
+
+from services.elasticsearch_service import ElasticsearchService, SearchPaginationError
+
+INDEX = 'comments_search'
+QUERY = {'match_all': {}}
+SORT = [{'add_ts': 'desc'}]
+
+
+def rejection(call):
+    """调用抛出 SearchPaginationError 时返回其消息，否则返回None"""
+    try:
+        call()
+    except SearchPaginationError as e:
+        return str(e)
+    return None
+
+
+def signed_cursor(service):
+    state = service._cursor_state(INDEX, QUERY, SORT, {'page_size': 20})
+    state.update(page=1, pit='pit-1', after=[1715000000, 'c1'], total=100)
+    return state, service.encode_cursor(state)
+
+
+def test_signed_cursor_round_trip():
+    """签名正确的游标可以解码"""
+    service = ElasticsearchService()
+    state, cursor = signed_cursor(service)
+    assert service._cursor_state(INDEX, QUERY, SORT, {'cursor': cursor}) == state
+
+
+def test_tampered_cursor_rejected():
+    """篡改状态、修改签名或无法解析的游标被拒绝"""
+    service = ElasticsearchService()
+    state, cursor = signed_cursor(service)
+    payload, signature = cursor.rsplit('.', 1)
+    forged_payload = service.encode_cursor(dict(state, page=50)).rsplit('.', 1)[0]
+    for token in (f'{forged_payload}.{signature}', f"{payload}.{'0' * len(signature)}", 'not-a-cursor'):
+        assert rejection(lambda: service._cursor_state(INDEX, QUERY, SORT, {'cursor': token})) == '无效的游标'
+
+
+def test_cursor_signed_with_other_key_rejected():
+    """其他密钥签名的游标被拒绝"""
+    service = ElasticsearchService()
+    state, _ = signed_cursor(service)
+    secret = os.environ.get('SECRET_KEY')
+    os.environ['SECRET_KEY'] = 'another-secret-key'
+    try:
+        token = service.encode_cursor(state)
+    finally:
+        if secret is None:
+            os.environ.pop('SECRET_KEY')
+        else:
+            os.environ['SECRET_KEY'] = secret
+    assert rejection(lambda: service._cursor_state(INDEX, QUERY, SORT, {'cursor': token})) == '无效的游标'
+
+
+def test_cursor_bound_to_query():
+    """游标只能用于生成它的查询"""
+    service = ElasticsearchService()
+    _, cursor = signed_cursor(service)
+    other_query = {'term': {'project_id': '巨书'}}
+    assert rejection(lambda: service._cursor_state(INDEX, other_query, SORT, {'cursor': cursor})) \
+        == '游标与当前查询条件不匹配，请重新查询'
+
+
+def test_invalid_page_parameters_rejected():
+    """页码和每页条数必须是正整数，数字字符串按整数处理"""
+    service = ElasticsearchService()
+    for params in ({'page': 0}, {'page': -3}, {'page': 'x'}, {'page_size': 0}):
+        assert rejection(lambda: service._page_request(QUERY, SORT, {}, params)) is not None
+    assert rejection(lambda: service._cursor_state(INDEX, QUERY, SORT, {'page_size': 0})) is not None
+    body, page, page_size = service._page_request(QUERY, SORT, {}, {'page': '2', 'page_size': '5'})
+    assert (body['from'], page, page_size) == (5, 2, 5)
+
+
+def main():
+    """依次运行全部测试，有失败时返回False"""
+    print("🧪 搜索分页参数测试")
+    failures = 0
+    for test in (test_signed_cursor_round_trip, test_tampered_cursor_rejected,
+                 test_cursor_signed_with_other_key_rejected, test_cursor_bound_to_query,
+                 test_invalid_page_parameters_rejected):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError:
+            failures += 1
+            print(f"❌ {test.__doc__}")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)